@@ -13,5 +13,15 @@ setup(
     author='Tung D. Le',
     author_email='tung@jp.ibm.com',
     packages=find_packages(),
-    install_requires=install_requires
+    install_requires=install_requires,
+    extras_require={
+        'sparse': ['scipy >= 0.19'],
+    },
+    entry_points={
+        'console_scripts': [
+            'lms = tensorflow_large_model_support.cli:main',
+            'lms-sweep = tensorflow_large_model_support.tuning:main',
+            'lms-harness = tensorflow_large_model_support.harness:main',
+        ],
+    }
 )
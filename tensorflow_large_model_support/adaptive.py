@@ -0,0 +1,170 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Adaptive re-planning
+
+Measure how long consuming operations wait on swap-ins during training, and
+recommend a prefetch distance for each swapped tensor to be used the next
+time LMS edits the graph.
+"""
+import re
+
+# Send/Recv nodes added by TensorFlow for a cross-device edge from op `x`
+# are named `x/_<n>`
+_SEND_RECV_SUFFIX = re.compile(r'/_\d+$')
+
+
+class SwapProfiler(object):
+    """SwapProfiler class collects step stats of swap-in operations and
+    their consuming operations.
+
+    A consuming operation waits on a swap-in when the swap-in finishes after
+    all the other inputs of the consuming operation are ready. Tensors whose
+    consuming operations wait get a larger prefetch distance, so that their
+    swap-ins are triggered earlier.
+    """
+    def __init__(self, swap_plan, graph, lb=1, ub=10000,
+                 wait_threshold_micros=0, min_wait_ratio=0.5):
+        """Create a SwapProfiler object.
+
+        Args:
+          swap_plan: the `SwapPlan` of the LMS run that edited `graph`.
+          graph: the `tf.Graph` edited by LMS.
+          lb: the default prefetch distance used by LMS.
+          ub: the maximum prefetch distance to recommend.
+          wait_threshold_micros: waits shorter than this are ignored.
+            Default `0`.
+          min_wait_ratio: the fraction of sampled steps in which a consuming
+            operation must wait before the prefetch distance of its tensor is
+            increased. Default `0.5`.
+        """
+        self._lb = lb
+        self._ub = ub
+        self._wait_threshold = wait_threshold_micros
+        self._min_wait_ratio = min_wait_ratio
+        self._n_steps = 0
+
+        # swap-in op name -> (tensor name, current distance, consumers)
+        self._swapins = {}
+        # consumer op name -> names of ops producing its other inputs
+        self._ready_ops = {}
+        # (swap-in op name, consumer op name) -> list of waits in micros
+        self._waits = {}
+        # tensor name -> the largest prefetch distance its swap-ins can use
+        self._max_distances = {}
+
+        for swap in swap_plan.swaps:
+            for swapin in swap['swapins']:
+                name = swapin['swapin_op']
+                distance = lb
+                if swapin['ctrld_order'] >= 0 and swapin['orders']:
+                    distance = min(swapin['orders']) - swapin['ctrld_order']
+                self._swapins[name] = (swap['tensor'], distance,
+                                       swapin['dest_ops'])
+                if swap['order'] >= 0 and swapin['orders']:
+                    # LMS clamps larger distances to the orders between
+                    # the swapped tensor and its consumer
+                    self._max_distances[swap['tensor']] = max(
+                        self._max_distances.get(swap['tensor'], 1),
+                        min(swapin['orders']) - swap['order'] - 1)
+                for dest in swapin['dest_ops']:
+                    self._ready_ops[dest] = self._get_ready_ops(graph, dest,
+                                                                name)
+                    self._waits[(name, dest)] = []
+
+    def _get_ready_ops(self, graph, op_name, swapin_name):
+        """Return the names of ops producing the inputs of `op_name`, except
+        the swap-in op `swapin_name`.
+        """
+        op = graph.get_operation_by_name(op_name)
+        ret = {t.op.name for t in op.inputs}
+        ret |= {ctrl_op.name for ctrl_op in op.control_inputs}
+        ret.discard(swapin_name)
+        return ret
+
+    def add_step_stats(self, step_stats):
+        """Add the step stats of one sampled step.
+
+        Args:
+          step_stats: a `StepStats` protobuf, e.g. `run_metadata.step_stats`.
+        """
+        starts = {}
+        ends = {}
+        for dev_stats in step_stats.dev_stats:
+            for node_stats in dev_stats.node_stats:
+                name = _SEND_RECV_SUFFIX.sub(
+                    '', node_stats.node_name.split(':')[0])
+                start = node_stats.all_start_micros
+                end = start + node_stats.all_end_rel_micros
+                starts[name] = min(start, starts.get(name, start))
+                ends[name] = max(end, ends.get(name, end))
+
+        found = False
+        for key, waits in self._waits.items():
+            swapin_name, dest = key
+            if swapin_name not in ends or dest not in starts:
+                continue
+            ready_ends = [ends[op] for op in self._ready_ops[dest]
+                          if op in ends]
+            if not ready_ends:
+                continue
+            found = True
+            waits.append(max(0, ends[swapin_name] - max(ready_ends)))
+        if found:
+            self._n_steps += 1
+
+    def get_waits(self):
+        """Return a dictionary of (swap-in op name, consuming op name) to
+        the average wait in microseconds.
+        """
+        return {key: float(sum(waits)) / len(waits)
+                for key, waits in self._waits.items() if waits}
+
+    def recommend(self, prefetch_distances=None):
+        """Recommend prefetch distances for the swapped tensors.
+
+        Args:
+          prefetch_distances: a dictionary of tensor names to the prefetch
+            distances used so far. Default `None`.
+
+        Return:
+          A dictionary of tensor names to prefetch distances, containing
+          `prefetch_distances` updated with the tensors whose consuming
+          operations waited on their swap-ins. Distances are doubled, up to
+          `ub` and to the largest distance the swap-ins of a tensor can use,
+          i.e. the orders between the tensor and its consumer.
+        """
+        ret = dict(prefetch_distances or {})
+        for swapin_name, (tensor, distance, dests) in self._swapins.items():
+            n_waits = 0
+            n_samples = 0
+            for dest in dests:
+                waits = self._waits[(swapin_name, dest)]
+                n_samples += len(waits)
+                n_waits += len([w for w in waits
+                                if w > self._wait_threshold])
+            if not n_samples:
+                continue
+            if float(n_waits) / n_samples >= self._min_wait_ratio:
+                distance = max(ret.get(tensor, distance), distance)
+                ret[tensor] = min(max(distance * 2, distance + 1), self._ub,
+                                  self._max_distances.get(tensor, self._ub))
+        return ret
+
+    @property
+    def n_steps(self):
+        """The number of sampled steps with swap-in stats.
+        """
+        return self._n_steps
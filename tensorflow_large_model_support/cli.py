@@ -0,0 +1,281 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Command-line analyzer
+
+Run the LMS analysis on a saved MetaGraphDef or GraphDef without running the
+training code, print the swap plan, the time spent in each phase and the
+estimated memory, and optionally write the rewritten graph so training jobs
+can load it and skip the analysis at start-up.
+
+    lms model.meta --optimizer-scopes optimizer --lb 3 --output lms.meta
+"""
+from __future__ import print_function
+
+import argparse
+import inspect
+import json
+import os
+import sys
+import time
+
+import tensorflow as tf
+from google.protobuf import text_format
+
+from tensorflow_large_model_support import memory
+from tensorflow_large_model_support.lms import LMS
+
+# LMS parameters whose default value is `None`, and their types
+_NONE_DEFAULT_TYPES = {'starting_scope': str,
+                       'starting_op_names': list,
+                       'incl_op_names': list,
+                       'fuse_window': int,
+                       'prefetch_distances': dict,
+                       'host_mem_limit_mb': int}
+
+
+# LMS parameters that cannot be given on the command line
+_SKIPPED_ARGS = {'graph', 'benefit_fn', 'swap_policy'}
+
+
+def _str_to_bool(value):
+    if value.lower() in ('true', 'yes', '1'):
+        return True
+    if value.lower() in ('false', 'no', '0'):
+        return False
+    raise argparse.ArgumentTypeError('a boolean is expected: {}'.format(value))
+
+
+def _get_lms_defaults():
+    """Return a list of (name, default value) of the keyword arguments of
+    `LMS`.
+    """
+    if hasattr(inspect, 'getfullargspec'):
+        spec = inspect.getfullargspec(LMS.__init__)
+    else:
+        spec = inspect.getargspec(LMS.__init__)
+    names = spec.args[-len(spec.defaults):]
+    return [(name, default) for name, default in zip(names, spec.defaults)
+            if name not in _SKIPPED_ARGS]
+
+
+def _add_lms_argument(parser, name, default):
+    """Add an option for the LMS parameter `name` to `parser`.
+    """
+    flag = '--' + name.replace('_', '-')
+    value_type = _NONE_DEFAULT_TYPES.get(name, type(default))
+    help_text = 'LMS parameter {} (default: {})'.format(name, default)
+    if value_type is bool:
+        parser.add_argument(flag, dest=name, type=_str_to_bool,
+                            default=default, metavar='BOOL', help=help_text)
+    elif value_type in (set, list):
+        parser.add_argument(flag, dest=name, nargs='*', default=default,
+                            help=help_text)
+    elif value_type is dict:
+        parser.add_argument(flag, dest=name, type=json.loads,
+                            default=default, metavar='JSON', help=help_text)
+    else:
+        parser.add_argument(flag, dest=name, type=value_type,
+                            default=default, help=help_text)
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(
+        prog='lms',
+        description='Run the LMS analysis on a saved graph and print the '
+                    'swap plan, the timing breakdown and the estimated '
+                    'memory.')
+    parser.add_argument('graph', help='a MetaGraphDef (e.g. model.meta) or '
+                        'a GraphDef file, in binary or text (.pbtxt) format')
+    parser.add_argument('--optimizer-scopes', nargs='*', default=[],
+                        help='scopes of the optimizers/solvers')
+    parser.add_argument('--input-format', choices=['auto', 'meta', 'graph'],
+                        default='auto', help='the format of the input file')
+    parser.add_argument('--clear-devices', action='store_true',
+                        help='clear the devices of the loaded graph')
+    parser.add_argument('--output', help='write the rewritten graph to this '
+                        'file, in the format of the input file')
+    parser.add_argument('--plan', help='write the swap plan as JSON to this '
+                        'file')
+    parser.add_argument('--json', action='store_true',
+                        help='print the summary as JSON')
+    lms_group = parser.add_argument_group('LMS parameters')
+    for name, default in _get_lms_defaults():
+        _add_lms_argument(lms_group, name, default)
+    return parser
+
+
+def _is_text(path):
+    return path.endswith('.pbtxt') or path.endswith('.txt')
+
+
+def _parse(message, data, text):
+    if text:
+        text_format.Merge(data, message)
+    else:
+        message.ParseFromString(data)
+    return message
+
+
+def load_graph(path, input_format='auto', clear_devices=False):
+    """Load a MetaGraphDef or a GraphDef into a new graph.
+
+    Args:
+      path: a file path.
+      input_format: `meta`, `graph` or `auto`. `auto` reads a MetaGraphDef
+        if the file name contains `.meta` or the file parses as a
+        MetaGraphDef with nodes, and a GraphDef otherwise. Default `auto`.
+      clear_devices: If True, the devices of the operations are cleared.
+        Default `False`.
+
+    Return:
+      A tuple of the `tf.Graph` and True if a MetaGraphDef was loaded.
+    """
+    text = _is_text(path)
+    with open(path, 'r' if text else 'rb') as f:
+        data = f.read()
+
+    meta_graph_def = None
+    if input_format == 'meta' or (input_format == 'auto' and
+                                  '.meta' in os.path.basename(path)):
+        meta_graph_def = _parse(tf.MetaGraphDef(), data, text)
+    elif input_format == 'auto':
+        try:
+            meta_graph_def = _parse(tf.MetaGraphDef(), data, text)
+        except Exception:
+            meta_graph_def = None
+        if meta_graph_def is not None and not meta_graph_def.graph_def.node:
+            meta_graph_def = None
+
+    graph = tf.Graph()
+    with graph.as_default():
+        if meta_graph_def is not None:
+            tf.train.import_meta_graph(meta_graph_def,
+                                       clear_devices=clear_devices)
+        else:
+            graph_def = _parse(tf.GraphDef(), data, text)
+            if clear_devices:
+                for node in graph_def.node:
+                    node.device = ''
+            tf.import_graph_def(graph_def, name='')
+    return graph, meta_graph_def is not None
+
+
+def write_graph(graph, path, as_meta_graph):
+    """Write a graph as a MetaGraphDef or a GraphDef, in text format if
+    `path` ends with `.pbtxt`.
+    """
+    text = _is_text(path)
+    if as_meta_graph:
+        tf.train.export_meta_graph(filename=path, graph=graph, as_text=text)
+    else:
+        tf.train.write_graph(graph.as_graph_def(), os.path.dirname(path) or
+                             '.', os.path.basename(path), as_text=text)
+
+
+def summarize(lms_obj, load_ms=0, unknown_dim_size=1):
+    """Return a summary of an LMS run as a dictionary.
+
+    Args:
+      lms_obj: an `LMS` object that has been run.
+      load_ms: the time spent loading the graph in milliseconds. Default `0`.
+      unknown_dim_size: the size used for dimensions that are not known
+        statically. Default `1`.
+    """
+    timings = [('load', load_ms)] + list(lms_obj.timings.items())
+    summary = {'plan': lms_obj.plan.to_dict(),
+               'timings_ms': timings,
+               'total_ms': sum(ms for _, ms in timings),
+               'host_memory': lms_obj.host_memory}
+    if lms_obj.topo_sort is not None:
+        summary['device_memory'] = memory.estimate_device_memory(
+            lms_obj.topo_sort, lms_obj.plan, unknown_dim_size)
+    return summary
+
+
+def _mb(nbytes):
+    return '{:.1f} MB'.format(nbytes / float(1 << 20))
+
+
+def format_summary(summary):
+    """Format a summary made by `summarize` as text.
+    """
+    plan_dict = summary['plan']
+    lines = ['Swap plan: {} tensors swapped, {} orders, backward phase '
+             'starts at order {}'.format(len(plan_dict['swaps']),
+                                         plan_dict['size'],
+                                         plan_dict['bw_starting_order'])]
+    for swap in plan_dict['swaps']:
+        swapins = ', '.join('{}->{}'.format(swapin['ctrld_order'],
+                                            min(swapin['orders'] or [-1]))
+                            for swapin in swap['swapins'])
+        lines.append('  {} ({}) out at {}, in at {}'.format(
+            swap['tensor'], _mb(swap['nbytes']), swap['order'], swapins))
+
+    lines.append('Timing breakdown:')
+    for phase, ms in summary['timings_ms']:
+        lines.append('  {:<24}{:>10.1f} ms'.format(phase, ms))
+    lines.append('  {:<24}{:>10.1f} ms'.format('total', summary['total_ms']))
+
+    lines.append('Estimated memory (static):')
+    device_memory = summary.get('device_memory')
+    if device_memory:
+        lines.append('  device peak without LMS: {}'.format(
+            _mb(device_memory['peak_bytes_without_lms'])))
+        lines.append('  device peak with LMS: {}'.format(
+            _mb(device_memory['peak_bytes'])))
+    host_memory = summary.get('host_memory')
+    if host_memory:
+        lines.append('  host peak: {}'.format(_mb(host_memory['peak_bytes'])))
+        lines.append('  recommended TF_CUDA_HOST_MEM_LIMIT_IN_MB: {}'.format(
+            host_memory['recommended_limit_mb']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """Entry point of the `lms` command.
+    """
+    args = _build_parser().parse_args(argv)
+    lms_kwargs = {name: getattr(args, name)
+                  for name, _ in _get_lms_defaults()}
+    for name, default in _get_lms_defaults():
+        if isinstance(default, set):
+            lms_kwargs[name] = set(lms_kwargs[name])
+
+    start_time = time.time()
+    graph, is_meta_graph = load_graph(args.graph, args.input_format,
+                                      args.clear_devices)
+    load_ms = (time.time() - start_time) * 1000
+
+    lms_obj = LMS(set(args.optimizer_scopes), graph=graph, **lms_kwargs)
+    with graph.as_default():
+        lms_obj.run()
+
+    summary = summarize(lms_obj, load_ms, args.batch_size)
+    if args.json:
+        print(json.dumps(summary, sort_keys=True))
+    else:
+        print(format_summary(summary))
+
+    if args.plan:
+        with open(args.plan, 'w') as f:
+            f.write(lms_obj.plan.to_json())
+    if args.output:
+        write_graph(graph, args.output, is_meta_graph)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
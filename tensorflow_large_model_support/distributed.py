@@ -0,0 +1,206 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Distributed planning
+
+In data-parallel jobs every rank edits an identical graph. Rank 0 analyzes
+the graph and sends the swap plan to the other ranks through a transport, and
+the other ranks only apply the plan.
+"""
+import json
+import os
+import time
+
+import six
+
+from tensorflow_large_model_support import plan
+
+# Environment variables holding the rank of the process, set by Horovod,
+# Open MPI (used by DDL), MPICH, Slurm and torch-style launchers
+RANK_ENV_VARS = ('HOROVOD_RANK', 'OMPI_COMM_WORLD_RANK', 'PMI_RANK',
+                 'SLURM_PROCID', 'RANK')
+
+# Environment variables holding the ID of the job, set by Slurm, LSF and PBS
+JOB_ID_ENV_VARS = ('SLURM_JOB_ID', 'LSB_JOBID', 'PBS_JOBID')
+
+
+def get_rank():
+    """Return the rank of this process, read from the environment, or `0` if
+    it is not set.
+    """
+    for name in RANK_ENV_VARS:
+        value = os.environ.get(name)
+        if value:
+            return int(value)
+    return 0
+
+
+def get_job_id():
+    """Return the ID of the job, read from the environment, or an empty
+    string if it is not set.
+    """
+    for name in JOB_ID_ENV_VARS:
+        value = os.environ.get(name)
+        if value:
+            return value
+    return ''
+
+
+class FileTransport(object):
+    """FileTransport class shares a swap plan through a file on a filesystem
+    visible to every rank.
+
+    Rank 0 writes the plan to a temporary file and renames it, so the other
+    ranks never read a partially written plan. The plan is stored with the
+    key of the graph and of the LMS parameters and with the ID of the job, so
+    a plan left by a previous job is not used.
+    """
+    def __init__(self, path, timeout=600, poll_interval=1.0, job_id=None):
+        """Create a FileTransport object.
+
+        Args:
+          path: the path of the plan file.
+          timeout: the number of seconds the other ranks wait for the plan.
+            Default `600`.
+          poll_interval: the number of seconds between two checks of the
+            plan file. Default `1.0`.
+          job_id: a string identifying the job, the same on every rank.
+            Default `None` (read from the environment, see `get_job_id`).
+        """
+        self._path = path
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._job_id = get_job_id() if job_id is None else job_id
+
+    def clear(self):
+        """Remove the plan file, e.g. one left by a previous job.
+        """
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+    def broadcast(self, key, swap_plan=None):
+        """Send `swap_plan` from rank 0, or receive it on the other ranks.
+
+        Args:
+          key: a string identifying the graph and the LMS parameters.
+          swap_plan: a `SwapPlan` on rank 0, `None` on the other ranks.
+
+        Return:
+          The `SwapPlan`.
+        """
+        if swap_plan is not None:
+            tmp_path = '{}.{}.tmp'.format(self._path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump({'key': key, 'job_id': self._job_id,
+                           'plan': swap_plan.to_dict()}, f)
+            os.rename(tmp_path, self._path)
+            return swap_plan
+
+        deadline = time.time() + self._timeout
+        while True:
+            if os.path.exists(self._path):
+                with open(self._path) as f:
+                    content = json.load(f)
+                if (content['key'] == key and
+                        content.get('job_id', '') == self._job_id):
+                    return plan.SwapPlan.from_dict(content['plan'])
+            if time.time() > deadline:
+                raise ValueError('The swap plan was not received from rank 0 '
+                                 'in {} seconds: {}'.format(self._timeout,
+                                                            self._path))
+            time.sleep(self._poll_interval)
+
+
+class CallableTransport(object):
+    """CallableTransport class shares a swap plan with a broadcast function,
+    e.g. `horovod.tensorflow.broadcast_object`.
+    """
+    def __init__(self, broadcast_fn):
+        """Create a CallableTransport object.
+
+        Args:
+          broadcast_fn: a function taking a value and returning the value
+            given by rank 0. Rank 0 passes the plan as a JSON string, the
+            other ranks pass `None`.
+        """
+        self._broadcast_fn = broadcast_fn
+
+    def broadcast(self, key, swap_plan=None):
+        """Send `swap_plan` from rank 0, or receive it on the other ranks.
+
+        Args:
+          key: a string identifying the graph and the LMS parameters.
+          swap_plan: a `SwapPlan` on rank 0, `None` on the other ranks.
+
+        Return:
+          The `SwapPlan`.
+        """
+        value = None
+        if swap_plan is not None:
+            value = json.dumps({'key': key, 'plan': swap_plan.to_dict()})
+        content = json.loads(self._broadcast_fn(value))
+        if content['key'] != key:
+            raise ValueError('The swap plan of rank 0 was made for a '
+                             'different graph or different parameters.')
+        if swap_plan is not None:
+            return swap_plan
+        return plan.SwapPlan.from_dict(content['plan'])
+
+
+def get_transport(transport):
+    """Return a transport for a file path, a broadcast function or a
+    transport object.
+    """
+    if isinstance(transport, six.string_types):
+        return FileTransport(transport)
+    if not hasattr(transport, 'broadcast') and callable(transport):
+        return CallableTransport(transport)
+    return transport
+
+
+def run_lms(lms_obj, transport, graph=None, rank=None, lms_args=None):
+    """Edit a graph with the plan of rank 0.
+
+    Rank 0 runs `lms_obj` on the graph and broadcasts its plan. The other
+    ranks apply the plan received from rank 0 without analyzing the graph.
+
+    Args:
+      lms_obj: an `LMS` object.
+      transport: a `FileTransport`, a `CallableTransport`, a file path or a
+        broadcast function.
+      graph: the graph to modify. Default `None` (the graph given to
+        `lms_obj`).
+      rank: the rank of this process. Default `None` (read from the
+        environment).
+      lms_args: a dictionary of the parameters of `lms_obj` other than the
+        optimizer scopes. A plan is only applied if it was made with the
+        same parameters. Default `None` (no parameters).
+    """
+    graph = graph or lms_obj._graph
+    if graph is None:
+        raise ValueError('The dataflow graph is required but has not been'
+                         ' provided.')
+    transport = get_transport(transport)
+    if rank is None:
+        rank = get_rank()
+    key = plan.make_cache_key(graph, lms_obj._optimizer_scopes,
+                              lms_args or {})
+    if rank == 0:
+        if hasattr(transport, 'clear'):
+            transport.clear()
+        lms_obj.run(graph)
+        transport.broadcast(key, lms_obj.plan)
+    else:
+        lms_obj.apply_plan(transport.broadcast(key), graph)
@@ -0,0 +1,158 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Control flow frames
+
+Find the `tf.while_loop` frame and the `tf.cond` branches of operations from
+the Enter/Exit/Switch/Merge structure of the graph.
+"""
+import tensorflow as tf
+
+ENTER_TYPES = {'Enter', 'RefEnter'}
+EXIT_TYPES = {'Exit', 'RefExit'}
+SWITCH_TYPES = {'Switch', 'RefSwitch'}
+MERGE_TYPES = {'Merge', 'RefMerge'}
+NEXT_ITERATION_TYPES = {'NextIteration', 'RefNextIteration'}
+
+# Operations with these types are not used as control dependency ops
+CONTROL_FLOW_TYPES = (ENTER_TYPES | EXIT_TYPES | SWITCH_TYPES | MERGE_TYPES |
+                      NEXT_ITERATION_TYPES | {'LoopCond'})
+
+
+def is_back_edge(src_op, dest_op):
+    """Check whether the edge from `src_op` to `dest_op` is the back edge
+    of a while loop, from a NextIteration op to a Merge op.
+
+    Args:
+      src_op: a `tf.Operation`.
+      dest_op: a `tf.Operation`.
+    """
+    return (src_op.type in NEXT_ITERATION_TYPES and
+            dest_op.type in MERGE_TYPES)
+
+
+def _is_loop_switch(op):
+    """Check whether a Switch op is the condition of a while loop.
+    """
+    if not op.inputs:
+        return False
+    merge_op = op.inputs[0].op
+    return (merge_op.type in MERGE_TYPES and
+            any(t.op.type in NEXT_ITERATION_TYPES for t in merge_op.inputs))
+
+
+class FrameInfo(object):
+    """FrameInfo class finds the control flow frame and the cond context of
+    operations.
+
+    The frame of an operation is a tuple of the names of the while loop
+    frames it runs in, from the outermost. The cond context of an operation
+    is a tuple of (Switch op name, branch index) pairs of the `tf.cond`
+    branches it runs in. An operation does not run when one of its branches
+    is not taken.
+
+    Operations are analyzed on demand from their inputs, so operations added
+    to the graph after the object is created are supported.
+    """
+    def __init__(self):
+        """Create a FrameInfo object.
+        """
+        # op -> (frame, cond context)
+        self._info = {}
+
+    def _get_inputs(self, op):
+        """Return the ops whose outputs determine the frame and the context
+        of `op`, with the tensor output index, ignoring back edges.
+        """
+        ret = [(t.op, t.value_index) for t in op.inputs
+               if not is_back_edge(t.op, op)]
+        ret += [(ctrl_op, -1) for ctrl_op in op.control_inputs]
+        return ret
+
+    def _analyze(self, op):
+        """Compute the frame and the context of `op` and of its inputs.
+        """
+        stack = [op]
+        while stack:
+            cur_op = stack[-1]
+            if cur_op in self._info:
+                stack.pop()
+                continue
+            pending = [in_op for in_op, _ in self._get_inputs(cur_op)
+                       if in_op not in self._info]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            self._info[cur_op] = self._compute(cur_op)
+
+    def _compute(self, op):
+        """Compute the frame and the context of `op` from its inputs.
+        """
+        frame = ()
+        ctx = ()
+        for in_op, idx in self._get_inputs(op):
+            in_frame, in_ctx = self._info[in_op]
+            if (in_op.type in SWITCH_TYPES and idx >= 0 and
+                    not _is_loop_switch(in_op)):
+                in_ctx = in_ctx + ((in_op.name, idx),)
+            if len(in_frame) > len(frame):
+                frame = in_frame
+            if len(in_ctx) > len(ctx):
+                ctx = in_ctx
+
+        if op.type in ENTER_TYPES:
+            frame = frame + (tf.compat.as_str(op.get_attr('frame_name')),)
+        elif op.type in EXIT_TYPES:
+            frame = frame[:-1]
+        elif (op.type in MERGE_TYPES and ctx and
+                not any(t.op.type in NEXT_ITERATION_TYPES
+                        for t in op.inputs)):
+            # the Merge op of a tf.cond runs whichever branch is taken
+            ctx = ctx[:-1]
+        return (frame, ctx)
+
+    def get_frame(self, op):
+        """Return the frame of `op`, a tuple of frame names.
+        """
+        self._analyze(op)
+        return self._info[op][0]
+
+    def get_context(self, op):
+        """Return the cond context of `op`, a tuple of (Switch op name,
+        branch index).
+        """
+        self._analyze(op)
+        return self._info[op][1]
+
+    def is_valid_ctrld_op(self, ctrld_op, op, frame_op=None):
+        """Check whether `ctrld_op` can be a control dependency op of an
+        operation needed by `op`.
+
+        `ctrld_op` must be in the same frame as `frame_op` and must run
+        whenever `op` runs, i.e. its cond context must be a prefix of the
+        cond context of `op`.
+
+        Args:
+          ctrld_op: a `tf.Operation`.
+          op: a `tf.Operation`.
+          frame_op: a `tf.Operation`. Default `None` (`op`).
+        """
+        if ctrld_op.type in CONTROL_FLOW_TYPES:
+            return False
+        if self.get_frame(ctrld_op) != self.get_frame(frame_op or op):
+            return False
+        ctrld_ctx = self.get_context(ctrld_op)
+        return ctrld_ctx == self.get_context(op)[:len(ctrld_ctx)]
@@ -0,0 +1,343 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Sparse graph analysis
+
+Index the operations of a graph and keep their data and control dependencies
+as sparse adjacency matrices, so that graph walks and the levels of a
+topological order are computed with array operations on whole frontiers
+instead of one operation at a time. Requires SciPy.
+"""
+import numpy as np
+import toposort
+
+from tensorflow_large_model_support import frames
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+def is_available():
+    """Check whether SciPy is installed.
+    """
+    return sparse is not None
+
+
+def _gather(csr, rows):
+    """Return the column indices of the nonzero entries of `rows` in a CSR
+    matrix, with repetitions.
+    """
+    starts = csr.indptr[rows]
+    lens = csr.indptr[rows + 1] - starts
+    total = lens.sum()
+    if not total:
+        return np.empty(0, dtype=csr.indices.dtype)
+    offsets = np.repeat(starts - np.cumsum(lens) + lens, lens)
+    return csr.indices[offsets + np.arange(total)]
+
+
+def _walk(csr, seeds, mask=None):
+    """Return a boolean array of the nodes reachable from `seeds` in a CSR
+    adjacency matrix, including the seeds.
+
+    Args:
+      csr: a `scipy.sparse.csr_matrix`.
+      seeds: an array of node indices.
+      mask: a boolean array of the nodes the walk may visit. Default `None`
+        (all nodes).
+    """
+    visited = np.zeros(csr.shape[0], dtype=bool)
+    frontier = np.unique(seeds)
+    if mask is not None:
+        frontier = frontier[mask[frontier]]
+    visited[frontier] = True
+    while frontier.size:
+        frontier = np.unique(_gather(csr, frontier))
+        frontier = frontier[~visited[frontier]]
+        if mask is not None:
+            frontier = frontier[mask[frontier]]
+        visited[frontier] = True
+    return visited
+
+
+# The number of seeds walked at once by `GraphMatrix.get_forward_coverage`
+COVERAGE_BATCH_SIZE = 64
+
+
+class GraphMatrix(object):
+    """GraphMatrix class holds the dependencies among the operations of a
+    graph as sparse adjacency matrices.
+
+    The matrices are built once from the operations in the graph when the
+    object is created. Operations added to the graph afterwards are not
+    seen, so create a new object after editing the graph.
+    """
+    def __init__(self, graph):
+        """Create a GraphMatrix object.
+
+        Args:
+          graph: a `tf.Graph`.
+        """
+        if not is_available():
+            raise ValueError('SciPy is required for the sparse graph '
+                             'analysis.')
+        self._ops = graph.get_operations()
+        self._index = {op: i for i, op in enumerate(self._ops)}
+
+        srcs = []
+        dests = []
+        back_edge = []
+        ctrl_srcs = []
+        ctrl_dests = []
+        for op in self._ops:
+            i = self._index[op]
+            for t in op.inputs:
+                srcs.append(self._index[t.op])
+                dests.append(i)
+                back_edge.append(frames.is_back_edge(t.op, op))
+            for ctrl_op in op.control_inputs:
+                ctrl_srcs.append(self._index[ctrl_op])
+                ctrl_dests.append(i)
+        self._srcs = np.array(srcs, dtype=np.int64)
+        self._dests = np.array(dests, dtype=np.int64)
+        self._back_edge = np.array(back_edge, dtype=bool)
+        self._ctrl_srcs = np.array(ctrl_srcs, dtype=np.int64)
+        self._ctrl_dests = np.array(ctrl_dests, dtype=np.int64)
+
+        # producer -> consumer
+        self._consumers = self._make_csr(self._srcs, self._dests)
+        # consumer -> producer
+        self._producers = self._consumers.transpose().tocsr()
+
+    @property
+    def size(self):
+        """The number of operations.
+        """
+        return len(self._ops)
+
+    def _make_csr(self, rows, cols):
+        """Return a CSR adjacency matrix with an entry for each (row, col)
+        pair.
+        """
+        n = self.size
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(n, n))
+
+    def _to_indices(self, ops):
+        """Return the indices of `ops`, ignoring ops not in the matrix.
+        """
+        return np.array([self._index[op] for op in ops if op in self._index],
+                        dtype=np.int64)
+
+    def _to_mask(self, ops):
+        """Return a boolean array selecting `ops`.
+        """
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self._to_indices(ops)] = True
+        return mask
+
+    def _to_ops(self, mask):
+        """Return the set of ops selected by a boolean array.
+        """
+        return {self._ops[i] for i in np.flatnonzero(mask)}
+
+    def _forward_mask(self, seed_ops, inclusive=True, within_ops=None):
+        """Boolean array version of `get_forward_walk_ops`.
+        """
+        seeds = self._to_indices(seed_ops)
+        within = None if within_ops is None else self._to_mask(within_ops)
+        visited = _walk(self._consumers, seeds, within)
+        if not inclusive:
+            visited[seeds] = False
+        return visited
+
+    def get_forward_walk_ops(self, seed_ops, inclusive=True, within_ops=None):
+        """Return the ops reachable from `seed_ops` by following data edges
+        forward, like `tensorflow.contrib.graph_editor.get_forward_walk_ops`.
+
+        Args:
+          seed_ops: an iterable of `tf.Operation`.
+          inclusive: if True, `seed_ops` are part of the result.
+          within_ops: an iterable of `tf.Operation` the walk is restricted
+            to. Default `None` (the whole graph).
+
+        Return:
+          A set of `tf.Operation`.
+        """
+        return self._to_ops(self._forward_mask(seed_ops, inclusive,
+                                               within_ops))
+
+    def get_backward_walk_ops(self, seed_ops, inclusive=True):
+        """Return the ops `seed_ops` depend on by following data edges
+        backward.
+
+        Args:
+          seed_ops: an iterable of `tf.Operation`.
+          inclusive: if True, `seed_ops` are part of the result.
+
+        Return:
+          A set of `tf.Operation`.
+        """
+        seeds = self._to_indices(seed_ops)
+        visited = _walk(self._producers, seeds)
+        if not inclusive:
+            visited[seeds] = False
+        return self._to_ops(visited)
+
+    def get_walks_intersection_ops(self, forward_seed_ops,
+                                   backward_seed_ops):
+        """Return the ops that are reachable from `forward_seed_ops` and
+        that `backward_seed_ops` depend on, like
+        `tensorflow.contrib.graph_editor.get_walks_intersection_ops`.
+
+        Return:
+          A set of `tf.Operation`.
+        """
+        fw_mask = self._forward_mask(forward_seed_ops)
+        bw_mask = _walk(self._producers, self._to_indices(backward_seed_ops))
+        return self._to_ops(fw_mask & bw_mask)
+
+    def toposort(self, seed_ops, grad_ops):
+        """Return the levels of the topological order of the ops reachable
+        from `seed_ops`, as built by `TOPOS`.
+
+        The dependencies of an op are its data and control inputs that are
+        reachable from `seed_ops` and that `grad_ops` depend on, ignoring
+        the back edges of while loops. The levels are assigned with Kahn's
+        algorithm, a whole level at a time, and are the same as the levels
+        returned by `toposort.toposort`.
+
+        Args:
+          seed_ops: an iterable of `tf.Operation`.
+          grad_ops: a set of `tf.Operation`.
+
+        Return:
+          A list of sets of `tf.Operation`.
+        """
+        keys = self._forward_mask(seed_ops)
+        if grad_ops:
+            reachable = keys & _walk(self._producers,
+                                     self._to_indices(grad_ops))
+        else:
+            # a forward-only graph
+            reachable = keys
+
+        srcs = np.concatenate([self._srcs[~self._back_edge], self._ctrl_srcs])
+        dests = np.concatenate([self._dests[~self._back_edge],
+                                self._ctrl_dests])
+        keep = reachable[srcs] & keys[dests] & (srcs != dests)
+        deps = self._make_csr(srcs[keep], dests[keep])
+        # the number of distinct dependencies of each op
+        n_deps = np.bincount(deps.indices, minlength=self.size)
+
+        levels = []
+        n_done = 0
+        frontier = np.flatnonzero(keys & (n_deps == 0))
+        while frontier.size:
+            levels.append(frontier)
+            n_done += frontier.size
+            succ, counts = np.unique(_gather(deps, frontier),
+                                     return_counts=True)
+            n_deps[succ] -= counts
+            frontier = succ[n_deps[succ] == 0]
+
+        n_keys = np.count_nonzero(keys)
+        if n_done != n_keys:
+            done = np.zeros(self.size, dtype=bool)
+            for level in levels:
+                done[level] = True
+            raise toposort.CircularDependencyError(
+                {self._ops[i]: set() for i in np.flatnonzero(keys & ~done)})
+        return [{self._ops[i] for i in level} for level in levels]
+
+    def get_forward_coverage(self, seed_ops, target_ops, within_ops=None,
+                             batch_size=COVERAGE_BATCH_SIZE):
+        """Return the number of `target_ops` reachable from each op in
+        `seed_ops`, not counting the op itself.
+
+        The walks from `batch_size` seeds are done at once: the reachable
+        ops are a sparse matrix with one column per seed, and each step
+        extends the frontiers of every seed with one matrix product. The
+        matrix has at most `batch_size` times the number of ops nonzero
+        entries.
+
+        Args:
+          seed_ops: an iterable of `tf.Operation`.
+          target_ops: an iterable of `tf.Operation`.
+          within_ops: an iterable of `tf.Operation` the walks are restricted
+            to. Default `None` (the whole graph).
+          batch_size: the number of seeds walked at once. Default
+            `COVERAGE_BATCH_SIZE`.
+
+        Return:
+          A dictionary of `tf.Operation` to integers.
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive.')
+        seed_ops = list(seed_ops)
+        ret = dict.fromkeys(seed_ops, 0)
+        ops = [op for op in seed_ops if op in self._index]
+        seeds = self._to_indices(ops)
+        keep = np.ones(len(ops), dtype=bool)
+        within = None
+        if within_ops is not None:
+            within_mask = self._to_mask(within_ops)
+            keep = within_mask[seeds]
+            within = sparse.diags(within_mask.astype(np.int32))
+
+        targets = self._to_mask(target_ops)
+        counts = np.zeros(len(ops), dtype=np.int64)
+        for start in range(0, len(ops), batch_size):
+            batch = slice(start, start + batch_size)
+            counts[batch] = self._count_reached(seeds[batch], keep[batch],
+                                                targets, within)
+        # the seeds do not count themselves
+        counts -= targets[seeds] & keep
+        for op, count in zip(ops, counts):
+            ret[op] = int(count)
+        return ret
+
+    def _count_reached(self, seeds, keep, targets, within=None):
+        """Return the number of `targets` reachable from each seed,
+        including the seed itself, walking from all seeds at once.
+
+        Args:
+          seeds: an array of op indices.
+          keep: a boolean array, False for the seeds not walked from.
+          targets: a boolean array of the target ops.
+          within: a diagonal matrix of the ops the walks are restricted to.
+            Default `None` (the whole graph).
+
+        Return:
+          An array of integers, one per seed.
+        """
+        cols = np.arange(len(seeds))
+        # (op, seed) -> 1 if the op is reachable from the seed
+        reached = sparse.csr_matrix(
+            (np.ones(np.count_nonzero(keep), dtype=np.int32),
+             (seeds[keep], cols[keep])), shape=(self.size, len(seeds)))
+        frontier = reached
+        while frontier.nnz:
+            frontier = self._producers.dot(frontier)
+            if within is not None:
+                frontier = within.dot(frontier)
+            frontier.eliminate_zeros()
+            frontier.data[:] = 1
+            frontier = (frontier - frontier.multiply(reached)).tocsr()
+            frontier.eliminate_zeros()
+            reached = reached + frontier
+        return reached.transpose().dot(targets.astype(np.int32))
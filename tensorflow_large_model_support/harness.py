@@ -0,0 +1,404 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""End-to-end harness
+
+Train the models of the examples for a few steps with and without LMS, from
+the same initial values and inputs, on two virtual CPU devices: the first one
+stands in for the GPU and the second one for the host. The losses and the
+gradients of the two runs must match, and the step times show the overhead
+of the swap operations and of the control dependencies added by LMS. No GPU
+is needed, so the harness can run in any test environment.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from tensorflow_large_model_support.lms import LMS
+
+# the virtual device running the model
+DEVICE = '/cpu:0'
+# the virtual device receiving the swapped tensors
+HOST_DEVICE = '/cpu:1'
+
+
+def get_session_config():
+    """Return a session config with the two virtual CPU devices.
+    """
+    return tf.ConfigProto(device_count={'CPU': 2})
+
+
+def _minimize(optimizer, loss, scope):
+    """Add the gradient and the update ops of `loss` in `scope`.
+
+    Return:
+      A tuple of the list of gradient tensors and the train op.
+    """
+    with tf.name_scope(scope):
+        grads_and_vars = optimizer.compute_gradients(loss)
+        train_op = optimizer.apply_gradients(grads_and_vars)
+    return [g for g, _ in grads_and_vars if g is not None], train_op
+
+
+def _get_mnist_batch(batch_size, rng):
+    images = rng.uniform(size=(batch_size, 784)).astype(np.float32)
+    labels = rng.randint(0, 10, size=batch_size).astype(np.int64)
+    return images, labels
+
+
+def build_mnist_deep(batch_size, rng):
+    """Build the model of `examples/mnist_deep_lms.py` on random MNIST-like
+    inputs.
+
+    Args:
+      batch_size: the number of examples.
+      rng: a `numpy.random.RandomState` drawing the inputs.
+
+    Return:
+      A dictionary with the loss (`loss`), the list of gradient tensors
+      (`gradients`), the train op (`train_op`) and the feed dictionary of a
+      step (`feed_dict`).
+    """
+    def weight_variable(shape):
+        return tf.Variable(tf.truncated_normal(shape, stddev=0.1))
+
+    def bias_variable(shape):
+        return tf.Variable(tf.constant(0.1, shape=shape))
+
+    def conv2d(x, W):
+        return tf.nn.conv2d(x, W, strides=[1, 1, 1, 1], padding='SAME')
+
+    def max_pool_2x2(x):
+        return tf.nn.max_pool(x, ksize=[1, 2, 2, 1], strides=[1, 2, 2, 1],
+                              padding='SAME')
+
+    x = tf.placeholder(tf.float32, [None, 784])
+    y_ = tf.placeholder(tf.int64, [None])
+    with tf.name_scope('reshape'):
+        x_image = tf.reshape(x, [-1, 28, 28, 1])
+    with tf.name_scope('conv1'):
+        h_conv1 = tf.nn.relu(conv2d(x_image, weight_variable([5, 5, 1, 32])) +
+                             bias_variable([32]))
+    with tf.name_scope('pool1'):
+        h_pool1 = max_pool_2x2(h_conv1)
+    with tf.name_scope('conv2'):
+        h_conv2 = tf.nn.relu(conv2d(h_pool1, weight_variable([5, 5, 32, 64])) +
+                             bias_variable([64]))
+    with tf.name_scope('pool2'):
+        h_pool2 = max_pool_2x2(h_conv2)
+    with tf.name_scope('fc1'):
+        h_pool2_flat = tf.reshape(h_pool2, [-1, 7 * 7 * 64])
+        h_fc1 = tf.nn.relu(tf.matmul(h_pool2_flat,
+                                     weight_variable([7 * 7 * 64, 1024])) +
+                           bias_variable([1024]))
+    with tf.name_scope('dropout'):
+        keep_prob = tf.placeholder(tf.float32)
+        h_fc1_drop = tf.nn.dropout(h_fc1, keep_prob)
+    with tf.name_scope('fc2'):
+        y_conv = (tf.matmul(h_fc1_drop, weight_variable([1024, 10])) +
+                  bias_variable([10]))
+    with tf.name_scope('loss'):
+        cross_entropy = tf.losses.sparse_softmax_cross_entropy(
+            labels=y_, logits=y_conv)
+    loss = tf.reduce_mean(cross_entropy)
+    gradients, train_op = _minimize(tf.train.AdamOptimizer(1e-4), loss,
+                                    'adam_optimizer')
+
+    images, labels = _get_mnist_batch(batch_size, rng)
+    return {'loss': loss, 'gradients': gradients, 'train_op': train_op,
+            'feed_dict': {x: images, y_: labels, keep_prob: 0.5}}
+
+
+def build_cnn_mnist(batch_size, rng):
+    """Build the model of `examples/cnn_mnist_lms.py` on random MNIST-like
+    inputs.
+
+    Args:
+      batch_size: the number of examples.
+      rng: a `numpy.random.RandomState` drawing the inputs.
+
+    Return:
+      A dictionary like `build_mnist_deep`.
+    """
+    x = tf.placeholder(tf.float32, [None, 784])
+    labels = tf.placeholder(tf.int64, [None])
+    input_layer = tf.reshape(x, [-1, 28, 28, 1])
+    conv1 = tf.layers.conv2d(inputs=input_layer, filters=32,
+                             kernel_size=[5, 5], padding='same',
+                             activation=tf.nn.relu)
+    pool1 = tf.layers.max_pooling2d(inputs=conv1, pool_size=[2, 2],
+                                    strides=2)
+    conv2 = tf.layers.conv2d(inputs=pool1, filters=64, kernel_size=[5, 5],
+                             padding='same', activation=tf.nn.relu)
+    pool2 = tf.layers.max_pooling2d(inputs=conv2, pool_size=[2, 2],
+                                    strides=2)
+    pool2_flat = tf.reshape(pool2, [-1, 7 * 7 * 64])
+    dense = tf.layers.dense(inputs=pool2_flat, units=1024,
+                            activation=tf.nn.relu)
+    dropout = tf.layers.dropout(inputs=dense, rate=0.4, training=True)
+    logits = tf.layers.dense(inputs=dropout, units=10)
+    loss = tf.losses.sparse_softmax_cross_entropy(labels=labels,
+                                                  logits=logits)
+    gradients, train_op = _minimize(
+        tf.train.GradientDescentOptimizer(learning_rate=0.001), loss,
+        'adam_optimizer')
+
+    images, image_labels = _get_mnist_batch(batch_size, rng)
+    return {'loss': loss, 'gradients': gradients, 'train_op': train_op,
+            'feed_dict': {x: images, labels: image_labels}}
+
+
+def build_resnet50(batch_size, rng, image_size=32, num_classes=15):
+    """Build the model of `examples/Keras_ResNet50.py` on random images.
+
+    Args:
+      batch_size: the number of examples.
+      rng: a `numpy.random.RandomState` drawing the inputs.
+      image_size: the width and the height of the images. Default `32`.
+      num_classes: the number of classes. Default `15`.
+
+    Return:
+      A dictionary like `build_mnist_deep`.
+    """
+    input_shape = (image_size, image_size, 3)
+    x = tf.placeholder(tf.float32, (None,) + input_shape)
+    y = tf.placeholder(tf.float32, [None, num_classes])
+    resnet50 = tf.keras.applications.ResNet50(weights=None, include_top=True,
+                                              input_tensor=x,
+                                              input_shape=input_shape,
+                                              classes=num_classes)
+    loss = tf.reduce_mean(tf.keras.losses.categorical_crossentropy(
+        y, resnet50.output))
+    gradients, train_op = _minimize(tf.train.RMSPropOptimizer(0.001), loss,
+                                    'training')
+
+    images = rng.normal(size=(batch_size,) + input_shape).astype(np.float32)
+    categories = np.eye(num_classes, dtype=np.float32)[
+        rng.randint(0, num_classes, size=batch_size)]
+    return {'loss': loss, 'gradients': gradients, 'train_op': train_op,
+            'feed_dict': {x: images, y: categories}}
+
+
+# reference models: build function, optimizer scopes and the LMS parameters
+# of the example
+MODELS = {
+    'mnist_deep': {'build_fn': build_mnist_deep,
+                   'optimizer_scopes': {'adam_optimizer'},
+                   'lms_args': {'excl_scopes': {'loss', 'dropout'}, 'lb': 3}},
+    'cnn_mnist': {'build_fn': build_cnn_mnist,
+                  'optimizer_scopes': {'adam_optimizer'},
+                  'lms_args': {'lb': 3}},
+    'resnet50': {'build_fn': build_resnet50,
+                 'optimizer_scopes': {'training'},
+                 'lms_args': {}},
+}
+
+
+def run_model(build_fn, optimizer_scopes, steps=3, batch_size=2, seed=0,
+              lms_args=None):
+    """Build a model in a new graph and train it for `steps` steps.
+
+    Args:
+      build_fn: a function of the batch size and of a
+        `numpy.random.RandomState`, building the model in the default graph
+        and returning a dictionary like `build_mnist_deep`.
+      optimizer_scopes: a set of scopes for the optimizers/solvers.
+      steps: the number of steps. Default `3`.
+      batch_size: the number of examples. Default `2`.
+      seed: the seed of the graph and of the inputs. Default `0`.
+      lms_args: the kwargs to pass to LMS. `cpu_device` defaults to the
+        virtual host device. Default `None` (LMS is not applied).
+
+    Return:
+      A dictionary with the loss (`losses`) and the gradient values
+      (`gradients`) of each step, the duration in seconds of each step but
+      the first one, which includes the optimization of the graph by the
+      session (`step_times`), the number of swapped tensors (`n_swapped`)
+      and the number of ops added by LMS (`n_added_ops`).
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.set_random_seed(seed)
+        with tf.device(DEVICE):
+            model = build_fn(batch_size, np.random.RandomState(seed))
+        init_op = tf.global_variables_initializer()
+
+    n_swapped = 0
+    n_added_ops = 0
+    if lms_args is not None:
+        lms_obj = LMS(optimizer_scopes, graph=graph,
+                      **dict({'cpu_device': HOST_DEVICE}, **lms_args))
+        added_ops = lms_obj.run()
+        n_swapped = len(lms_obj.plan)
+        n_added_ops = len(added_ops or ())
+
+    losses = []
+    gradients = []
+    step_times = []
+    fetches = [model['loss'], model['gradients'], model['train_op']]
+    with tf.Session(graph=graph, config=get_session_config()) as sess:
+        sess.run(init_op)
+        for step in range(steps):
+            start_time = time.time()
+            loss, grads, _ = sess.run(fetches, feed_dict=model['feed_dict'])
+            if step > 0:
+                step_times.append(time.time() - start_time)
+            losses.append(loss)
+            gradients.append(grads)
+    return {'losses': losses, 'gradients': gradients,
+            'step_times': step_times, 'n_swapped': n_swapped,
+            'n_added_ops': n_added_ops}
+
+
+def _max_abs_diff(a, b):
+    return float(np.max(np.abs(np.asarray(a, dtype=np.float64) - b)))
+
+
+def compare(build_fn, optimizer_scopes, steps=3, batch_size=2, seed=0,
+            lms_args=None, rtol=1e-5, atol=1e-7):
+    """Train a model with and without LMS and compare the two runs.
+
+    Args:
+      build_fn: a model build function, see `run_model`.
+      optimizer_scopes: a set of scopes for the optimizers/solvers.
+      steps: the number of steps, at least `2`. Default `3`.
+      batch_size: the number of examples. Default `2`.
+      seed: the seed of the graph and of the inputs. Default `0`.
+      lms_args: the kwargs to pass to LMS. Default `None` (the default
+        parameters).
+      rtol: the relative tolerance of `numpy.allclose`. Default `1e-5`.
+      atol: the absolute tolerance of `numpy.allclose`. Default `1e-7`.
+
+    Return:
+      A dictionary with whether the losses and the gradients of every step
+      match (`match`), their largest absolute differences (`max_loss_diff`,
+      `max_grad_diff`), the median step time in seconds with LMS
+      (`step_time`) and without LMS (`step_time_without_lms`), the
+      relative overhead of LMS (`overhead`), the number of swapped tensors
+      (`n_swapped`) and the number of ops added by LMS (`n_added_ops`).
+    """
+    if steps < 2:
+        raise ValueError('At least 2 steps are needed to time a step.')
+    ref = run_model(build_fn, optimizer_scopes, steps, batch_size, seed)
+    lms = run_model(build_fn, optimizer_scopes, steps, batch_size, seed,
+                    lms_args or {})
+
+    match = True
+    max_loss_diff = 0.0
+    max_grad_diff = 0.0
+    for step in range(steps):
+        match &= bool(np.allclose(lms['losses'][step], ref['losses'][step],
+                                  rtol=rtol, atol=atol))
+        max_loss_diff = max(max_loss_diff, _max_abs_diff(
+            lms['losses'][step], ref['losses'][step]))
+        for lms_grad, ref_grad in zip(lms['gradients'][step],
+                                      ref['gradients'][step]):
+            match &= bool(np.allclose(lms_grad, ref_grad, rtol=rtol,
+                                      atol=atol))
+            max_grad_diff = max(max_grad_diff,
+                                _max_abs_diff(lms_grad, ref_grad))
+
+    step_time = float(np.median(lms['step_times']))
+    step_time_without_lms = float(np.median(ref['step_times']))
+    return {'match': match,
+            'max_loss_diff': max_loss_diff,
+            'max_grad_diff': max_grad_diff,
+            'step_time': step_time,
+            'step_time_without_lms': step_time_without_lms,
+            'overhead': step_time / step_time_without_lms - 1.0,
+            'n_swapped': lms['n_swapped'],
+            'n_added_ops': lms['n_added_ops']}
+
+
+def compare_model(name, steps=3, batch_size=2, seed=0, lms_args=None,
+                  rtol=1e-5, atol=1e-7):
+    """Compare the runs of a reference model of `MODELS`.
+
+    Args:
+      name: the name of the model in `MODELS`.
+      lms_args: the kwargs to pass to LMS, overriding the parameters of the
+        example. Default `None`.
+      See `compare` for the other arguments.
+
+    Return:
+      A dictionary like `compare`.
+    """
+    if name not in MODELS:
+        raise ValueError('Unknown model: {}. Supported models are {}.'.format(
+            name, ', '.join(sorted(MODELS))))
+    model = MODELS[name]
+    return compare(model['build_fn'], model['optimizer_scopes'], steps,
+                   batch_size, seed,
+                   dict(model['lms_args'], **(lms_args or {})), rtol, atol)
+
+
+def main(argv=None):
+    """Entry point of the `lms-harness` command.
+    """
+    parser = argparse.ArgumentParser(
+        prog='lms-harness',
+        description='Train the models of the examples with and without LMS '
+                    'on virtual CPU devices, check that the losses and the '
+                    'gradients match and print the step time overhead.')
+    parser.add_argument('--models', nargs='*', choices=sorted(MODELS),
+                        default=sorted(MODELS), help='the models to run')
+    parser.add_argument('--steps', type=int, default=3,
+                        help='the number of steps')
+    parser.add_argument('--batch-size', type=int, default=2,
+                        help='the number of examples')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the seed of the graph and of the inputs')
+    parser.add_argument('--params', type=json.loads, default={},
+                        metavar='JSON', help='LMS parameters overriding the '
+                        'parameters of the examples')
+    parser.add_argument('--rtol', type=float, default=1e-5,
+                        help='the relative tolerance')
+    parser.add_argument('--atol', type=float, default=1e-7,
+                        help='the absolute tolerance')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.models:
+        results[name] = compare_model(name, args.steps, args.batch_size,
+                                      args.seed, args.params, args.rtol,
+                                      args.atol)
+    if args.json:
+        print(json.dumps(results, sort_keys=True))
+    else:
+        print('{:<12} {:>6} {:>10} {:>10} {:>10} {:>10} {:>9}'.format(
+            'model', 'match', 'loss diff', 'grad diff', 'step (ms)',
+            'overhead', 'swapped'))
+        for name in args.models:
+            result = results[name]
+            print('{:<12} {:>6} {:>10.2e} {:>10.2e} {:>10.1f} {:>9.1f}% '
+                  '{:>9}'.format(name, 'yes' if result['match'] else 'NO',
+                                 result['max_loss_diff'],
+                                 result['max_grad_diff'],
+                                 result['step_time'] * 1000,
+                                 result['overhead'] * 100,
+                                 result['n_swapped']))
+    return 0 if all(r['match'] for r in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,9 +18,23 @@ import tensorflow as tf
 import tensorflow.contrib.graph_editor as ge
 from tensorflow.contrib.graph_editor import util
 
+import collections
+import contextlib
+import json
+import os
+import re
 import time
 from six.moves import queue as Queue
+from tensorflow_large_model_support import adaptive
+from tensorflow_large_model_support import distributed
+from tensorflow_large_model_support import frames
+from tensorflow_large_model_support import graph_matrix
+from tensorflow_large_model_support import memory
+from tensorflow_large_model_support import plan
+from tensorflow_large_model_support import policy
 from tensorflow_large_model_support import topos
+from tensorflow_large_model_support import tracer
+from tensorflow_large_model_support import verify
 from enum import Enum
 
 
@@ -28,12 +42,92 @@ class CTRLD_Strategy(Enum):
     CHAIN_RULE = 1
     DIRECT_ORDER = 2
 
+
+class THROTTLE_Strategy(Enum):
+    CHAIN = 1
+    STAGGER = 2
+
+
+class SWAPOUT_Policy(Enum):
+    NONE = 1
+    AFTER_LAST_CONSUMER = 2
+    SPREAD = 3
+
+
+class HOSTMEM_Check(Enum):
+    NONE = 1
+    WARN = 2
+    ERROR = 3
+    TRIM = 4
+
+
+class TRAVERSAL_Strategy(Enum):
+    BFS = 1
+    PRIORITY = 2
+
+
+def default_benefit(ts, nbytes, lifetime):
+    """Return the benefit of swapping the tensor `ts`: its size in bytes
+    times its lifetime, the topological-sort distance from the operation
+    producing it to its last consuming operation.
+    """
+    return nbytes * lifetime
+
+# Swap plans shared by the LMS integrations of this process
+_plan_cache = plan.PlanCache()
+
+
+def clear_plan_cache():
+    """Remove the swap plans cached by `LMSSessionRunHook` and
+    `LMSKerasCallback`.
+    """
+    _plan_cache.clear()
+
+
+def _run(lms_obj, graph, lms_args, plan_transport=None):
+    """Edit `graph` with `lms_obj`, or with the plan of rank 0 if
+    `plan_transport` is given.
+    """
+    if plan_transport is None:
+        lms_obj.run(graph)
+    else:
+        distributed.run_lms(lms_obj, plan_transport, graph,
+                            lms_args=lms_args)
+
+
+def _run_cached(lms_obj, graph, optimizer_scopes, lms_args,
+                plan_transport=None):
+    """Edit `graph` with `lms_obj`, reusing the cached plan of an identical
+    graph edited with the same parameters if there is one.
+
+    Args:
+      lms_obj: an `LMS` object.
+      graph: a `tf.Graph`.
+      optimizer_scopes: a set of scopes for the optimizers/solvers.
+      lms_args: a dictionary of the other parameters of `lms_obj`.
+      plan_transport: a transport of `distributed.run_lms` used when the
+        plan is not cached. Default `None`.
+    """
+    key = plan.make_cache_key(graph, optimizer_scopes, lms_args)
+    swap_plan = _plan_cache.get(key)
+    if swap_plan is not None:
+        lms_obj.apply_plan(swap_plan, graph)
+        return
+    _run(lms_obj, graph, lms_args, plan_transport)
+    _plan_cache.put(key, lms_obj.plan)
+
+
 # Operations with these types will be excluded from swapping
 ATOMIC_TYPES = {'Const', 'Mul', 'Add',
                 'Identity', 'Assign', 'VariableV2',
                 'Reshape', 'Shape', 'ShapeN',
                 'Placeholder'}
 
+# Operations with these types feed the inputs of a forward-only graph
+INFERENCE_SEED_TYPES = {'Placeholder', 'PlaceholderV2',
+                        'PlaceholderWithDefault',
+                        'IteratorGetNext', 'IteratorGetNextSync'}
+
 
 class LMS(object):
     """LMS class for Large Model Support (LMS).
@@ -58,21 +152,42 @@ class LMS(object):
                  incl_scopes=set(),
                  excl_types=set(),
                  incl_types=set(),
+                 incl_op_names=None,
                  lb=1, ub=10000,
                  n_tensors=-1,
                  fuse_swapins=False,
+                 fuse_window=None,
                  ctrld_strategy="chain_rule",
                  swap_branches=False,
                  branch_threshold=0,
                  debug=False,
                  debug_level=1,
-                 cpu_device="/cpu:0"):
+                 cpu_device="/cpu:0",
+                 trace=False,
+                 trace_capacity=10000,
+                 prefetch_distances=None,
+                 max_inflight_swapins=0,
+                 max_inflight_swapin_bytes=0,
+                 swapin_throttle="chain",
+                 swapout_policy="none",
+                 swapout_window=3,
+                 batch_size=1,
+                 host_mem_limit_mb=None,
+                 host_mem_check="none",
+                 host_mem_headroom=1.25,
+                 inference=False,
+                 frame_aware=False,
+                 traversal="bfs",
+                 benefit_fn=None,
+                 sparse_analysis=False,
+                 swap_policy=None):
         """Create an LMS object to edit the graph for supporting large model.
 
         Args:
           graph: the graph we will modify for LMS. This should be the graph of
             user-defined neural network.
-          optimizer_scopes: a set of scopes for the optimizers/solvers.
+          optimizer_scopes: a set of scopes for the optimizers/solvers. Not
+            required in inference mode.
           starting_scope: tensors that are reachable from the operations in
             this scope will be swapped for LMS. Set this to the scope of the
             first layer if we would like to modify the whole graph.
@@ -86,6 +201,9 @@ class LMS(object):
             swapped out to the host. Default `empty`.
           incl_types: a set of types for operations whose tensors will be
             swapped out to the host. Default `empty`.
+          incl_op_names: a set of names of operations whose tensors will be
+            swapped out to the host, e.g. the operations producing the
+            outputs of Keras layers. Default `None`.
           n_tensors: the number of tensors for LMS, counting from the
             `starting_scope`. To turn off LMS, set `n_tensors` to `0`.
             Default `-1` (all reachable tensors will be swapped for LMS).
@@ -95,6 +213,12 @@ class LMS(object):
           ub: upper-bound value for LMS. Default `10000`.
           fuse_swapins: Fuse "close" swap-in operations into one operation.
             This may improve the performance. Default `False`.
+          fuse_window: the largest distance in levels of the topological
+            order between the first and the last consumer sharing a fused
+            swap-in operation. Consumers further apart get their own swap-in
+            operations, so a tensor is not kept on the device for long
+            between distant consumers. Only used when `fuse_swapins` is
+            True. Default `None` (all consumers share one swap-in operation).
           ctrld_strategy: Two strategies to find control dependency ops for
             swapin ops: `chain_rule` and `direct_order`. `chain_rule` strategy
             starts from a forward operation, goes forward and finds a corresponding
@@ -114,22 +238,126 @@ class LMS(object):
           debug: debug mode for LMS. Default `False`.
           debug_level: Debug level for LMS (1 or 2). Default `1`.
           cpu_device: the device we would like swap tensors to.
+          trace: If True, LMS records structured events (swap-out, swap-in,
+            control dependency and skip) into the `tracer`. Default `False`.
+          trace_capacity: the maximum number of events kept by the `tracer`.
+            Default `10000`.
+          prefetch_distances: a dictionary of tensor names to lower-bound
+            values overriding `lb` for the swap-ins of these tensors, for
+            example as recommended by `LMSSessionRunHook` in adaptive mode.
+            Default `None`.
+          max_inflight_swapins: the maximum number of swap-ins triggered at
+            the same topological order. `0` means no limit. Default `0`.
+          max_inflight_swapin_bytes: the maximum number of bytes swapped in
+            by swap-ins triggered at the same topological order, computed
+            from static shapes. `0` means no limit. Default `0`.
+          swapin_throttle: Two strategies to keep swap-ins within the limits
+            above: `chain` and `stagger`. `chain` strategy makes swap-ins
+            exceeding the limits wait for the swap-ins already triggered at
+            the same order by adding control dependencies between them.
+            `stagger` strategy moves the control dependency of these swap-ins
+            to earlier orders, falling back to `chain` if there is no room.
+            Default `chain`.
+          swapout_policy: Three policies to schedule swap-out ops: `none`,
+            `after_last_consumer` and `spread`. With `none`, swap-out ops have
+            no control dependency and TensorFlow may start them at any time.
+            `after_last_consumer` policy starts a swap-out right after the
+            last forward operation consuming the tensor. `spread` policy
+            starts a swap-out at the order that has the fewest swap-outs
+            among the `swapout_window` orders following the last forward
+            consumer, to smooth the device-to-host traffic. Default `none`.
+          swapout_window: the number of orders considered by the `spread`
+            policy. Default `3`.
+          batch_size: the size used for dimensions that are not known
+            statically, typically the batch dimension, when estimating the
+            sizes of tensors. Default `1`.
+          host_mem_limit_mb: the host memory available for swapped tensors in
+            MB. Default `None` (the value of `TF_CUDA_HOST_MEM_LIMIT_IN_MB`,
+            or the TensorFlow default if it is not set).
+          host_mem_check: Four actions when the estimated peak host memory,
+            times `host_mem_headroom`, exceeds `host_mem_limit_mb`: `none`,
+            `warn`, `error` and `trim`. `warn` logs a warning. `error` plans
+            the edits on a copy of the graph and raises a `ValueError`
+            before the graph is edited. `trim` does not swap the tensors
+            that would exceed the limit. The estimate, `error` and `trim`
+            all keep a tensor on the host from its swap-out until its last
+            swap-in, see `memory.get_host_interval`. Default `none`.
+          host_mem_headroom: a factor applied to the estimated peak host
+            memory to account for the fragmentation of the host allocator.
+            Default `1.25`.
+          inference: If True, LMS edits a forward-only graph, e.g. for
+            inference. There is no backward phase, and a tensor is swapped for
+            its consuming operations whose topological-sort distance to its
+            first consuming operation is greater than `branch_threshold`,
+            such as long skip connections. Default `False`.
+          frame_aware: If True, control dependency ops are chosen using the
+            `tf.cond` branches found in the Enter/Exit/Switch/Merge structure
+            of the graph: a control dependency op must run whenever the
+            consuming operation runs. Otherwise, operations in `tf.cond`
+            branches or whose name contains `/cond/` are never used as
+            control dependency ops. In both cases, a control dependency op
+            must be in the same `tf.while_loop` frame as the swapped tensor.
+            Swap operations are created in the control flow context of the
+            operation producing the tensor, so tensors produced inside a
+            `tf.while_loop` are swapped within its frame. Default `False`.
+          traversal: Two strategies to choose the tensors to swap: `bfs`
+            and `priority`. `bfs` strategy swaps tensors in breadth-first
+            order from the starting operations until `n_tensors` tensors are
+            swapped. `priority` strategy scores the tensors reachable from
+            the starting operations with `benefit_fn` and swaps them in
+            decreasing order of benefit, so a limited `n_tensors` swaps the
+            tensors saving the most memory. Default `bfs`.
+          benefit_fn: a function taking a `tf.Tensor`, its size in bytes and
+            its lifetime in topological orders, and returning the benefit of
+            swapping it, used by the `priority` strategy. Tensors with a
+            benefit of `0` or less are not swapped. Default `None`
+            (`default_benefit`, the size times the lifetime).
+          sparse_analysis: If True, the starting operations, the reachable
+            operations and the topological order are computed with sparse
+            matrix operations over the whole graph instead of walking the
+            graph one operation at a time, which is much faster on large
+            graphs. Requires SciPy. Default `False`.
+          swap_policy: a `policy.SwapPolicy` choosing the consumers reading
+            a tensor from a swap-in, the prefetch distance of each swap-in
+            and its control dependency operation among the candidates.
+            Default `None` (a `policy.SwapPolicy` built from `lb`,
+            `swap_branches`, `branch_threshold` and `prefetch_distances`,
+            which are ignored when a policy is given).
         """
-        if not optimizer_scopes:
+        if not optimizer_scopes and not inference:
             raise ValueError('A least one optimizer scope is required.')
 
         self._graph = graph
-        self._optimizer_scopes = optimizer_scopes
-        self._excl_scopes = excl_scopes
-        self._incl_scopes = incl_scopes
-        self._excl_types = excl_types
-        self._incl_types = incl_types
+        self._optimizer_scopes = optimizer_scopes or set()
+        self._inference = inference
+        self._frame_aware = frame_aware
+        self._frames = frames.FrameInfo()
+        # copy the sets, they are updated below and the defaults are shared
+        # by all instances
+        self._excl_scopes = set(excl_scopes)
+        self._incl_scopes = set(incl_scopes)
+        self._excl_types = set(excl_types)
+        self._incl_types = set(incl_types)
+        self._incl_op_names = set(incl_op_names or [])
         self._starting_scope = starting_scope
         self._starting_op_names = starting_op_names
         self._lb = lb  # lowerbound
+        self._prefetch_distances = prefetch_distances or {}
         self._ub = ub  # upperbound
         self._n_tensors = n_tensors
         self._fuse_swapins = fuse_swapins
+        self._fuse_window = fuse_window
+        if traversal == "priority":
+            self._traversal = TRAVERSAL_Strategy.PRIORITY
+        else:
+            self._traversal = TRAVERSAL_Strategy.BFS
+        self._benefit_fn = benefit_fn or default_benefit
+        if sparse_analysis and not graph_matrix.is_available():
+            raise ValueError('sparse_analysis requires SciPy.')
+        if fuse_window is not None and fuse_window < 0:
+            raise ValueError('fuse_window must not be negative.')
+        self._sparse_analysis = sparse_analysis
+        self._graph_matrix = None
         if ctrld_strategy == "chain_rule":
             self._ctrld_strategy = CTRLD_Strategy.CHAIN_RULE
         elif ctrld_strategy == "direct_order":
@@ -137,8 +365,45 @@ class LMS(object):
         else:
             self._ctrld_strategy = CTRLD_Strategy.CHAIN_RULE
 
+        self._max_inflight_swapins = max_inflight_swapins
+        self._max_inflight_swapin_bytes = max_inflight_swapin_bytes
+        if swapin_throttle == "stagger":
+            self._swapin_throttle = THROTTLE_Strategy.STAGGER
+        else:
+            self._swapin_throttle = THROTTLE_Strategy.CHAIN
+        # order of control dependency ops -> lists of (swapin_op, bytes)
+        self._swapin_waves = {}
+        if swapout_policy == "after_last_consumer":
+            self._swapout_policy = SWAPOUT_Policy.AFTER_LAST_CONSUMER
+        elif swapout_policy == "spread":
+            self._swapout_policy = SWAPOUT_Policy.SPREAD
+        else:
+            self._swapout_policy = SWAPOUT_Policy.NONE
+        self._swapout_window = swapout_window
+        # order -> number of swap-outs triggered at this order
+        self._swapout_load = {}
+
+        self._batch_size = batch_size
+        self._host_mem_limit_mb = host_mem_limit_mb
+        if host_mem_check == "warn":
+            self._host_mem_check = HOSTMEM_Check.WARN
+        elif host_mem_check == "error":
+            self._host_mem_check = HOSTMEM_Check.ERROR
+        elif host_mem_check == "trim":
+            self._host_mem_check = HOSTMEM_Check.TRIM
+        else:
+            self._host_mem_check = HOSTMEM_Check.NONE
+        self._host_mem_headroom = host_mem_headroom
+        # order -> bytes on the host, used to trim the plan
+        self._host_load = []
+        self._host_memory = None
+        # phase -> milliseconds spent in the phase by the last run
+        self._timings = collections.OrderedDict()
+
         self._swap_branches = swap_branches
         self._branch_threshold = branch_threshold
+        self._swap_policy = swap_policy or policy.SwapPolicy(
+            lb, swap_branches, branch_threshold, self._prefetch_distances)
 
         self._excl_types |= ATOMIC_TYPES
 
@@ -149,6 +414,12 @@ class LMS(object):
         self._cpu_device = cpu_device
         self._debug = debug
         self._debug_level = debug_level
+        self._tracer = tracer.Tracer(enabled=trace, capacity=trace_capacity)
+        self._plan = plan.SwapPlan()
+        self._verifier = None
+        # the number of control dependency ops rejected because they would
+        # add a cycle or delay a swap-in past its consumer
+        self._ctrld_rejections = {'candidates': 0, 'dropped': 0}
 
         # keep log of tensors on host
         self._incpu_count = 0
@@ -197,7 +468,13 @@ class LMS(object):
                 seed_ops |= name_ops
 
         seed_ops = list(seed_ops)
-        if not seed_ops:
+        if not seed_ops and self._inference:
+            # start from the inputs of the model
+            seed_ops = [op for op in ops if op.type in INFERENCE_SEED_TYPES]
+            if not seed_ops:
+                raise ValueError('No input operations were found. Set '
+                                 'starting_scope or starting_op_names.')
+        elif not seed_ops:
             candidates = set()
             non_grad_ops = [op
                             for op in self._graph.get_operations()
@@ -212,10 +489,16 @@ class LMS(object):
             # ordering an operation by how much it covers the other ops
             tmp_dict = {}
             max_nelems = -1
+            if self._graph_matrix is not None:
+                coverage = self._graph_matrix.get_forward_coverage(
+                    candidates, candidates, within_ops=non_grad_ops)
             for op in candidates:
-                nelems = len(set(ge.get_forward_walk_ops(op, within_ops=non_grad_ops,
-                                                         inclusive=False)) &
-                             candidates)
+                if self._graph_matrix is not None:
+                    nelems = coverage[op]
+                else:
+                    nelems = len(set(ge.get_forward_walk_ops(op, within_ops=non_grad_ops,
+                                                             inclusive=False)) &
+                                 candidates)
                 if nelems > 0:
                     tmp_dict[op] = nelems
                     max_nelems = nelems if (nelems > max_nelems) else max_nelems
@@ -285,7 +568,7 @@ class LMS(object):
         The graph is modified in-place.
 
         Return:
-          a set of added ops.
+          a set of added ops, empty if the graph has already been edited.
         """
         if graph:
             self._graph = graph
@@ -300,26 +583,68 @@ class LMS(object):
             raise ValueError('The dataflow graph is required but has not been'
                              ' provided.')
 
+        if self._host_mem_check is HOSTMEM_Check.ERROR:
+            return self._run_on_copy()
+        return self._edit()
+
+    def _run_on_copy(self):
+        """Plan the edits on a copy of the graph and apply the plan to the
+        graph only if the swapped tensors fit within the host memory limit,
+        so the graph is left unchanged when they do not.
+
+        Return:
+          a set of added ops.
+        """
+        graph = self._graph
+        graph_copy = tf.Graph()
+        with graph_copy.as_default():
+            tf.train.import_meta_graph(tf.train.export_meta_graph(
+                graph=graph))
+        self._graph = graph_copy
+        try:
+            # raises before the graph is edited if the plan does not fit
+            added_ops = self._edit()
+        finally:
+            self._graph = graph
+        if not added_ops:
+            # the graph has already been edited
+            return added_ops
+        self._incpu_count = 0
+        return self._apply_plan(plan.SwapPlan.from_dict(self._plan.to_dict()))
+
+    def _edit(self):
+        """Analyze the graph and add swapin and swapout ops.
+
+        Return:
+          a set of added ops.
+        """
         self._log_info("Editing model for LMS")
         self._print_configuration()
         start_time = time.time()
+        self._timings = collections.OrderedDict()
+        phase_time = start_time
 
+        if self._sparse_analysis:
+            self._graph_matrix = graph_matrix.GraphMatrix(self._graph)
         self._build_gradient_ops()
         seed_ops = self._get_seed_ops()
+        phase_time = self._record_timing('seed_ops', phase_time)
 
-        self._log_info(
-            "Starting ops: {}".format(
-                [(op.name, op.type) for op in seed_ops]), 1)
+        self._log_info("Starting ops: {}", 1,
+                       lambda: [(op.name, op.type) for op in seed_ops])
 
-        reachable_ops = set()
-        for seed_op in seed_ops:
-            reachable_ops |= set(self._get_forward_walk_ops(seed_op))
+        if self._graph_matrix is not None:
+            reachable_ops = self._graph_matrix.get_forward_walk_ops(seed_ops)
+        else:
+            reachable_ops = set()
+            for seed_op in seed_ops:
+                reachable_ops |= set(self._get_forward_walk_ops(seed_op))
 
         for op in reachable_ops:
             if 'lms/swap' in op.name:
                 self._log_info('This model has already been updated with LMS '
                                'swap operations. LMS will not re-process it.')
-                return
+                return set()
         # exclusive ops
         self._excl_ops = self._filter_scopes_and_types(reachable_ops,
                                                        self._excl_scopes,
@@ -328,35 +653,312 @@ class LMS(object):
         self._incl_ops = self._filter_scopes_and_types(reachable_ops,
                                                        self._incl_scopes,
                                                        self._incl_types)
+        if self._incl_op_names:
+            name_ops = {op for op in reachable_ops
+                        if op.name in self._incl_op_names}
+            if not name_ops:
+                raise ValueError('No operations were found with names: '
+                                 '{}.'.format(sorted(self._incl_op_names)))
+            self._incl_ops |= name_ops
 
-        reachable_ops -= self._grad_ops
+        phase_time = self._record_timing('reachable_ops', phase_time)
 
         # build a topological sort
-        self._topo_sort = topos.TOPOS(seed_ops, self._grad_ops)
+        # when only a few tensors are swapped, orders are only assigned as
+        # far as the swapping needs them, the whole order is only needed to
+        # rank control dependency ops by slack
+        self._topo_sort = topos.TOPOS(seed_ops, self._grad_ops,
+                                      self._graph_matrix,
+                                      lazy=self._n_tensors > 0)
         self._topo_sort.build()
-        for i in range(0, self._topo_sort.size):
-            self._log_info("[{}]: {}".format(
-                i, [op.name for op in self._topo_sort.get_ops(i)]), 1)
-
-        self._do_action(seed_ops)
-
-        # check the validation of the new model
-        new_reachable_ops = set()
-        for seed_op in seed_ops:
-            new_reachable_ops |= set(ge.get_forward_walk_ops(seed_op))
-        new_reachable_ops -= self._grad_ops
-        if (new_reachable_ops >= reachable_ops):
+        phase_time = self._record_timing('topological_sort', phase_time)
+        self._plan = plan.SwapPlan()
+        self._verifier = verify.EditVerifier(self._topo_sort)
+        self._ctrld_rejections = {'candidates': 0, 'dropped': 0}
+        self._host_load = []
+        if self._is_logging(1):
+            for i in range(0, self._topo_sort.size):
+                self._log_info("[{}]: {}", 1, i,
+                               [op.name for op in self._topo_sort.get_ops(i)])
+
+        if self._traversal is TRAVERSAL_Strategy.PRIORITY:
+            self._do_priority_action(seed_ops)
+        else:
+            self._do_action(seed_ops)
+        # the sizes of the levels are only read when the plan is exported
+        self._plan.set_topo_sort(self._topo_sort)
+        phase_time = self._record_timing('swap_insertion', phase_time)
+
+        # the edits were checked as they were applied
+        added_ops = self._verifier.added_ops
+        if not self._verifier.errors:
             self._log_info("Edited model is valid and logically equivalent to the original one")
-            self._log_info("Added {} ops into the model".format(len(new_reachable_ops - reachable_ops)))
+            self._log_info("Added {} ops into the model", 0, len(added_ops))
         else:
             self._log_info("Edited model is invalid. Running this may produce unexpected result")
+            for error in self._verifier.errors:
+                self._log_info(error)
+        phase_time = self._record_timing('validation', phase_time)
 
-        self._log_info("Editing model for LMS, took: {} ms".format(
-            (time.time()-start_time)*1000))
+        self._log_info("Editing model for LMS, took: {} ms", 0,
+                       (time.time()-start_time)*1000)
         self._log_info(
-            "{} tensors will be swapped out(in) to(from) the host".format(
-                self._incpu_count))
-        return (new_reachable_ops - reachable_ops)
+            "{} tensors will be swapped out(in) to(from) the host", 0,
+            self._incpu_count)
+        if any(self._ctrld_rejections.values()):
+            self._log_info("Rejected {} control dependency candidates and "
+                           "left {} swap-ins without a control dependency, "
+                           "to avoid cycles and late swap-ins", 0,
+                           self._ctrld_rejections['candidates'],
+                           self._ctrld_rejections['dropped'])
+        self._check_host_memory()
+        self._record_timing('host_memory_estimation', phase_time)
+        self._log_info("Timing breakdown (ms): {}", 1,
+                       lambda: list(self._timings.items()))
+        return added_ops
+
+    def _record_timing(self, phase, phase_time):
+        """Record the time spent in `phase` since `phase_time` and return the
+        current time.
+        """
+        now = time.time()
+        self._timings[phase] = (now - phase_time) * 1000
+        return now
+
+    def _get_host_mem_limit_bytes(self):
+        """Return the host memory limit in bytes.
+        """
+        limit_mb = self._host_mem_limit_mb
+        if limit_mb is None:
+            limit_mb = memory.get_host_mem_limit_mb()
+        return limit_mb * (1 << 20)
+
+    def _check_host_memory(self, swap_plan=None):
+        """Estimate the host memory needed by the swapped tensors and
+        compare it with the host memory limit.
+
+        Args:
+          swap_plan: a `SwapPlan`. Default `None` (the plan of the last
+            run).
+        """
+        self._host_memory = memory.estimate_host_memory(
+            swap_plan or self._plan, self._host_mem_headroom)
+        self._log_info("Peak host memory for swapped tensors: {} MB", 0,
+                       lambda: self._host_memory['peak_bytes'] >> 20)
+        for device, nbytes in sorted(
+                self._host_memory['device_peak_bytes'].items()):
+            self._log_info("Peak host memory for tensors on {}: {} MB", 1,
+                           device or 'unassigned devices', nbytes >> 20)
+        self._log_info("Recommended TF_CUDA_HOST_MEM_LIMIT_IN_MB: {}", 0,
+                       self._host_memory['recommended_limit_mb'])
+
+        if self._host_mem_check not in {HOSTMEM_Check.WARN,
+                                        HOSTMEM_Check.ERROR}:
+            return
+        needed = self._host_memory['recommended_limit_mb'] * (1 << 20)
+        limit = self._get_host_mem_limit_bytes()
+        if needed <= limit:
+            return
+        message = ('The swapped tensors need about {} MB of host memory but '
+                   'the host memory limit is {} MB. Set '
+                   'TF_CUDA_HOST_MEM_LIMIT_IN_MB to at least {}.'.format(
+                       needed >> 20, limit >> 20,
+                       self._host_memory['recommended_limit_mb']))
+        if self._host_mem_check is HOSTMEM_Check.ERROR:
+            raise ValueError(message)
+        tf.logging.warning("[LMS] {}".format(message))
+
+    def _reserve_host_memory(self, swap):
+        """Reserve host memory for a swapped tensor if it fits within the
+        host memory limit.
+
+        The tensor is on the host during `memory.get_host_interval` of its
+        swap record, as when the peak host memory is estimated.
+
+        Args:
+          swap: a swap record of `SwapPlan`, or a dictionary with the order
+            of the operation producing the tensor (`order`), its size in
+            bytes (`nbytes`) and the orders of the consuming operations of
+            each swap-in (`swapins`).
+
+        Return:
+          True if the memory is reserved, False if the limit is exceeded.
+        """
+        interval = self._get_host_interval(swap)
+        if interval is None:
+            return True
+        start, end = interval
+        budget = self._get_host_mem_limit_bytes() / self._host_mem_headroom
+        if len(self._host_load) <= end:
+            self._host_load.extend([0] * (end + 1 - len(self._host_load)))
+        if max(self._host_load[start:end + 1]) + swap['nbytes'] > budget:
+            return False
+        for order in range(start, end + 1):
+            self._host_load[order] += swap['nbytes']
+        return True
+
+    def _release_host_memory(self, swap):
+        """Release the host memory reserved for a swapped tensor.
+
+        Args:
+          swap: a swap record given to `_reserve_host_memory`.
+        """
+        interval = self._get_host_interval(swap)
+        if interval is None:
+            return
+        for order in range(interval[0], interval[1] + 1):
+            self._host_load[order] -= swap['nbytes']
+
+    def _get_host_interval(self, swap):
+        """Return `memory.get_host_interval` of a swap record, or `None` if
+        the tensor is not swapped in or its producer has no order.
+        """
+        if not any(swapin['orders'] for swapin in swap['swapins']):
+            return None
+        start, end = memory.get_host_interval(swap)
+        if start < 0:
+            return None
+        return (start, end)
+
+    def _get_swapin_orders(self, bw_frontier_ops):
+        """Return the orders of the consuming operations of each swap-in
+        that will be added for `bw_frontier_ops`, fused as by
+        `_fuse_swapin_ops`.
+
+        Args:
+          bw_frontier_ops: a set of `tf.Operation`.
+
+        Return:
+          A list of lists of integers.
+        """
+        ops = {op for op in bw_frontier_ops
+               if self._topo_sort.get_order(op) >= 0}
+        groups = []
+        if self._fuse_swapins:
+            fuse_ops = {op for op in ops if self._topo_sort.get_order(op) > 0}
+            groups = [group for group in self._get_fuse_groups(fuse_ops)
+                      if len(group) > 1]
+            ops -= {op for group in groups for op in group}
+        groups += [[op] for op in ops]
+        return [[self._topo_sort.get_order(op) for op in group]
+                for group in groups]
+
+    def apply_plan(self, swap_plan, graph=None):
+        """Edit the graph by adding the swapin and swapout ops of a plan
+        made by a previous run on an identical graph, without analyzing the
+        graph again.
+
+        The graph is modified in-place.
+
+        Args:
+          swap_plan: a `SwapPlan`, e.g. `lms_obj.plan` of a previous run or
+            a plan loaded with `SwapPlan.from_json`.
+          graph: the graph to modify. Default `None` (the graph given to
+            this object).
+
+        Return:
+          a set of added ops, empty if the graph has already been edited.
+        """
+        if graph:
+            self._graph = graph
+        if not self._graph:
+            raise ValueError('The dataflow graph is required but has not been'
+                             ' provided.')
+        if any(op.name.startswith('lms/swap')
+               for op in self._graph.get_operations()):
+            self._log_info('This model has already been updated with LMS '
+                           'swap operations. LMS will not re-process it.')
+            return set()
+        # check the plan before editing the graph
+        self._check_host_memory(swap_plan)
+        return self._apply_plan(swap_plan)
+
+    def _apply_plan(self, swap_plan):
+        """Edit the graph by adding the swapin and swapout ops of a plan.
+
+        Args:
+          swap_plan: a `SwapPlan`.
+
+        Return:
+          a set of added ops.
+        """
+        start_time = time.time()
+        plan_dict = swap_plan.to_dict()
+        # resolve every name before modifying the graph
+        try:
+            for swap in plan_dict['swaps']:
+                self._graph.get_tensor_by_name(swap['tensor'])
+                names = [swap['src_op'], swap['swapout_ctrld_op']]
+                for swapin in swap['swapins']:
+                    names += swapin['dest_ops'] + [swapin['ctrld_op']]
+                for name in names:
+                    if name:
+                        self._graph.get_operation_by_name(name)
+        except (KeyError, ValueError) as e:
+            raise ValueError('The swap plan does not match the graph: '
+                             '{}'.format(e))
+
+        ops_before = set(self._graph.get_operations())
+        self._plan = plan.SwapPlan()
+        self._plan.size = plan_dict['size']
+        self._plan.bw_starting_order = plan_dict['bw_starting_order']
+        self._plan.level_sizes = plan_dict['level_sizes']
+        # swap-in op names in the plan -> new swap-in ops
+        swapin_ops = {}
+        for swap in plan_dict['swaps']:
+            ts0 = self._graph.get_tensor_by_name(swap['tensor'])
+            src_op = self._graph.get_operation_by_name(swap['src_op'])
+            with self._cpu_device_scope(src_op):
+                swapout_op = tf.identity(ts0, name="lms/swapout").op
+            src_out_idx = ge.sgv(src_op, graph=self._graph).output_index(ts0)
+            self._connect_ops(src_op, swapout_op, remap_outputs=True,
+                              idx=src_out_idx)
+            self._plan.add_swapout(ts0, src_op, swapout_op, swap['order'],
+                                   swap['nbytes'], swap['device'])
+            self._incpu_count += 1
+
+            for swapin in swap['swapins']:
+                with self._cpu_device_scope(src_op):
+                    swapin_op = tf.identity(ts0, name="lms/swapin").op
+                self._connect_ops(swapout_op, swapin_op)
+                dest_ops = [self._graph.get_operation_by_name(name)
+                            for name in swapin['dest_ops']]
+                for dest_op in dest_ops:
+                    input_idx = ge.sgv(dest_op,
+                                       graph=self._graph).input_index(ts0)
+                    self._connect_ops(swapin_op, dest_op, remap_inputs=True,
+                                      idx=input_idx)
+                self._plan.add_swapin(ts0, swapin_op, dest_ops,
+                                      swapin['orders'])
+                swapin_ops[swapin['swapin_op']] = swapin_op
+                if swapin['ctrld_op']:
+                    ctrld_op = self._graph.get_operation_by_name(
+                        swapin['ctrld_op'])
+                    ge.add_control_inputs(swapin_op, ctrld_op)
+                    self._plan.add_control_dependency(
+                        swapin_op, ctrld_op, swapin['ctrld_order'])
+
+            if swap['swapout_ctrld_op']:
+                ctrld_op = self._graph.get_operation_by_name(
+                    swap['swapout_ctrld_op'])
+                ge.add_control_inputs(swapout_op, ctrld_op)
+                self._plan.add_swapout_dependency(
+                    ts0, ctrld_op, swap['swapout_ctrld_order'])
+
+        for swap in plan_dict['swaps']:
+            for swapin in swap['swapins']:
+                swapin_op = swapin_ops[swapin['swapin_op']]
+                for name in swapin['after']:
+                    ge.add_control_inputs(swapin_op, swapin_ops[name])
+                    self._plan.add_swapin_dependency(swapin_op,
+                                                     swapin_ops[name])
+
+        self._log_info("Applying the LMS plan, took: {} ms", 0,
+                       (time.time()-start_time)*1000)
+        self._log_info(
+            "{} tensors will be swapped out(in) to(from) the host", 0,
+            self._incpu_count)
+        return set(self._graph.get_operations()) - ops_before
 
     def _do_action(self, src_ops):
         """Add swapin and swapout ops for ops that are reachable from `src_ops`.
@@ -392,8 +994,100 @@ class LMS(object):
 
             closed_set.add(src_op)
 
+    def _get_candidate_tensors(self, src_ops):
+        """Return the tensors of the ops reachable from `src_ops` in the
+        forward phase, with their benefit of swapping.
+
+        Args:
+          src_ops: a list of `tf.Operation`
+
+        Return:
+          A list of (benefit, order, name, `tf.Tensor`) sorted by
+          decreasing benefit.
+        """
+        open_set = Queue.Queue()
+        closed_set = set()
+        for op in src_ops:
+            open_set.put(op)
+
+        candidates = []
+        while not open_set.empty():
+            src_op = open_set.get()
+            closed_set.add(src_op)
+            order = self._topo_sort.get_order(src_op)
+            next_ops = set()
+            for t in src_op.outputs:
+                frontier_ops = set(util.get_consuming_ops(t))
+                next_ops |= frontier_ops - self._grad_ops
+                if src_op in self._excl_ops or order < 0:
+                    continue
+                if self._incl_ops and src_op not in self._incl_ops:
+                    continue
+                lifetime = max([self._topo_sort.get_order(op)
+                                for op in frontier_ops] + [order]) - order
+                benefit = self._benefit_fn(
+                    t, memory.get_tensor_size(t, self._batch_size), lifetime)
+                candidates.append((benefit, order, t.name, t))
+
+            for op in next_ops:
+                if op in closed_set:
+                    continue
+                if op not in open_set.queue:
+                    open_set.put(op)
+
+        # ties are broken by the order and the name to be deterministic
+        candidates.sort(key=lambda c: (-c[0], c[1], c[2]))
+        return candidates
+
+    def _do_priority_action(self, src_ops):
+        """Add swapin and swapout ops for the tensors of ops reachable from
+        `src_ops`, in decreasing order of benefit.
+
+        Args:
+          src_ops: a list of `tf.Operation`
+        """
+        candidates = self._get_candidate_tensors(src_ops)
+        self._log_info("Candidate tensors by benefit: {}", 1,
+                       lambda: [(name, benefit)
+                                for benefit, _, name, _ in candidates])
+        for benefit, _, _, t in candidates:
+            if benefit <= 0:
+                break
+            self._insert_swap_nodes(t.op, [t])
+            if self._swapped_max_tensors():
+                return
+
+    def _get_fuse_groups(self, ops):
+        """Group ops for fusing their swapin ops.
+
+        Ops are sorted by order, and an op joins the group of the previous
+        op if its order is at most `fuse_window` levels after the order of
+        the first op of that group.
+
+        Args:
+          ops: a set of `tf.Operation`.
+
+        Return:
+          A list of lists of `tf.Operation`, sorted by order.
+        """
+        ops = sorted(ops, key=lambda op: (self._topo_sort.get_order(op),
+                                          op.name))
+        if self._fuse_window is None:
+            return [ops] if ops else []
+        groups = []
+        first_order = 0
+        for op in ops:
+            order = self._topo_sort.get_order(op)
+            if groups and order - first_order <= self._fuse_window:
+                groups[-1].append(op)
+            else:
+                groups.append([op])
+                first_order = order
+        return groups
+
     def _fuse_swapin_ops(self, src_op, swapout_op, bw_frontier_ops, ts0):
-        """Fuse all swapin ops that swaps in the same tensor.
+        """Fuse the swapin ops that swap in the same tensor for ops within
+        `fuse_window` levels of each other.
 
         This method does an in-place modification to the graph.
 
@@ -409,8 +1103,10 @@ class LMS(object):
         fuse_bw_frontier_ops = {
             op for op in bw_frontier_ops
             if self._topo_sort.get_order(op) > 0}
-        if len(fuse_bw_frontier_ops) >= 2:
-            with tf.device(self._cpu_device):
+        for fuse_ops in self._get_fuse_groups(fuse_bw_frontier_ops):
+            if len(fuse_ops) < 2:
+                continue
+            with self._cpu_device_scope(src_op):
                 swap_in = tf.identity(ts0, name="lms/swapin")
 
             # Connect: swap_out -> swap_in
@@ -418,103 +1114,101 @@ class LMS(object):
             self._excl_ops.add(swap_in.op)
 
             # reuse swap_in tensors
-            for op in fuse_bw_frontier_ops:
+            for op in fuse_ops:
                 # Connect: swap_in -> dest
                 input_idx = ge.sgv(
                     op, graph=self._graph).input_index(ts0)
                 self._connect_ops(swap_in.op, op, remap_inputs=True,
                                   idx=input_idx)
 
-                self._log_info(
-                    "{} (order {}) reuses tensor {}".format(
-                        op.name,
-                        self._topo_sort.get_order(op),
-                        ts0.name),
-                    1)
-
-            # control dependency -> swap_in
-            min_order = self._topo_sort.size + 1
-            earliest_op = None
-            for op in fuse_bw_frontier_ops:
-                order = self._topo_sort.get_order(op)
-                if order < min_order:
-                    min_order = order
-                    earliest_op = op
-            if earliest_op:
-                self._add_control_dependency(src_op, earliest_op, swap_in.op)
-            bw_frontier_ops -= fuse_bw_frontier_ops
+                self._log_info("{} (order {}) reuses tensor {}", 1,
+                               lambda: op.name,
+                               lambda: self._topo_sort.get_order(op),
+                               lambda: ts0.name)
+                self._tracer.record(
+                    tracer.SWAP_IN, tensor=ts0, swapin_op=swap_in.op,
+                    dest_op=op,
+                    order=lambda op=op: self._topo_sort.get_order(op),
+                    fused=True)
+            self._plan.add_swapin(ts0, swap_in.op, fuse_ops,
+                                  [self._topo_sort.get_order(op)
+                                   for op in fuse_ops])
+            if self._verifier:
+                self._verifier.check_swapin(ts0, swap_in.op, fuse_ops)
+
+            # control dependency -> swap_in, triggered for the earliest op
+            self._add_control_dependency(src_op, fuse_ops[0], swap_in.op)
+            bw_frontier_ops -= set(fuse_ops)
         return bw_frontier_ops
 
-    def _get_branch_ops(self, within_ops, threshold=0):
-        """Get ops whose order compared to the minimum order
-        is greater than the threshold.
-
-        Args:
-          within_ops: a set of `tf.Operation`.
-          threshold: an integer.
-
-        Return:
-          A set of `tf.Operation`.
-        """
-        orders = {self._topo_sort.get_order(op)
-                  for op in within_ops}
-        if not orders:
-            return set()
-        min_order = min(orders) + threshold
-        branch_ops = {
-            op
-            for op in within_ops
-            if (self._topo_sort.get_order(op) > min_order)}
-        return branch_ops
-
-    def _insert_swap_nodes(self, src_op):
+    def _insert_swap_nodes(self, src_op, tensors=None):
         """Insert swapin and swapout ops for the given operation into the graph.
 
         This method does an in-place modification to the graph.
 
         Args:
           src_op: a `tf.Operation`
+          tensors: a list of output `tf.Tensor` of `src_op` to swap.
+            Default `None` (all outputs).
         """
-        self._log_info("Operation: {}".format(src_op), 2)
+        self._log_info("Operation: {}", 2, src_op)
 
         # bypass excluded ops
         if src_op in self._excl_ops:
+            self._tracer.record(tracer.SKIP, op=src_op, reason='excluded')
             return
 
         # if inclusive mode is enabled, only proceed if this op is included
         if self._incl_ops:
             if src_op not in self._incl_ops:
+                self._tracer.record(tracer.SKIP, op=src_op,
+                                    reason='not_included')
                 return
 
-        for t in src_op.outputs:
+        for t in (src_op.outputs if tensors is None else tensors):
             if self._swapped_max_tensors():
                 return
 
             frontier_ops = set(util.get_consuming_ops(t))
-            self._log_info("my frontier ops: {}".format(frontier_ops), 2)
+            self._log_info("my frontier ops: {}", 2, frontier_ops)
 
-            bw_frontier_ops = frontier_ops & self._grad_ops
-            self._log_info("my bw frontier ops: {}".format(bw_frontier_ops), 2)
-
-            # swap branch ops if they are far enough (depending on threshold)
-            if self._swap_branches:
-                fw_branch_ops = self._get_branch_ops(
-                    frontier_ops - self._grad_ops,
-                    self._branch_threshold)
-                bw_frontier_ops = bw_frontier_ops | fw_branch_ops
+            # the consumers reading the tensor from a swap-in
+            bw_frontier_ops = set(self._swap_policy.select_dest_ops(
+                self._get_swap_candidate(src_op, t, frontier_ops)))
+            self._log_info("my bw frontier ops: {}", 2, bw_frontier_ops)
+            fw_swapins = bool(bw_frontier_ops - self._grad_ops)
 
             # Do not swap tensors used by bw ops without outgoing ops.
             # These bw ops can be removed by Tensorflow compiler
-            bw_frontier_ops = {op
-                               for op in bw_frontier_ops
-                               if set(self._get_forward_walk_ops(op, inclusive=False))}
+            if not self._inference:
+                bw_frontier_ops = {
+                    op for op in bw_frontier_ops
+                    if set(self._get_forward_walk_ops(op, inclusive=False))}
 
             if not bw_frontier_ops:
+                self._tracer.record(tracer.SKIP, op=src_op, tensor=t,
+                                    reason='no_bw_consumers')
                 continue
 
-            self._log_info("Operation: {}, order {}, type {}".format(
-                src_op.name, self._topo_sort.get_order(src_op),
-                src_op.type), 1)
+            host_swap = None
+            if self._host_mem_check is HOSTMEM_Check.TRIM:
+                # the swap-out is not scheduled yet, so the tensor is
+                # assumed to be on the host from its producer
+                host_swap = {'order': self._topo_sort.get_order(src_op),
+                             'nbytes': memory.get_tensor_size(
+                                 t, self._batch_size),
+                             'swapins': [{'orders': orders} for orders in
+                                         self._get_swapin_orders(
+                                             bw_frontier_ops)]}
+                if not self._reserve_host_memory(host_swap):
+                    self._tracer.record(tracer.SKIP, op=src_op, tensor=t,
+                                        reason='host_mem_limit')
+                    continue
+
+            self._log_info("Operation: {}, order {}, type {}", 1,
+                           lambda: src_op.name,
+                           lambda: self._topo_sort.get_order(src_op),
+                           lambda: src_op.type)
 
             # create swap_out node only if there exists a real dest. operation
             swapout_op = None
@@ -522,6 +1216,13 @@ class LMS(object):
                 if self._topo_sort.get_order(op) >= 0:
                     swapout_op = self._add_swapout(src_op, t)
                     self._incpu_count = self._incpu_count + 1
+                    self._plan.add_swapout(
+                        t, src_op, swapout_op,
+                        self._topo_sort.get_order(src_op),
+                        memory.get_tensor_size(t, self._batch_size),
+                        src_op.device)
+                    if self._verifier:
+                        self._verifier.check_swapout(t, swapout_op)
                     break
 
             # create swap_in nodes
@@ -539,9 +1240,24 @@ class LMS(object):
                 else:
                     # swap_in op
                     swapin_op = self._add_swapin(swapout_op, dest_op, t)
+                    self._plan.add_swapin(t, swapin_op, [dest_op],
+                                          [self._topo_sort.get_order(dest_op)])
+                    if self._verifier:
+                        self._verifier.check_swapin(t, swapin_op, [dest_op])
                     # control dependency -> swap_in
                     self._add_control_dependency(src_op, dest_op, swapin_op)
 
+            # control dependency -> swap_out
+            if (swapout_op and
+                    self._swapout_policy is not SWAPOUT_Policy.NONE):
+                self._schedule_swapout(src_op, swapout_op, t, fw_swapins)
+
+            if host_swap is not None:
+                # keep the memory of the swapped tensor from its swap-out
+                self._release_host_memory(host_swap)
+                if swapout_op:
+                    self._reserve_host_memory(self._plan.get_swap(t))
+
     def _add_swapout(self, src_op, ts0):
         """Add a swapout operation to the graph to swap out the output tensor `ts0`
         of the operation `src_op`.
@@ -565,7 +1281,7 @@ class LMS(object):
         Return:
           A `tf.Operation` newly added to the graph.
         """
-        with tf.device(self._cpu_device):
+        with self._cpu_device_scope(src_op):
             swap_out = tf.identity(ts0, name="lms/swapout")
 
         # Connect: src-node -> swap-out
@@ -574,11 +1290,129 @@ class LMS(object):
         self._connect_ops(src_op, swap_out.op, remap_outputs=True,
                           idx=src_out_idx)
         self._excl_ops.add(swap_out.op)
-        self._log_info("Tensor {} will be placed on {}".format(
-            ts0.name, self._cpu_device), 1)
+        self._log_info("Tensor {} will be placed on {}", 1,
+                       lambda: ts0.name, self._cpu_device)
+        self._tracer.record(tracer.SWAP_OUT, tensor=ts0, src_op=src_op,
+                            swapout_op=swap_out.op,
+                            order=lambda: self._topo_sort.get_order(src_op))
 
         return swap_out.op
 
+    def _get_swap_candidate(self, src_op, ts0, frontier_ops):
+        """Return the description of the tensor `ts0` given to
+        `SwapPolicy.select_dest_ops`.
+
+        Args:
+          src_op: a `tf.Operation` that produces the tensor `ts0`.
+          ts0: a `tf.Tensor`.
+          frontier_ops: a set of `tf.Operation` consuming `ts0`.
+
+        Return:
+          A dictionary.
+        """
+        dims = ts0.shape.dims
+        return {'tensor': ts0,
+                'src_op': src_op,
+                'order': self._topo_sort.get_order(src_op),
+                'shape': (None if dims is None
+                          else [dim.value for dim in dims]),
+                'nbytes': memory.get_tensor_size(ts0, self._batch_size),
+                'consumers': {op: self._topo_sort.get_order(op)
+                              for op in frontier_ops},
+                'bw_consumers': frontier_ops & self._grad_ops,
+                'inference': self._inference}
+
+    def _schedule_swapout(self, src_op, swapout_op, ts0, fw_swapins=False):
+        """Add a control dependency to the swap-out op `swapout_op`
+        according to the swap-out policy.
+
+        This method must be called once the swap-in ops of `ts0` are
+        connected, so that the remaining consumers of `ts0` are the ones that
+        read it from the device.
+
+        This method does an in-place modification to the graph.
+
+        Args:
+          src_op: a `tf.Operation` that produces the tensor `ts0`.
+          swapout_op: a `tf.Operation` that swaps out `ts0`.
+          ts0: a `tf.Tensor`.
+          fw_swapins: If True, forward ops consume swap-ins of `ts0`.
+            Default `False`.
+        """
+        fw_consumers = [op for op in util.get_consuming_ops(ts0)
+                        if op is not swapout_op and op not in self._grad_ops and
+                        self._topo_sort.get_order(op) >= 0 and
+                        self._is_valid_ctrld_op(op, src_op, src_op)]
+        # When forward ops consume swapped in tensors, they may depend on
+        # the swap-out op, so a control dependency could create a cycle.
+        swapout_walk = set()
+        if self._swap_branches or self._inference or fw_swapins:
+            swapout_walk = set(ge.get_forward_walk_ops(swapout_op))
+            fw_consumers = [op for op in fw_consumers
+                            if op not in swapout_walk]
+        if not fw_consumers:
+            return
+
+        # the last forward consumer, ties are broken by name
+        last_op = max(fw_consumers,
+                      key=lambda op: (self._topo_sort.get_order(op), op.name))
+        ctrld_op = last_op
+        ctrld_order = self._topo_sort.get_order(last_op)
+
+        if self._swapout_policy is SWAPOUT_Policy.SPREAD:
+            ctrld_op, ctrld_order = self._get_spread_swapout_op(
+                src_op, last_op, ctrld_order, swapout_walk)
+            self._swapout_load[ctrld_order] = (
+                self._swapout_load.get(ctrld_order, 0) + 1)
+
+        ge.add_control_inputs(swapout_op, ctrld_op)
+        self._log_info("Swap-out control dependency op {}, order: {}", 1,
+                       lambda: ctrld_op.name, ctrld_order)
+        self._tracer.record(tracer.CTRL_DEP, swapout_op=swapout_op,
+                            ctrld_op=ctrld_op, order=ctrld_order,
+                            fw_op=src_op)
+        self._plan.add_swapout_dependency(ts0, ctrld_op, ctrld_order)
+        if self._verifier:
+            self._verifier.check_control_dependency(swapout_op, ctrld_op)
+
+    def _get_spread_swapout_op(self, src_op, last_op, last_order,
+                               swapout_walk=frozenset()):
+        """Find the operation triggering a swap-out with the `spread`
+        policy.
+
+        The order with the fewest swap-outs among the `swapout_window`
+        orders starting at `last_order` is chosen. Orders in the backward
+        phase are not considered.
+
+        Args:
+          src_op: a `tf.Operation` that produces the swapped tensor.
+          last_op: a `tf.Operation`, the last forward consumer.
+          last_order: an integer, the order of `last_op`.
+          swapout_walk: a set of `tf.Operation` reachable from the swap-out
+            op, e.g. forward consumers of its swap-ins. They are not
+            considered, since they would add a cycle. Default empty.
+
+        Return:
+          A tuple of (`tf.Operation`, an `integer`).
+        """
+        upper = last_order + self._swapout_window
+        if self._topo_sort.bw_starting_order >= 0:
+            upper = min(upper, self._topo_sort.bw_starting_order)
+        best = (self._swapout_load.get(last_order, 0), last_order, last_op)
+        for order in range(last_order + 1, upper):
+            load = self._swapout_load.get(order, 0)
+            if load >= best[0]:
+                continue
+            candidates = sorted(self._topo_sort.get_ops(order) -
+                                self._grad_ops, key=lambda op: op.name)
+            candidates = [op for op in candidates
+                          if not op.name.startswith('lms/swap') and
+                          op not in swapout_walk and
+                          self._is_valid_ctrld_op(op, src_op, src_op)]
+            if candidates:
+                best = (load, order, candidates[0])
+        return (best[2], best[1])
+
     def _add_swapin(self, swapout_op, dest_op, ts0):
         """Add a swapin operation to the graph. The swapin ops reads
         the output tensor of `swapout_op` and passes it to `dest_op`,
@@ -604,7 +1438,7 @@ class LMS(object):
         Return:
           A `tf.Operation` newly added to the graph.
         """
-        with tf.device(self._cpu_device):
+        with self._cpu_device_scope(ts0.op):
             swap_in = tf.identity(ts0, name="lms/swapin")
 
         # Connect: swap_out -> swap_in
@@ -616,9 +1450,14 @@ class LMS(object):
         self._connect_ops(swap_in.op, dest_op, remap_inputs=True, idx=input_idx)
         self._excl_ops.add(swap_in.op)
 
-        self._log_info("Consuming op {} (order {}) swaps in {}".format(
-            dest_op.name, self._topo_sort.get_order(dest_op),
-            ts0.name), 1)
+        self._log_info("Consuming op {} (order {}) swaps in {}", 1,
+                       lambda: dest_op.name,
+                       lambda: self._topo_sort.get_order(dest_op),
+                       lambda: ts0.name)
+        self._tracer.record(tracer.SWAP_IN, tensor=ts0,
+                            swapin_op=swap_in.op, dest_op=dest_op,
+                            order=lambda: self._topo_sort.get_order(dest_op),
+                            fused=False)
 
         return swap_in.op
 
@@ -634,11 +1473,19 @@ class LMS(object):
         """
         # if lb is out of range, reset it to make sure
         # that a control dependency op will be found
-        lb = self._lb
-        if (self._topo_sort.get_order(bw_op) - lb <=
-                self._topo_sort.get_order(fw_op)):
-            lb = 1
-        if fw_op in self._grad_ops:
+        lb = self._get_lb(swapin_op, fw_op, bw_op)
+        gap = (self._topo_sort.get_order(bw_op) -
+               self._topo_sort.get_order(fw_op))
+        if lb >= gap:
+            ts0 = self._plan.get_swapped_tensor(swapin_op)
+            if ts0 is not None and ts0.name in self._prefetch_distances:
+                # a prefetch distance of the tensor is clamped, so the
+                # swap-in is still triggered as early as possible
+                lb = max(gap - 1, 1)
+            else:
+                lb = 1
+        if fw_op in self._grad_ops or self._inference:
+            # there is no chain rule path without a backward phase
             re = self._do_direct_order(fw_op, bw_op, lb, self._ub)
         elif self._ctrld_strategy is CTRLD_Strategy.CHAIN_RULE:
             re = self._do_chain_rule(fw_op, bw_op, lb, self._ub)
@@ -649,15 +1496,141 @@ class LMS(object):
 
         ctrld_op = re[0]
         ctrld_order = re[1]
+        if ctrld_op and (self._max_inflight_swapins or
+                         self._max_inflight_swapin_bytes):
+            ctrld_op, ctrld_order = self._throttle_swapin(
+                fw_op, bw_op, swapin_op, ctrld_op, ctrld_order)
+        if ctrld_op and self._verifier:
+            dest_ops = [op for t in swapin_op.outputs
+                        for op in t.consumers()]
+            if not self._is_safe_ctrld_op(ctrld_op, dest_ops):
+                self._ctrld_rejections['dropped'] += 1
+                ctrld_op = None
         if ctrld_op:
             ge.add_control_inputs(swapin_op, ctrld_op)
-            self._log_info(
-                "Control dependency op {},  order: {}".format(
-                    ctrld_op.name, ctrld_order), 1)
+            self._log_info("Control dependency op {},  order: {}", 1,
+                           lambda: ctrld_op.name, ctrld_order)
+            self._tracer.record(tracer.CTRL_DEP, swapin_op=swapin_op,
+                                ctrld_op=ctrld_op, order=ctrld_order,
+                                fw_op=fw_op, bw_op=bw_op)
+            self._plan.add_control_dependency(swapin_op, ctrld_op,
+                                              ctrld_order)
+            if self._verifier:
+                self._verifier.check_control_dependency(swapin_op, ctrld_op)
+                self._verifier.check_swapin_trigger(
+                    fw_op, swapin_op, ctrld_op,
+                    [op for t in swapin_op.outputs for op in t.consumers()])
         else:
             self._log_info(
-                "No control dependency op needed for swap in of op {}.".format(
-                    fw_op.name), 1)
+                "No control dependency op needed for swap in of op {}.", 1,
+                lambda: fw_op.name)
+            self._tracer.record(tracer.SKIP, op=fw_op, swapin_op=swapin_op,
+                                reason='no_ctrld_op')
+
+    def _throttle_swapin(self, fw_op, bw_op, swapin_op, ctrld_op,
+                         ctrld_order):
+        """Keep the swap-ins triggered at the same order within
+        `max_inflight_swapins` and `max_inflight_swapin_bytes`.
+
+        Swap-ins triggered at the same order are grouped into waves. A wave
+        is full once it reaches one of the limits. With the `chain` strategy,
+        every swap-in of a new wave waits for the swap-ins of the previous
+        wave. With the `stagger` strategy, the control dependency op is first
+        moved to earlier orders until a wave with room is found.
+
+        This method does an in-place modification to the graph.
+
+        Args:
+          fw_op: a `tf.Operation` that has a tensor swapped out.
+          bw_op: a `tf.Operation` that consumes a tensor swapped in.
+          swapin_op: a `tf.Operation`.
+          ctrld_op: a `tf.Operation`, the control dependency op found for
+            `swapin_op`.
+          ctrld_order: an integer, the order of `ctrld_op`.
+
+        Return:
+          A tuple of (`tf.Operation`, an `integer`), the control dependency
+          operation to use and its order.
+        """
+        nbytes = 0
+        if self._max_inflight_swapin_bytes:
+            ts0 = self._plan.get_swapped_tensor(swapin_op)
+            if ts0 is not None:
+                nbytes = memory.get_tensor_size(ts0, self._batch_size)
+
+        if self._swapin_throttle is THROTTLE_Strategy.STAGGER:
+            bw_order = self._topo_sort.get_order(bw_op)
+            op, order = ctrld_op, ctrld_order
+            while op and self._is_wave_full(
+                    self._swapin_waves.get(order, [[]])[-1], nbytes):
+                # the next candidate is at least one order earlier
+                op, order = self._do_direct_order(fw_op, bw_op,
+                                                  bw_order - order,
+                                                  self._ub)
+            if op:
+                self._swapin_waves.setdefault(order, [[]])[-1].append(
+                    (swapin_op, nbytes))
+                return (op, order)
+
+        waves = self._swapin_waves.setdefault(ctrld_order, [[]])
+        if self._is_wave_full(waves[-1], nbytes):
+            waves.append([])
+        if len(waves) > 1:
+            for prev_swapin_op, _ in waves[-2]:
+                # swap-in ops are named after LMS, not after the cond
+                # branches they run in
+                if not self._frames.is_valid_ctrld_op(prev_swapin_op,
+                                                      swapin_op):
+                    continue
+                ge.add_control_inputs(swapin_op, prev_swapin_op)
+                self._plan.add_swapin_dependency(swapin_op, prev_swapin_op)
+                if self._verifier:
+                    self._verifier.check_control_dependency(swapin_op,
+                                                            prev_swapin_op)
+            self._log_info("Swap-in {} waits for {} swap-ins at order {}", 1,
+                           lambda: swapin_op.name, len(waves[-2]),
+                           ctrld_order)
+        waves[-1].append((swapin_op, nbytes))
+        return (ctrld_op, ctrld_order)
+
+    def _is_wave_full(self, wave, nbytes):
+        """Check whether a swap-in of `nbytes` bytes can join `wave` or not.
+
+        Args:
+          wave: a list of (`tf.Operation`, an `integer`).
+          nbytes: an integer.
+        """
+        if not wave:
+            return False
+        if (self._max_inflight_swapins and
+                len(wave) >= self._max_inflight_swapins):
+            return True
+        if (self._max_inflight_swapin_bytes and
+                sum(b for _, b in wave) + nbytes >
+                self._max_inflight_swapin_bytes):
+            return True
+        return False
+
+    def _get_lb(self, swapin_op, fw_op=None, bw_op=None):
+        """Return the lower-bound value for the swap-in op `swapin_op`,
+        chosen by the swap policy.
+
+        Args:
+          swapin_op: a `tf.Operation`.
+          fw_op: a `tf.Operation` that has a tensor swapped out. Default
+            `None`.
+          bw_op: a `tf.Operation` that consumes a tensor swapped in. Default
+            `None`.
+
+        Return:
+          An integer, by default the prefetch distance of the tensor swapped
+          in by `swapin_op` if any, otherwise `lb`.
+        """
+        return self._swap_policy.get_prefetch_distance(
+            {'tensor': self._plan.get_swapped_tensor(swapin_op),
+             'swapin_op': swapin_op,
+             'fw_op': fw_op,
+             'bw_op': bw_op})
 
     def _find_new_src_op(self, original_op):
         """Find a set of new operations to swap out their output tensors.
@@ -775,7 +1748,7 @@ class LMS(object):
                 consumming_ops_bw = {
                     op
                     for op in consumming_ops_bw
-                    if "/cond/" not in op.name}
+                    if self._is_valid_swapin_ctrld_op(op, fw_op, bw_op)}
                 result_ops |= consumming_ops_bw
             # go to the next level
             next_ops = total_consumming_ops - self._grad_ops
@@ -793,8 +1766,8 @@ class LMS(object):
                 upper_b = upper_b - 1
                 while not open_set2.empty():
                     open_set1.put(open_set2.get())
-        if result_ops:
-            ctrld_op = next(iter(result_ops))
+        ctrld_op = self._select_ctrld_op(result_ops, fw_op, bw_op)
+        if ctrld_op:
             return (ctrld_op, self._topo_sort.get_order(ctrld_op))
         else:
             return (None, -1)
@@ -836,29 +1809,135 @@ class LMS(object):
                           if src_op in set(self._get_forward_walk_ops(op))}
             candidates = {op
                           for op in candidates
-                          if "/cond/" not in op.name}
+                          if self._is_valid_swapin_ctrld_op(op, fw_op, src_op)}
             if candidates:
                 result_ops |= candidates
                 ctrld_order = i
                 break
 
-        if result_ops:
-            ctrld_op = next(iter(result_ops))
+        ctrld_op = self._select_ctrld_op(result_ops, fw_op, src_op)
+        if ctrld_op:
             return (ctrld_op, ctrld_order)
         else:
             return (None, -1)
 
-    def _log_info(self, message, level=0):
+    def _select_ctrld_op(self, ctrld_ops, fw_op=None, bw_op=None):
+        """Choose a control dependency operation among candidates with the
+        swap policy.
+
+        Args:
+          ctrld_ops: a set of `tf.Operation`.
+          fw_op: a `tf.Operation` that has a tensor swapped out. Default
+            `None`.
+          bw_op: a `tf.Operation` that consumes a tensor swapped in. Default
+            `None`.
+
+        Return:
+          A `tf.Operation`, or `None` if there are no candidates or the
+          policy chose none.
+        """
+        if not ctrld_ops:
+            return None
+        ctrld_op = self._swap_policy.select_ctrld_op(
+            ctrld_ops, {'fw_op': fw_op, 'bw_op': bw_op,
+                        'topo_sort': self._topo_sort})
+        if ctrld_op is not None and ctrld_op not in ctrld_ops:
+            raise ValueError('The swap policy chose {}, which is not a '
+                             'candidate control dependency op.'.format(
+                                 ctrld_op.name))
+        return ctrld_op
+
+    def _is_valid_ctrld_op(self, ctrld_op, fw_op, bw_op):
+        """Check whether `ctrld_op` can trigger the swap-in of a tensor
+        produced by `fw_op` and consumed by `bw_op`.
+
+        Args:
+          ctrld_op: a `tf.Operation`.
+          fw_op: a `tf.Operation`.
+          bw_op: a `tf.Operation`.
+        """
+        if self._frame_aware:
+            return self._frames.is_valid_ctrld_op(ctrld_op, bw_op, fw_op)
+        # control edges between while loop frames are never valid
+        return ("/cond/" not in ctrld_op.name and
+                not self._frames.get_context(ctrld_op) and
+                self._frames.get_frame(ctrld_op) ==
+                self._frames.get_frame(fw_op))
+
+    def _is_valid_swapin_ctrld_op(self, ctrld_op, fw_op, bw_op):
+        """Check whether `ctrld_op` can trigger the swap-in of a tensor
+        produced by `fw_op` and consumed by `bw_op`, and whether it is safe.
+
+        Args:
+          ctrld_op: a `tf.Operation`.
+          fw_op: a `tf.Operation`.
+          bw_op: a `tf.Operation`.
+        """
+        if not self._is_valid_ctrld_op(ctrld_op, fw_op, bw_op):
+            return False
+        if self._verifier and not self._is_safe_ctrld_op(ctrld_op, [bw_op]):
+            self._ctrld_rejections['candidates'] += 1
+            return False
+        return True
+
+    def _is_safe_ctrld_op(self, ctrld_op, dest_ops):
+        """Check whether `ctrld_op` can trigger a swap-in consumed by
+        `dest_ops` without adding a cycle to the graph or delaying the
+        swap-in past its consumers.
+
+        The check is static: `ctrld_op` must be ordered before `dest_ops`
+        in the topological order, and `dest_ops` must not reach `ctrld_op`,
+        e.g. through the control dependencies of the graph.
+
+        Args:
+          ctrld_op: a `tf.Operation`.
+          dest_ops: a list of `tf.Operation`.
+        """
+        ctrld_order = self._topo_sort.get_order(ctrld_op)
+        for dest_op in dest_ops:
+            dest_order = self._topo_sort.get_order(dest_op)
+            if 0 <= dest_order <= ctrld_order:
+                reason = 'delays the swap-in past'
+            elif verify.reaches(self._topo_sort, dest_op, ctrld_op):
+                reason = 'adds a cycle through'
+            else:
+                continue
+            self._log_info("Control dependency op {} {} {}, rejected", 1,
+                           lambda: ctrld_op.name, reason,
+                           lambda: dest_op.name)
+            self._tracer.record(tracer.SKIP, op=ctrld_op, dest_op=dest_op,
+                                reason='unsafe_ctrld_op')
+            return False
+        return True
+
+    def _is_logging(self, level):
+        """Check whether messages at `level` will be logged or not.
+
+        Args:
+          level: an `integer`.
+        """
+        return level == 0 or (self._debug and self._debug_level >= level)
+
+    def _log_info(self, message, level=0, *args):
         """Log debug information.
 
+        The message is only formatted if it will be logged, so callers
+        should pass values to format as `args` rather than formatting them
+        beforehand. An arg that is callable is called at formatting time.
+
         Args:
-          message: a formatted string.
+          message: a format string, or a formatted string if `args` is empty.
           level: an `integer`.
+          args: values to format into `message`.
         """
-        if level == 0 or (self._debug and self._debug_level >= level):
-            # Use tf.logging.info instead of print, since print
-            # is not thread safe, which can break tests.
-            tf.logging.info("[LMS][{}] {}".format(level, message))
+        if not self._is_logging(level):
+            return
+        if args:
+            message = message.format(*[arg() if callable(arg) else arg
+                                       for arg in args])
+        # Use tf.logging.info instead of print, since print
+        # is not thread safe, which can break tests.
+        tf.logging.info("[LMS][{}] {}".format(level, message))
 
     def _print_configuration(self):
         """Print configuration information about LMS.
@@ -866,8 +1945,32 @@ class LMS(object):
         if self._n_tensors == 0:
             self._log_info("n_tensors: all tensors")
         else:
-            self._log_info("n_tensors: {}".format(self._n_tensors))
-        self._log_info("lb: {}".format(self._lb))
+            self._log_info("n_tensors: {}", 0, self._n_tensors)
+        self._log_info("lb: {}", 0, self._lb)
+
+    @contextlib.contextmanager
+    def _cpu_device_scope(self, op=None):
+        """Create operations in the graph being edited, on `cpu_device`.
+
+        The graph is made the default graph of the calling thread, so graphs
+        can be edited concurrently by several LMS objects.
+
+        Args:
+          op: a `tf.Operation`. If given, operations are created in its
+            control flow context, e.g. the body of a `tf.while_loop`, so
+            they run in the same frame as `op`. Default `None`.
+        """
+        with self._graph.as_default(), tf.device(self._cpu_device):
+            ctxt = op._get_control_flow_context() if op is not None else None
+            if ctxt is None:
+                yield
+                return
+            # the way TensorFlow adds gradient ops to a while loop
+            ctxt.Enter()
+            try:
+                yield
+            finally:
+                ctxt.Exit()
 
     def _connect_ops(self, src_op, dest_op, remap_inputs=False,
                      remap_outputs=False, idx=None, disconnect_first=False):
@@ -893,6 +1996,47 @@ class LMS(object):
 
         ge.connect(src_sgv, dest_sgv, disconnect_first)
 
+    @property
+    def host_memory(self):
+        """The host memory estimate of the last run, as returned by
+        `memory.estimate_host_memory`, or `None`.
+        """
+        return self._host_memory
+
+    @property
+    def plan(self):
+        """The `SwapPlan` recording the swapping decisions of the last run.
+        """
+        return self._plan
+
+    @property
+    def ctrld_rejections(self):
+        """A dictionary with the number of control dependency candidates
+        rejected by the last run because they would add a cycle or delay a
+        swap-in past its consumer (`candidates`), and the number of swap-ins
+        left without a control dependency for the same reason (`dropped`).
+        """
+        return dict(self._ctrld_rejections)
+
+    @property
+    def timings(self):
+        """An ordered dictionary of the phases of the last run to the time
+        spent in them, in milliseconds.
+        """
+        return self._timings
+
+    @property
+    def topo_sort(self):
+        """The `TOPOS` built by the last run, or `None`.
+        """
+        return self._topo_sort
+
+    @property
+    def tracer(self):
+        """The `Tracer` holding the events recorded when `trace` is enabled.
+        """
+        return self._tracer
+
     def _swapped_max_tensors(self):
         """Check whether we swapped enough tensors or not.
         """
@@ -903,22 +2047,148 @@ class LMS(object):
 class LMSSessionRunHook(tf.train.SessionRunHook):
     ''' This hook is to modify the input graph for Large Model Support
     by adding swap operations.
+
+    In adaptive mode, the hook also traces sampled steps, measures how long
+    operations wait on swap-ins, and recommends a prefetch distance for each
+    swapped tensor. The recommendation is applied the next time the graph is
+    edited, e.g. at the next `Estimator.train` call or after restarting from
+    a checkpoint when `adaptive_plan_path` is set.
     '''
-    def __init__(self, optimizer_scopes, **kwargs):
+    def __init__(self, optimizer_scopes, adaptive=False,
+                 adaptive_every_n_steps=100, adaptive_plan_path=None,
+                 plan_cache=True, plan_transport=None, **kwargs):
         """Create an LMSHook object to edit the graph for supporting large model.
 
         Args:
           optimizer_scopes: a set of scopes for the optimizers/solvers.
+          adaptive: If True, collect step stats of swap-in operations and
+                  recommend per-tensor prefetch distances. Default `False`.
+          adaptive_every_n_steps: trace one step out of every
+                  `adaptive_every_n_steps` steps in adaptive mode.
+                  Default `100`.
+          adaptive_plan_path: a JSON file where the recommended prefetch
+                  distances are saved at the end of the session and loaded
+                  from when the graph is edited. Default `None`.
+          plan_cache: If True, the swap plan is cached for the process and
+                  applied without analyzing the graph again when an identical
+                  graph is edited with the same parameters, e.g. at the next
+                  `Estimator.train` call. Default `True`.
+          plan_transport: In data-parallel jobs, rank 0 analyzes the graph
+                  and the other ranks apply its plan received through this
+                  transport, a `distributed.FileTransport`, a
+                  `distributed.CallableTransport`, a file path on a shared
+                  filesystem or a broadcast function. Default `None`.
           kwargs: the kwargs to pass to LMS. Note, the `graph` argument is
                   removed from the kwargs before initializing LMS because
                   the graph is obtained automatically by the SessionRunHook and
                   is generally not available at hook initilization time.
         """
         kwargs.pop('graph', None)
+        self._optimizer_scopes = optimizer_scopes
+        self._lms_args = kwargs
+        self._adaptive = adaptive
+        self._adaptive_every_n_steps = adaptive_every_n_steps
+        self._adaptive_plan_path = adaptive_plan_path
+        self._plan_cache = plan_cache
+        self._plan_transport = plan_transport
+        self._prefetch_distances = dict(kwargs.pop('prefetch_distances',
+                                                   None) or {})
+        self._profiler = None
+        self._step = 0
         self.lms_obj = LMS(optimizer_scopes, **kwargs)
 
     def begin(self):
-        self.lms_obj.run(tf.get_default_graph())
+        if self._adaptive_plan_path and os.path.exists(
+                self._adaptive_plan_path):
+            with open(self._adaptive_plan_path) as f:
+                self._prefetch_distances.update(json.load(f))
+        # LMS keeps state of the graph it edited, so a new object is
+        # needed each time the graph is rebuilt.
+        lms_args = dict(self._lms_args,
+                        prefetch_distances=dict(self._prefetch_distances))
+        self.lms_obj = LMS(self._optimizer_scopes, **lms_args)
+        graph = tf.get_default_graph()
+        if self._plan_cache:
+            _run_cached(self.lms_obj, graph, self._optimizer_scopes, lms_args,
+                        self._plan_transport)
+        else:
+            _run(self.lms_obj, graph, lms_args, self._plan_transport)
+        self._step = 0
+        if self._adaptive and len(self.lms_obj.plan):
+            self._profiler = adaptive.SwapProfiler(
+                self.lms_obj.plan, graph,
+                lb=self.lms_obj._lb, ub=self.lms_obj._ub)
+
+    def before_run(self, run_context):
+        if self._profiler is None:
+            return None
+        self._step += 1
+        if self._step % self._adaptive_every_n_steps != 0:
+            return None
+        options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+        return tf.train.SessionRunArgs(fetches=None, options=options)
+
+    def after_run(self, run_context, run_values):
+        if self._profiler is None:
+            return
+        if run_values.run_metadata.HasField('step_stats'):
+            self._profiler.add_step_stats(run_values.run_metadata.step_stats)
+
+    def end(self, session):
+        if self._profiler is None or not self._profiler.n_steps:
+            return
+        self._prefetch_distances = self._profiler.recommend(
+            self._prefetch_distances)
+        self.lms_obj._log_info(
+            "Recommended prefetch distances from {} sampled steps: {}", 0,
+            self._profiler.n_steps, self._prefetch_distances)
+        if self._adaptive_plan_path:
+            with open(self._adaptive_plan_path, 'w') as f:
+                json.dump(self._prefetch_distances, f, sort_keys=True)
+
+    @property
+    def prefetch_distances(self):
+        """A dictionary of tensor names to prefetch distances recommended
+        in adaptive mode and used the next time the graph is edited.
+        """
+        return self._prefetch_distances
+
+
+def _get_model_graph(model):
+    """Return the graph of a Keras model, or the default graph if the model
+    has no outputs yet.
+    """
+    outputs = getattr(model, 'outputs', None)
+    if outputs:
+        return outputs[0].graph
+    return tf.get_default_graph()
+
+
+def get_layer_output_op_names(model):
+    """Return the names of the operations producing the outputs of the
+    layers of a Keras model, for every call of each layer.
+
+    Layers depending on the learning phase, e.g. batch normalization, read
+    their inputs through the Switch ops of a `tf.cond`, so these Switch ops
+    are returned as well.
+
+    Args:
+      model: a `tf.keras.Model`.
+
+    Return:
+      A set of operation names.
+    """
+    names = set()
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.InputLayer):
+            continue
+        for node_index in range(len(layer._inbound_nodes)):
+            outputs = layer.get_output_at(node_index)
+            for t in tf.nest.flatten(outputs):
+                names.add(t.op.name)
+                names |= {op.name for op in t.consumers()
+                          if op.type in frames.SWITCH_TYPES}
+    return names
 
 
 class LMSKerasCallback(tf.keras.callbacks.Callback):
@@ -926,7 +2196,8 @@ class LMSKerasCallback(tf.keras.callbacks.Callback):
     during Keras training / fit by adding swap operations.
     """
 
-    def __init__(self, optimizer_scopes_override=None, **kwargs):
+    def __init__(self, optimizer_scopes_override=None, plan_cache=True,
+                 plan_transport=None, layer_granularity=False, **kwargs):
         """Create an LMSKerasCallback object to edit the graph for
            supporting large model tensor swapping when using TensorFlow Keras.
 
@@ -935,12 +2206,31 @@ class LMSKerasCallback(tf.keras.callbacks.Callback):
                 automatically discover the optimizer scopes from the Keras
                 model. This parameter allows overriding that automatic discovery
                 with a set of optimizer scope names.
+          plan_cache: If True, the swap plan is cached for the process and
+                applied without analyzing the graph again when an identical
+                graph is edited with the same parameters, e.g. at the next
+                `fit` call. Default `True`.
+          plan_transport: In data-parallel jobs, rank 0 analyzes the graph
+                and the other ranks apply its plan received through this
+                transport, a `distributed.FileTransport`, a
+                `distributed.CallableTransport`, a file path on a shared
+                filesystem or a broadcast function. Default `None`.
+          layer_granularity: If True, only the outputs of the layers of the
+                model are swapped, instead of the outputs of every operation.
+                Tensors inside a layer usually die right after they are
+                produced, and planning at layer boundaries is much faster.
+                The inputs of the model are used as starting ops unless
+                `starting_scope` or `starting_op_names` is given.
+                Default `False`.
           kwargs: the kwargs to pass to LMS. Note, the `graph` argument is
                   removed from the kwargs and not used for initializing LMS
                   because the graph is obtained automatically by the
                   Keras callback during the set_model method.
         """
         self._optimizer_scopes = optimizer_scopes_override
+        self._plan_cache = plan_cache
+        self._plan_transport = plan_transport
+        self._layer_granularity = layer_granularity
         self._lms_args = kwargs
         self._lms_args.pop('graph', None)
 
@@ -951,7 +2241,24 @@ class LMSKerasCallback(tf.keras.callbacks.Callback):
             optimizer_name = self.model.optimizer.__class__.__name__
             optimizer_scopes = {'training/'+optimizer_name+'/gradients'}
 
+        lms_args = self._lms_args
+        if self._layer_granularity:
+            lms_args = dict(lms_args, incl_op_names=(
+                set(lms_args.get('incl_op_names') or []) |
+                get_layer_output_op_names(model)))
+            if not (lms_args.get('starting_scope') or
+                    lms_args.get('starting_op_names')):
+                # start from the inputs of the model instead of searching
+                # for starting ops
+                lms_args['starting_op_names'] = [
+                    re.escape(t.op.name) for t in model.inputs]
+
+        graph = _get_model_graph(model)
         lmsMod = LMS(optimizer_scopes,
-                     graph=tf.get_default_graph(),
-                     **self._lms_args)
-        lmsMod.run()
+                     graph=graph,
+                     **lms_args)
+        if self._plan_cache:
+            _run_cached(lmsMod, graph, optimizer_scopes, lms_args,
+                        self._plan_transport)
+        else:
+            _run(lmsMod, graph, lms_args, self._plan_transport)
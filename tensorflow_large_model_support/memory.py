@@ -0,0 +1,181 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Memory estimation
+"""
+import math
+import os
+
+
+def get_tensor_size(ts, unknown_dim_size=1):
+    """Return the size of a tensor in bytes, computed from its static shape.
+
+    Args:
+      ts: a `tf.Tensor`.
+      unknown_dim_size: the size used for dimensions that are not known
+        statically, e.g. the batch dimension. Default `1`.
+
+    Return:
+      An integer. `0` if the rank of `ts` is unknown.
+    """
+    dims = ts.shape.dims
+    if dims is None:
+        return 0
+    nbytes = ts.dtype.size
+    for dim in dims:
+        value = dim.value
+        nbytes *= unknown_dim_size if value is None else value
+    return nbytes
+
+
+# TensorFlow limits the CUDA host allocator to 64 GB by default
+DEFAULT_HOST_MEM_LIMIT_MB = 1 << 16
+
+
+def get_host_mem_limit_mb():
+    """Return the host memory limit of TensorFlow in MB, read from the
+    `TF_CUDA_HOST_MEM_LIMIT_IN_MB` environment variable.
+    """
+    value = os.environ.get('TF_CUDA_HOST_MEM_LIMIT_IN_MB')
+    if not value:
+        return DEFAULT_HOST_MEM_LIMIT_MB
+    return int(value)
+
+
+def get_host_interval(swap):
+    """Return the orders during which a swapped tensor resides on the host.
+
+    The tensor is on the host from its swap-out until its last swap-in has
+    read it, i.e. at the latest when the first consumer of that swap-in runs.
+
+    Args:
+      swap: a swap record of `SwapPlan.swaps`.
+
+    Return:
+      A tuple of two integers, the first and the last order.
+    """
+    start = swap['order']
+    if swap.get('swapout_ctrld_order', -1) >= 0:
+        start = swap['swapout_ctrld_order']
+    end = start
+    for swapin in swap['swapins']:
+        if swapin['orders']:
+            end = max(end, min(swapin['orders']))
+    return (start, end)
+
+
+def get_peak_bytes(intervals):
+    """Return the peak number of bytes over time.
+
+    Args:
+      intervals: an iterable of (first order, last order, bytes).
+
+    Return:
+      An integer.
+    """
+    deltas = {}
+    for start, end, nbytes in intervals:
+        deltas[start] = deltas.get(start, 0) + nbytes
+        deltas[end + 1] = deltas.get(end + 1, 0) - nbytes
+    peak = 0
+    current = 0
+    for order in sorted(deltas):
+        current += deltas[order]
+        peak = max(peak, current)
+    return peak
+
+
+def estimate_host_memory(swap_plan, headroom=1.25):
+    """Estimate the host memory needed by a swap plan.
+
+    Towers are identified by the device of the operations producing the
+    swapped tensors. Since towers run concurrently, the total peak is computed
+    over the tensors of all towers.
+
+    Args:
+      swap_plan: a `SwapPlan`.
+      headroom: a factor applied to the total peak to account for the
+        fragmentation of the host allocator. Default `1.25`.
+
+    Return:
+      A dictionary with the total peak in bytes (`peak_bytes`), the peak in
+      bytes of each device (`device_peak_bytes`) and a recommended value for
+      `TF_CUDA_HOST_MEM_LIMIT_IN_MB` (`recommended_limit_mb`).
+    """
+    intervals = {}
+    for swap in swap_plan.swaps:
+        start, end = get_host_interval(swap)
+        intervals.setdefault(swap.get('device', ''), []).append(
+            (start, end, swap.get('nbytes', 0)))
+    device_peaks = {device: get_peak_bytes(ivs)
+                    for device, ivs in intervals.items()}
+    peak = get_peak_bytes(iv for ivs in intervals.values() for iv in ivs)
+    return {'peak_bytes': peak,
+            'device_peak_bytes': device_peaks,
+            'recommended_limit_mb': int(math.ceil(peak * headroom /
+                                                  float(1 << 20)))}
+
+
+def estimate_device_memory(topo_sort, swap_plan, unknown_dim_size=1):
+    """Estimate the peak device memory of the tensors in a topological
+    order, with and without swapping.
+
+    A tensor is on the device from the order of the operation producing it
+    until the order of its last consuming operation. A swapped tensor is on
+    the device until its last forward consumer, and again from the control
+    dependency operation of each swap-in until the last consumer of the
+    swap-in. Temporary memory of operations and the scheduling of the
+    TensorFlow runtime are ignored, so the estimate is only a static bound
+    to compare configurations.
+
+    Args:
+      topo_sort: a `TOPOS` built on the graph edited with `swap_plan`.
+      swap_plan: a `SwapPlan`.
+      unknown_dim_size: the size used for dimensions that are not known
+        statically. Default `1`.
+
+    Return:
+      A dictionary with the peak in bytes without swapping
+      (`peak_bytes_without_lms`) and with swapping (`peak_bytes`).
+    """
+    swapin_intervals = []
+    # tensor name -> last order it would be on the device without swapping
+    swapped_ends = {}
+    for swap in swap_plan.swaps:
+        for swapin in swap['swapins']:
+            if not swapin['orders']:
+                continue
+            end = max(swapin['orders'])
+            start = swapin['ctrld_order']
+            if start < 0:
+                start = min(swapin['orders']) - 1
+            swapin_intervals.append((start, end, swap['nbytes']))
+            swapped_ends[swap['tensor']] = max(
+                swapped_ends.get(swap['tensor'], end), end)
+
+    without_lms = []
+    with_lms = list(swapin_intervals)
+    for order in range(topo_sort.size):
+        for op in topo_sort.get_ops(order):
+            for ts in op.outputs:
+                end = order
+                for consumer in ts.consumers():
+                    end = max(end, topo_sort.get_order(consumer))
+                nbytes = get_tensor_size(ts, unknown_dim_size)
+                with_lms.append((order, end, nbytes))
+                without_lms.append(
+                    (order, max(end, swapped_ends.get(ts.name, end)), nbytes))
+    return {'peak_bytes_without_lms': get_peak_bytes(without_lms),
+            'peak_bytes': get_peak_bytes(with_lms)}
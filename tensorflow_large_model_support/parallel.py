@@ -0,0 +1,124 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Parallel planning
+
+Edit many graphs at once, e.g. the trials of a hyperparameter search, with
+a pool of threads or processes.
+"""
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import tensorflow as tf
+
+from tensorflow_large_model_support import plan
+from tensorflow_large_model_support.lms import LMS
+
+
+def plan_meta_graph(meta_graph_def, optimizer_scopes, lms_args):
+    """Edit a copy of a graph with LMS.
+
+    Args:
+      meta_graph_def: a `MetaGraphDef`.
+      optimizer_scopes: a set of scopes for the optimizers/solvers.
+      lms_args: a dictionary of the other LMS parameters.
+
+    Return:
+      The `LMS` object, holding the edited copy of the graph.
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.train.import_meta_graph(meta_graph_def)
+    lms_obj = LMS(optimizer_scopes, graph=graph, **lms_args)
+    lms_obj.run()
+    return lms_obj
+
+
+def _plan_serialized(args):
+    """Edit a copy of a serialized graph in a worker process and return the
+    plan as a dictionary.
+    """
+    meta_graph, optimizer_scopes, lms_args = args
+    meta_graph_def = tf.MetaGraphDef()
+    meta_graph_def.ParseFromString(meta_graph)
+    return plan_meta_graph(meta_graph_def, optimizer_scopes,
+                           lms_args).plan.to_dict()
+
+
+def _plan_graph(args):
+    """Edit a graph in place in a worker thread.
+    """
+    graph, optimizer_scopes, lms_args = args
+    lms_obj = LMS(optimizer_scopes, graph=graph, **lms_args)
+    lms_obj.run()
+    return lms_obj
+
+
+def plan_graphs(graphs, optimizer_scopes, lms_args=None, use_processes=False,
+                workers=None):
+    """Edit several graphs in parallel.
+
+    With threads, each graph is analyzed and edited in place by its own LMS
+    object. With processes, a copy of each graph is analyzed in a worker
+    process, and the plan is applied to the graph in this process with
+    `LMS.apply_plan`, so the analysis runs in parallel despite the Python
+    global interpreter lock.
+
+    Args:
+      graphs: a list of `tf.Graph`.
+      optimizer_scopes: a set of scopes for the optimizers/solvers.
+      lms_args: a dictionary of the other LMS parameters, or a list of
+        dictionaries with one per graph. Default `None`.
+      use_processes: If True, the graphs are analyzed in a process pool.
+        Otherwise in a thread pool. Default `False`.
+      workers: the number of threads or processes. Default `None` (the
+        number of CPUs).
+
+    Return:
+      A list of `LMS` objects, one per graph, holding the plans.
+    """
+    if lms_args is None or isinstance(lms_args, dict):
+        lms_args = [dict(lms_args or {})] * len(graphs)
+    if len(lms_args) != len(graphs):
+        raise ValueError('The number of LMS parameter dictionaries ({}) does '
+                         'not match the number of graphs ({}).'.format(
+                             len(lms_args), len(graphs)))
+
+    if not use_processes:
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(_plan_graph,
+                            [(graph, optimizer_scopes, args)
+                             for graph, args in zip(graphs, lms_args)])
+        finally:
+            pool.close()
+            pool.join()
+
+    tasks = [(tf.train.export_meta_graph(graph=graph).SerializeToString(),
+              optimizer_scopes, args)
+             for graph, args in zip(graphs, lms_args)]
+    pool = multiprocessing.Pool(workers)
+    try:
+        plan_dicts = pool.map(_plan_serialized, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    ret = []
+    for graph, args, plan_dict in zip(graphs, lms_args, plan_dicts):
+        lms_obj = LMS(optimizer_scopes, graph=graph, **args)
+        lms_obj.apply_plan(plan.SwapPlan.from_dict(plan_dict))
+        ret.append(lms_obj)
+    return ret
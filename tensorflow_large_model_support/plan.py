@@ -0,0 +1,391 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Swap plan
+"""
+import collections
+import hashlib
+import json
+import threading
+
+
+def _name(obj):
+    """Return the name of a `tf.Operation` or `tf.Tensor`, or `obj` itself
+    if it has no name.
+    """
+    return getattr(obj, 'name', obj)
+
+
+def _canonical(value):
+    """Return a representation of `value` that does not depend on the
+    iteration order of sets and dictionaries.
+    """
+    if isinstance(value, dict):
+        return sorted((repr(k), _canonical(v)) for k, v in value.items())
+    if isinstance(value, (set, frozenset)):
+        return sorted(repr(_canonical(v)) for v in value)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return repr(value)
+
+
+def get_graph_fingerprint(graph):
+    """Return a fingerprint of the structure of a graph.
+
+    The fingerprint covers the name, type, device, inputs, control inputs and
+    output shapes of every operation, but not the values of constants or
+    variables.
+
+    Args:
+      graph: a `tf.Graph`.
+
+    Return:
+      A string.
+    """
+    digest = hashlib.sha1()
+    for op in graph.get_operations():
+        digest.update(repr((op.name, op.type, op.device,
+                            [t.name for t in op.inputs],
+                            [c.name for c in op.control_inputs],
+                            [(t.dtype.name, str(t.shape))
+                             for t in op.outputs])).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def make_cache_key(graph, optimizer_scopes, lms_args):
+    """Return a key of `PlanCache` for a graph and LMS parameters.
+
+    Args:
+      graph: a `tf.Graph`.
+      optimizer_scopes: a set of scopes for the optimizers/solvers.
+      lms_args: a dictionary of the other LMS parameters.
+
+    Return:
+      A string.
+    """
+    params = repr((_canonical(optimizer_scopes), _canonical(lms_args)))
+    return '{}/{}'.format(get_graph_fingerprint(graph),
+                          hashlib.sha1(params.encode('utf-8')).hexdigest())
+
+
+class PlanCache(object):
+    """PlanCache class keeps swap plans across graph rebuilds.
+
+    Plans are stored as dictionaries of names, so the cache does not keep
+    graphs alive. The cache is safe to use from multiple threads.
+    """
+    def __init__(self):
+        """Create an empty PlanCache object.
+        """
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the `SwapPlan` stored for `key`, or `None`.
+        """
+        with self._lock:
+            plan_dict = self._plans.get(key)
+        if plan_dict is None:
+            return None
+        return SwapPlan.from_dict(plan_dict)
+
+    def put(self, key, swap_plan):
+        """Store a `SwapPlan` for `key`.
+        """
+        plan_dict = swap_plan.to_dict()
+        with self._lock:
+            self._plans[key] = plan_dict
+
+    def clear(self):
+        """Remove all plans.
+        """
+        with self._lock:
+            self._plans.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._plans)
+
+
+class SwapPlan(object):
+    """SwapPlan class records the swapping decisions made by LMS.
+
+    For each swapped tensor, the plan keeps the operation producing it, the
+    swap-out operation, and every swap-in operation together with its
+    consuming operations and its control dependency operation. Orders are
+    positions in the topological order built by `TOPOS`.
+
+    While LMS runs, the plan holds `tf.Operation` and `tf.Tensor` objects.
+    `to_dict` converts them to names so the plan can be serialized.
+    """
+    def __init__(self):
+        """Create an empty SwapPlan object.
+        """
+        self._swaps = collections.OrderedDict()
+        self._swapins = {}
+        self._topo_sort = None
+        self._size = 0
+        self._bw_starting_order = -1
+        self._level_sizes = []
+
+    def set_topo_sort(self, topo_sort):
+        """Take `size`, `bw_starting_order` and `level_sizes` from a
+        topological order when they are first needed.
+
+        A lazy `TOPOS` is only completed if they are read, e.g. by `to_dict`.
+
+        Args:
+          topo_sort: a `TOPOS` object.
+        """
+        self._topo_sort = topo_sort
+
+    def _read_topo_sort(self):
+        """Read the sizes of the levels from the topological order, if any.
+        """
+        topo_sort = self._topo_sort
+        if topo_sort is None:
+            return
+        self._topo_sort = None
+        self._size = topo_sort.size
+        self._bw_starting_order = topo_sort.bw_starting_order
+        self._level_sizes = [len(topo_sort.get_ops(i))
+                             for i in range(self._size)]
+
+    @property
+    def size(self):
+        """The number of orders in the topological order.
+        """
+        self._read_topo_sort()
+        return self._size
+
+    @size.setter
+    def size(self, size):
+        self._read_topo_sort()
+        self._size = size
+
+    @property
+    def bw_starting_order(self):
+        """The starting order of the backward phase.
+        """
+        self._read_topo_sort()
+        return self._bw_starting_order
+
+    @bw_starting_order.setter
+    def bw_starting_order(self, order):
+        self._read_topo_sort()
+        self._bw_starting_order = order
+
+    @property
+    def level_sizes(self):
+        """The number of operations at each order.
+        """
+        self._read_topo_sort()
+        return self._level_sizes
+
+    @level_sizes.setter
+    def level_sizes(self, level_sizes):
+        self._read_topo_sort()
+        self._level_sizes = level_sizes
+
+    def add_swapout(self, ts0, src_op, swapout_op, order, nbytes=0,
+                    device=''):
+        """Record that the tensor `ts0` is swapped out.
+
+        Args:
+          ts0: a `tf.Tensor`.
+          src_op: a `tf.Operation` that produces `ts0`.
+          swapout_op: a `tf.Operation` that swaps out `ts0`.
+          order: an integer, the order of `src_op`.
+          nbytes: the estimated size of `ts0` in bytes. Default `0`.
+          device: the device of `src_op`. Default `''`.
+        """
+        swap = self._get_swap(ts0)
+        swap['src_op'] = src_op
+        swap['swapout_op'] = swapout_op
+        swap['order'] = order
+        swap['nbytes'] = nbytes
+        swap['device'] = device
+
+    def add_swapout_dependency(self, ts0, ctrld_op, order):
+        """Record the control dependency operation triggering the swap-out
+        of `ts0`.
+
+        Args:
+          ts0: a `tf.Tensor`.
+          ctrld_op: a `tf.Operation`.
+          order: an integer, the order of `ctrld_op`.
+        """
+        swap = self._get_swap(ts0)
+        swap['swapout_ctrld_op'] = ctrld_op
+        swap['swapout_ctrld_order'] = order
+
+    def add_swapin(self, ts0, swapin_op, dest_ops, orders):
+        """Record that the tensor `ts0` is swapped in for `dest_ops`.
+
+        Args:
+          ts0: a `tf.Tensor`.
+          swapin_op: a `tf.Operation` that swaps in `ts0`.
+          dest_ops: a list of `tf.Operation` consuming `swapin_op`.
+          orders: a list of integers, the orders of `dest_ops`.
+        """
+        swapin = {'tensor': ts0,
+                  'swapin_op': swapin_op,
+                  'dest_ops': list(dest_ops),
+                  'orders': list(orders),
+                  'ctrld_op': None,
+                  'ctrld_order': -1,
+                  'after': []}
+        self._get_swap(ts0)['swapins'].append(swapin)
+        self._swapins[swapin_op] = swapin
+
+    def add_control_dependency(self, swapin_op, ctrld_op, order):
+        """Record the control dependency operation triggering `swapin_op`.
+
+        Args:
+          swapin_op: a `tf.Operation`.
+          ctrld_op: a `tf.Operation`.
+          order: an integer, the order of `ctrld_op`.
+        """
+        swapin = self._swapins.get(swapin_op)
+        if swapin is not None:
+            swapin['ctrld_op'] = ctrld_op
+            swapin['ctrld_order'] = order
+
+    def add_swapin_dependency(self, swapin_op, prev_swapin_op):
+        """Record that `swapin_op` starts after `prev_swapin_op` finishes.
+
+        Args:
+          swapin_op: a `tf.Operation`.
+          prev_swapin_op: a `tf.Operation`.
+        """
+        swapin = self._swapins.get(swapin_op)
+        if swapin is not None:
+            swapin['after'].append(prev_swapin_op)
+
+    def get_swapped_tensor(self, swapin_op):
+        """Return the tensor swapped in by `swapin_op`, or `None` if
+        `swapin_op` is not in the plan.
+        """
+        swapin = self._swapins.get(swapin_op)
+        if swapin is None:
+            return None
+        return swapin['tensor']
+
+    def get_swap(self, ts0):
+        """Return the swap record of the tensor `ts0`, holding graph objects,
+        or `None` if `ts0` is not in the plan.
+        """
+        return self._swaps.get(ts0)
+
+    def _get_swap(self, ts0):
+        """Return the record of the tensor `ts0`, creating it if needed.
+        """
+        if ts0 not in self._swaps:
+            self._swaps[ts0] = {'tensor': ts0,
+                                'src_op': None,
+                                'swapout_op': None,
+                                'order': -1,
+                                'nbytes': 0,
+                                'device': '',
+                                'swapout_ctrld_op': None,
+                                'swapout_ctrld_order': -1,
+                                'swapins': []}
+        return self._swaps[ts0]
+
+    @property
+    def swaps(self):
+        """A list of swap records, one per swapped tensor.
+        """
+        return self._swaps_to_list()
+
+    def __len__(self):
+        return len(self._swaps)
+
+    def _swaps_to_list(self):
+        """Return the swap records with names instead of graph objects.
+        """
+        swaps = []
+        for swap in self._swaps.values():
+            swapins = []
+            for swapin in swap['swapins']:
+                swapins.append({
+                    'swapin_op': _name(swapin['swapin_op']),
+                    'dest_ops': [_name(op) for op in swapin['dest_ops']],
+                    'orders': list(swapin['orders']),
+                    'ctrld_op': _name(swapin['ctrld_op']),
+                    'ctrld_order': swapin['ctrld_order'],
+                    'after': [_name(op) for op in swapin['after']]})
+            swaps.append({'tensor': _name(swap['tensor']),
+                          'src_op': _name(swap['src_op']),
+                          'swapout_op': _name(swap['swapout_op']),
+                          'order': swap['order'],
+                          'nbytes': swap['nbytes'],
+                          'device': swap['device'],
+                          'swapout_ctrld_op': _name(swap['swapout_ctrld_op']),
+                          'swapout_ctrld_order': swap['swapout_ctrld_order'],
+                          'swapins': swapins})
+        return swaps
+
+    def to_dict(self):
+        """Return the plan as a dictionary of names and integers.
+        """
+        return {'size': self.size,
+                'bw_starting_order': self.bw_starting_order,
+                'level_sizes': list(self.level_sizes),
+                'swaps': self._swaps_to_list()}
+
+    def to_json(self):
+        """Return the plan serialized as a JSON string.
+        """
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    @classmethod
+    def from_dict(cls, plan_dict):
+        """Create a SwapPlan object from a dictionary made by `to_dict`.
+
+        Args:
+          plan_dict: a dictionary.
+
+        Return:
+          A `SwapPlan` holding names instead of graph objects.
+        """
+        ret = cls()
+        ret.size = plan_dict.get('size', 0)
+        ret.bw_starting_order = plan_dict.get('bw_starting_order', -1)
+        ret.level_sizes = list(plan_dict.get('level_sizes', []))
+        for swap in plan_dict.get('swaps', []):
+            ret.add_swapout(swap['tensor'], swap['src_op'],
+                            swap['swapout_op'], swap['order'],
+                            swap.get('nbytes', 0), swap.get('device', ''))
+            if swap.get('swapout_ctrld_op'):
+                ret.add_swapout_dependency(swap['tensor'],
+                                           swap['swapout_ctrld_op'],
+                                           swap['swapout_ctrld_order'])
+            for swapin in swap['swapins']:
+                ret.add_swapin(swap['tensor'], swapin['swapin_op'],
+                               swapin['dest_ops'], swapin['orders'])
+                ret.add_control_dependency(swapin['swapin_op'],
+                                           swapin['ctrld_op'],
+                                           swapin['ctrld_order'])
+                for prev_swapin_op in swapin.get('after', []):
+                    ret.add_swapin_dependency(swapin['swapin_op'],
+                                              prev_swapin_op)
+        return ret
+
+    @classmethod
+    def from_json(cls, plan_json):
+        """Create a SwapPlan object from a JSON string made by `to_json`.
+        """
+        return cls.from_dict(json.loads(plan_json))
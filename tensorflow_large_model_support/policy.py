@@ -0,0 +1,146 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+
+"""Swap policies
+
+A swap policy makes the decisions of LMS for each tensor: which consuming
+operations read it from a swap-in, how early the swap-in starts, and which
+operation triggers the swap-in. `SwapPolicy` implements the default
+behavior. Subclass it and override some of its methods to try other
+policies, and pass an instance to `LMS` with the `swap_policy` parameter.
+"""
+
+
+def get_branch_ops(orders, threshold=0):
+    """Return the ops whose order is greater than the smallest order plus
+    `threshold`.
+
+    Args:
+      orders: a dictionary of `tf.Operation` to their orders.
+      threshold: an integer. Default `0`.
+
+    Return:
+      A set of `tf.Operation`.
+    """
+    if not orders:
+        return set()
+    min_order = min(orders.values()) + threshold
+    return {op for op, order in orders.items() if order > min_order}
+
+
+class SwapPolicy(object):
+    """SwapPolicy class decides how the tensors chosen by LMS are swapped.
+
+    LMS calls the methods of the policy with dictionaries describing the
+    tensor or the swap-in at hand, and applies the returned decisions. The
+    validity of the control dependency operations is checked by LMS before
+    they are given to the policy.
+    """
+    def __init__(self, lb=1, swap_branches=False, branch_threshold=0,
+                 prefetch_distances=None):
+        """Create a SwapPolicy object.
+
+        Args:
+          lb: the default prefetch distance. Default `1`.
+          swap_branches: If True, forward consumers far enough from the
+            first consumer of a tensor read it from a swap-in as well.
+            Default `False`.
+          branch_threshold: the distance in the topological order beyond
+            which a forward consumer reads from a swap-in. Default `0`.
+          prefetch_distances: a dictionary of tensor names to prefetch
+            distances overriding `lb`. Default `None`.
+        """
+        self._lb = lb
+        self._swap_branches = swap_branches
+        self._branch_threshold = branch_threshold
+        self._prefetch_distances = prefetch_distances or {}
+
+    def select_dest_ops(self, candidate):
+        """Choose the consuming operations of a tensor that read it from a
+        swap-in.
+
+        By default, these are the consumers in the backward phase, and the
+        forward consumers further than `branch_threshold` from the first
+        one in inference mode or with `swap_branches`.
+
+        Args:
+          candidate: a dictionary with the tensor (`tensor`), the operation
+            producing it (`src_op`) and its order (`order`), the static
+            shape of the tensor as a list, `None` if its rank is unknown
+            (`shape`), its size in bytes (`nbytes`), a dictionary of its
+            consuming operations to their orders (`consumers`), the set of
+            its consuming operations in the backward phase (`bw_consumers`)
+            and whether LMS runs in inference mode (`inference`).
+
+        Return:
+          A set of `tf.Operation` among the consumers. The tensor is not
+          swapped if the set is empty.
+        """
+        dest_ops = set(candidate['bw_consumers'])
+        if self._swap_branches or candidate['inference']:
+            fw_orders = {op: order
+                         for op, order in candidate['consumers'].items()
+                         if op not in dest_ops}
+            dest_ops |= get_branch_ops(fw_orders, self._branch_threshold)
+        return dest_ops
+
+    def get_prefetch_distance(self, swapin):
+        """Return the lower bound of the distance between the operation
+        triggering a swap-in and the consumer of the swap-in.
+
+        Args:
+          swapin: a dictionary with the tensor swapped in, `None` if
+            unknown (`tensor`), the swap-in operation (`swapin_op`), the
+            operation producing the tensor (`fw_op`) and the consumer of the
+            swap-in (`bw_op`).
+
+        Return:
+          An integer, the distance of the tensor in `prefetch_distances` if
+          any, otherwise `lb`.
+        """
+        ts0 = swapin['tensor']
+        if ts0 is not None:
+            return self._prefetch_distances.get(ts0.name, self._lb)
+        return self._lb
+
+    def select_ctrld_op(self, ctrld_ops, trigger):
+        """Choose the operation triggering a swap-in among candidates.
+
+        The operation with the largest slack in the topological order is
+        chosen, so that swap-ins are not triggered by operations on the
+        critical path. Ties are broken by the smallest order, to start
+        swap-ins as early as possible, and then by name, so the choice does
+        not depend on the iteration order of sets.
+
+        Args:
+          ctrld_ops: a set of `tf.Operation`, the candidates found with the
+            `ctrld_strategy` of LMS.
+          trigger: a dictionary with the operation producing the swapped
+            tensor (`fw_op`), the consumer of the swap-in (`bw_op`) and the
+            `TOPOS` giving the orders and the slacks of the candidates
+            (`topo_sort`).
+
+        Return:
+          A `tf.Operation` among `ctrld_ops`, or `None` to add no control
+          dependency.
+        """
+        if len(ctrld_ops) == 1:
+            return next(iter(ctrld_ops))
+        topo_sort = trigger['topo_sort']
+        return min(ctrld_ops,
+                   key=lambda op: (-topo_sort.get_slack(op),
+                                   topo_sort.get_order(op),
+                                   op.name))
@@ -0,0 +1,128 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""tf.function support
+
+Apply LMS to a training step written as a `tf.function`. The step is traced
+into a graph, the graph is edited by LMS, and the edited graph is pruned into
+a new function that runs eagerly or inside another graph.
+"""
+import contextlib
+
+import tensorflow as tf
+
+from tensorflow_large_model_support.lms import LMS
+
+# the scope of the gradient ops computed by `tf.GradientTape` in TF 2
+DEFAULT_OPTIMIZER_SCOPES = {'gradient_tape'}
+
+
+@contextlib.contextmanager
+def _tensor_equality_disabled():
+    """Disable tensor equality while the graph editor hashes tensors.
+    """
+    enabled = getattr(tf.Tensor, '_USE_EQUALITY', False)
+    if enabled:
+        tf.compat.v1.disable_tensor_equality()
+    try:
+        yield
+    finally:
+        if enabled:
+            tf.compat.v1.enable_tensor_equality()
+
+
+def _is_sink(op):
+    """Check whether `op` is a stateful operation whose outputs are not
+    consumed, e.g. a variable update.
+    """
+    return (op.op_def.is_stateful and
+            not any(t.consumers() for t in op.outputs))
+
+
+class LMSFunction(object):
+    """LMSFunction class runs a training step rewritten by LMS.
+
+    Calling the object runs the edited graph with the same arguments and
+    returns the same structure of outputs as the original step. Variable
+    updates of the step are run as well.
+    """
+    def __init__(self, fn, input_signature=None, optimizer_scopes=None,
+                 **kwargs):
+        """Create an LMSFunction object.
+
+        Args:
+          fn: a `tf.function`, or the Python function of a training step.
+          input_signature: a possibly nested sequence of `tf.TensorSpec`.
+            Default `None` (the input signature of `fn`).
+          optimizer_scopes: a set of scopes for the gradient ops. Wrap the
+            call to `tape.gradient` in a `tf.name_scope` with one of these
+            scopes if TensorFlow does not already do it.
+            Default `{'gradient_tape'}`.
+          kwargs: the kwargs to pass to LMS. Note, the `graph` argument is
+            removed from the kwargs because LMS edits the graph traced from
+            `fn`.
+        """
+        if input_signature is None:
+            input_signature = getattr(fn, 'input_signature', None)
+        if input_signature is None:
+            raise ValueError('An input signature is required to trace the '
+                             'function.')
+        kwargs.pop('graph', None)
+
+        python_function = getattr(fn, 'python_function', fn)
+        self._wrapped = tf.compat.v1.wrap_function(python_function,
+                                                   input_signature)
+        graph = self._wrapped.graph
+        self.lms_obj = LMS(optimizer_scopes or DEFAULT_OPTIMIZER_SCOPES,
+                           graph=graph, **kwargs)
+        with _tensor_equality_disabled(), graph.as_default():
+            self.lms_obj.run()
+
+        n_inputs = len(tf.nest.flatten(input_signature))
+        targets = [op for op in graph.get_operations() if _is_sink(op)]
+        self._structured_outputs = graph.structured_outputs
+        self._function = self._wrapped.prune(
+            graph.inputs[:n_inputs], [graph.outputs, targets])
+
+    def __call__(self, *args):
+        inputs = [tf.convert_to_tensor(arg) for arg in tf.nest.flatten(args)]
+        outputs = self._function(*inputs)[0]
+        if self._structured_outputs is None:
+            return None
+        return tf.nest.pack_sequence_as(self._structured_outputs, outputs,
+                                        expand_composites=True)
+
+    @property
+    def graph(self):
+        """The `tf.Graph` edited by LMS.
+        """
+        return self._wrapped.graph
+
+
+def rewrite(fn, input_signature=None, optimizer_scopes=None, **kwargs):
+    """Apply LMS to a training step.
+
+    Args:
+      fn: a `tf.function`, or the Python function of a training step.
+      input_signature: a possibly nested sequence of `tf.TensorSpec`.
+        Default `None` (the input signature of `fn`).
+      optimizer_scopes: a set of scopes for the gradient ops.
+        Default `{'gradient_tape'}`.
+      kwargs: the kwargs to pass to LMS.
+
+    Return:
+      An `LMSFunction` running the rewritten step.
+    """
+    return LMSFunction(fn, input_signature, optimizer_scopes, **kwargs)
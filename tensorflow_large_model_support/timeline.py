@@ -0,0 +1,153 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Timeline
+
+Export the planned swap schedule of LMS in the Chrome trace event format,
+which can be opened with chrome://tracing or https://ui.perfetto.dev.
+Orders of the topological sort are used as the time axis.
+"""
+import json
+
+import six
+
+from tensorflow_large_model_support import plan as swap_plan
+
+_COMPUTE_PID = 0
+_SWAP_PID = 1
+
+
+def _metadata(name, pid, tid, value):
+    """Return a metadata event naming a process or a thread.
+    """
+    return {'name': name, 'ph': 'M', 'pid': pid, 'tid': tid,
+            'args': {'name': value}}
+
+
+def _complete(name, pid, tid, start, end, level_duration, args=None):
+    """Return a complete event spanning orders `start` to `end`.
+    """
+    return {'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+            'ts': start * level_duration,
+            'dur': max(end - start, 0) * level_duration,
+            'args': args or {}}
+
+
+def _instant(name, pid, tid, order, level_duration, args=None):
+    """Return an instant event at order `order`.
+    """
+    return {'name': name, 'ph': 'i', 's': 't', 'pid': pid, 'tid': tid,
+            'ts': order * level_duration, 'args': args or {}}
+
+
+def build_chrome_trace(plan, level_duration=1000):
+    """Build a Chrome trace from a swap plan.
+
+    The trace has a compute track with one slice per topological order, and
+    one track per swapped tensor showing its swap-out, its residency on the
+    host and the prefetch window of each swap-in, which starts at the
+    control dependency operation and ends at the consuming operation.
+    Control dependency operations are marked with instant events.
+
+    Args:
+      plan: a `SwapPlan`, or an `LMS` object that has been run.
+      level_duration: the duration of one topological order in
+        microseconds. Default `1000`.
+
+    Return:
+      A dictionary in the Chrome trace event format.
+    """
+    if not isinstance(plan, swap_plan.SwapPlan):
+        plan = plan.plan
+    plan_dict = plan.to_dict()
+
+    events = [_metadata('process_name', _COMPUTE_PID, 0, 'compute'),
+              _metadata('thread_name', _COMPUTE_PID, 0, 'levels'),
+              _metadata('process_name', _SWAP_PID, 0, 'swaps')]
+    level_sizes = plan_dict['level_sizes']
+    for order in range(plan_dict['size']):
+        args = {}
+        if order < len(level_sizes):
+            args['ops'] = level_sizes[order]
+        events.append(_complete('level {}'.format(order), _COMPUTE_PID, 0,
+                                order, order + 1, level_duration, args))
+    if plan_dict['bw_starting_order'] >= 0:
+        events.append(_instant('backward phase', _COMPUTE_PID, 0,
+                               plan_dict['bw_starting_order'],
+                               level_duration))
+
+    for tid, swap in enumerate(plan_dict['swaps'], 1):
+        events.append(_metadata('thread_name', _SWAP_PID, tid,
+                                swap['tensor']))
+        order = swap['order']
+        if swap.get('swapout_ctrld_order', -1) >= 0:
+            # the swap-out starts after its control dependency op
+            order = swap['swapout_ctrld_order']
+            events.append(_instant('trigger', _SWAP_PID, tid, order,
+                                   level_duration,
+                                   {'ctrld_op': swap['swapout_ctrld_op'],
+                                    'swapout_op': swap['swapout_op']}))
+        events.append(_complete('swap-out', _SWAP_PID, tid, order,
+                                order + 1, level_duration,
+                                {'tensor': swap['tensor'],
+                                 'src_op': swap['src_op'],
+                                 'swapout_op': swap['swapout_op']}))
+        swapin_starts = []
+        for swapin in swap['swapins']:
+            end = min(swapin['orders']) if swapin['orders'] else order + 1
+            start = swapin['ctrld_order']
+            if start < 0:
+                # no control dependency, the swap-in may start any time
+                # before its consumer
+                start = end - 1
+            swapin_starts.append(start)
+            events.append(_complete('swap-in', _SWAP_PID, tid, start, end,
+                                    level_duration,
+                                    {'swapin_op': swapin['swapin_op'],
+                                     'dest_ops': swapin['dest_ops'],
+                                     'ctrld_op': swapin['ctrld_op'],
+                                     'prefetch_distance': end - start}))
+            if swapin['ctrld_op']:
+                events.append(_instant('trigger', _SWAP_PID, tid, start,
+                                       level_duration,
+                                       {'ctrld_op': swapin['ctrld_op'],
+                                        'swapin_op': swapin['swapin_op']}))
+        if swapin_starts:
+            events.append(_complete('host', _SWAP_PID, tid, order + 1,
+                                    max(swapin_starts), level_duration,
+                                    {'tensor': swap['tensor']}))
+
+    return {'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'size': plan_dict['size'],
+                          'bw_starting_order': plan_dict['bw_starting_order'],
+                          'swapped_tensors': len(plan_dict['swaps'])}}
+
+
+def export_chrome_trace(plan, dest, level_duration=1000):
+    """Write the Chrome trace of a swap plan as JSON.
+
+    Args:
+      plan: a `SwapPlan`, or an `LMS` object that has been run.
+      dest: a file path or a file-like object.
+      level_duration: the duration of one topological order in
+        microseconds. Default `1000`.
+    """
+    trace = build_chrome_trace(plan, level_duration)
+    if isinstance(dest, six.string_types):
+        with open(dest, 'w') as f:
+            json.dump(trace, f)
+    else:
+        json.dump(trace, dest)
@@ -21,28 +21,90 @@ import toposort
 import tensorflow.contrib.graph_editor as ge
 from tensorflow.contrib.graph_editor import util
 
+from tensorflow_large_model_support import frames
+
+
+def _get_consumers(op):
+    """Return the ops consuming the outputs of `op`.
+    """
+    return [consuming_op for t in op.outputs for consuming_op in t.consumers()]
+
+
+def _get_producers(op):
+    """Return the ops producing the inputs of `op`.
+    """
+    return [t.op for t in op.inputs]
+
+
+def _walk(seed_ops, next_fn, within_ops=None):
+    """Return the set of ops reachable from `seed_ops`, including them,
+    where `next_fn` returns the next ops of an op. If `within_ops` is given,
+    the walk does not leave it.
+    """
+    visited = set(seed_ops)
+    stack = list(visited)
+    while stack:
+        for next_op in next_fn(stack.pop()):
+            if next_op not in visited and (within_ops is None or
+                                           next_op in within_ops):
+                visited.add(next_op)
+                stack.append(next_op)
+    return visited
+
 
 class TOPOS(object):
     """TOPOS class builds a topological order from the computational graph.
     """
-    def __init__(self, seed_ops, grad_ops):
+    def __init__(self, seed_ops, grad_ops, graph_matrix=None, lazy=False):
         """Create a TOPOS object.
 
         Args:
           seed_ops: a list of `tf.Operation`.
           grad_ops: a set of `tf.Operation`.
+          graph_matrix: a `GraphMatrix` of the graph. If given, reachability
+            and levels are computed with sparse matrix operations instead of
+            walking the graph one operation at a time. Default `None`.
+          lazy: If True, `build` only counts the dependencies of ops, and
+            orders are assigned on demand, one order at a time, until the
+            requested op or order is found. `build` still visits every op
+            reachable from `seed_ops` once, only the assignment of orders
+            and slacks is deferred. The orders and slacks are the same as
+            without `lazy`. `size` and `get_slack` need the whole order.
+            Ignored if `graph_matrix` is given. Default `False`.
         """
         self._seed_ops = seed_ops
         self._grad_ops = grad_ops
+        self._graph_matrix = graph_matrix
+        self._lazy = lazy and graph_matrix is None
 
         self._topo_sort = {}
         self._orders = {}
+        self._slacks = {}
         self._bw_starting_order = -1
 
+        # state of the lazy evaluation
+        # op -> the number of dependencies not in an order yet
+        self._n_deps = {}
+        # op -> ops depending on it
+        self._dependents = {}
+        # ops not assigned to an order or removed yet
+        self._pending_ops = set()
+        self._update_ops = set()
+        self._frontier = set()
+
     def build(self):
         """Build a topological order
         """
-        topo_sort = list(toposort.toposort(self._build_dependency_dict()))
+        if self._lazy:
+            self._prepare_lazy()
+            return
+
+        if self._graph_matrix is not None:
+            topo_sort = self._graph_matrix.toposort(self._seed_ops,
+                                                    self._grad_ops)
+        else:
+            topo_sort = list(toposort.toposort(
+                self._build_dependency_dict()))
         for i in range(0, len(topo_sort)):
             self._topo_sort[i] = topo_sort[i]
 
@@ -57,6 +119,8 @@ class TOPOS(object):
 
         # build a dict of (op, order)
         self._build_order_dict()
+        # build a dict of (op, slack)
+        self._build_slack_dict()
 
         # starting order of the backward phase
         for i in range(0, len(self._topo_sort)):
@@ -75,8 +139,13 @@ class TOPOS(object):
         for op in self._seed_ops:
             open_set.put(op)
 
-        reachable_ops = set(ge.get_walks_intersection_ops(
-            list(self._seed_ops), list(self._grad_ops)))
+        if self._grad_ops:
+            reachable_ops = set(ge.get_walks_intersection_ops(
+                list(self._seed_ops), list(self._grad_ops)))
+        else:
+            # a forward-only graph
+            reachable_ops = set(ge.get_forward_walk_ops(
+                list(self._seed_ops)))
 
         # traversal in the fw phase
         while not open_set.empty():
@@ -85,7 +154,9 @@ class TOPOS(object):
             # do action for src_op
             dep_ops = set(src_op.control_inputs)
             for t in src_op.inputs:
-                dep_ops |= set(util.get_generating_ops(t))
+                # ignore back edges of while loops to keep the graph acyclic
+                dep_ops |= {op for op in util.get_generating_ops(t)
+                            if not frames.is_back_edge(op, src_op)}
                 dep_ops &= reachable_ops
             dep_dict[src_op] = dep_ops
 
@@ -102,6 +173,89 @@ class TOPOS(object):
 
         return dep_dict
 
+    def _prepare_lazy(self):
+        """Count the dependencies of ops for the lazy evaluation.
+
+        This is the dependency dictionary of `_build_dependency_dict`,
+        inverted to find the ops depending on an op. Only the ops reachable
+        from the seed ops and the ops of the update phase are visited.
+        """
+        keys = _walk(self._seed_ops, _get_consumers)
+        if self._grad_ops:
+            # ops reachable from the seed ops are closed under consumers,
+            # so a path from one of them to a bw op never leaves them
+            reachable_ops = _walk(keys & set(self._grad_ops), _get_producers,
+                                  keys)
+        else:
+            # a forward-only graph
+            reachable_ops = keys
+        # the update phase starts at the non-bw consumers of bw ops, and a
+        # path from there never needs to go through the bw phase again
+        update_seed_ops = {op for grad_op in self._grad_ops
+                           for op in _get_consumers(grad_op)
+                           if op not in self._grad_ops}
+        self._update_ops = _walk(
+            update_seed_ops,
+            lambda op: [next_op for next_op in _get_consumers(op)
+                        if next_op not in self._grad_ops])
+
+        for op in keys:
+            dep_ops = set(op.control_inputs)
+            # ignore back edges of while loops to keep the graph acyclic
+            dep_ops |= {t.op for t in op.inputs
+                        if not frames.is_back_edge(t.op, op)}
+            dep_ops &= reachable_ops
+            dep_ops.discard(op)
+            self._n_deps[op] = len(dep_ops)
+            for dep_op in dep_ops:
+                self._dependents.setdefault(dep_op, []).append(op)
+        self._pending_ops = keys
+        self._frontier = {op for op in keys if not self._n_deps[op]}
+
+    def _next_order(self):
+        """Assign the next order, cleaned like `build` cleans the orders.
+
+        Return:
+          False if all ops have been assigned an order.
+        """
+        while self._frontier:
+            dep_ops = self._frontier
+            next_ops = set()
+            for op in dep_ops:
+                for dependent_op in self._dependents.get(op, []):
+                    self._n_deps[dependent_op] -= 1
+                    if not self._n_deps[dependent_op]:
+                        next_ops.add(dependent_op)
+            self._frontier = next_ops
+            self._pending_ops -= dep_ops
+
+            # see _clean_bw_ops and _clean_update_ops
+            fw_dep_ops = dep_ops - self._grad_ops
+            if fw_dep_ops:
+                dep_ops = fw_dep_ops
+            dep_ops = dep_ops - self._update_ops
+            if not dep_ops:
+                # see _reindex
+                continue
+            order = len(self._topo_sort)
+            self._topo_sort[order] = dep_ops
+            for op in dep_ops:
+                self._orders[op] = order
+            if self._bw_starting_order < 0 and (dep_ops & self._grad_ops):
+                self._bw_starting_order = order
+            return True
+
+        if self._pending_ops:
+            raise toposort.CircularDependencyError(
+                {op: set() for op in self._pending_ops})
+        return False
+
+    def _complete(self):
+        """Assign the orders of all remaining ops.
+        """
+        while self._next_order():
+            pass
+
     def _build_order_dict(self):
         """Build a dictionary to quickly find an order of an ops.
         """
@@ -109,6 +263,28 @@ class TOPOS(object):
             for op in dep_ops:
                 self._orders[op] = order
 
+    def _build_slack_dict(self):
+        """Build a dictionary of the slack of ops.
+
+        The slack of an op is the number of orders it can be delayed
+        without delaying the last order, i.e. the difference between the
+        latest order it can run at, given its consuming ops, and its order.
+        Ops on the critical path have no slack.
+        """
+        last_order = len(self._topo_sort) - 1
+        latest_orders = {}
+        for order in reversed(range(0, len(self._topo_sort))):
+            for op in self._topo_sort[order]:
+                latest_order = last_order
+                for t in op.outputs:
+                    for consuming_op in t.consumers():
+                        if self.get_order(consuming_op) > order:
+                            latest_order = min(
+                                latest_order,
+                                latest_orders[consuming_op] - 1)
+                latest_orders[op] = latest_order
+                self._slacks[op] = latest_order - order
+
     def _clean_bw_ops(self):
         """There are some bw ops that
              - have no incoming bw ops except its fw op, or
@@ -126,8 +302,12 @@ class TOPOS(object):
     def _clean_update_ops(self):
         """Remove ops that are in the update phase.
         """
-        update_ops = set(ge.get_forward_walk_ops(
-            list(self._grad_ops), inclusive=False))
+        if self._graph_matrix is not None:
+            update_ops = self._graph_matrix.get_forward_walk_ops(
+                self._grad_ops, inclusive=False)
+        else:
+            update_ops = set(ge.get_forward_walk_ops(
+                list(self._grad_ops), inclusive=False))
         for i in range(0, len(self._topo_sort)):
             ops = self._topo_sort[i]
             # remove ops that are not bw or fw op
@@ -155,11 +335,27 @@ class TOPOS(object):
         Return:
           An integer.
         """
+        while op not in self._orders and op in self._pending_ops:
+            self._next_order()
         if op in self._orders:
             return self._orders[op]
         else:
             return -1
 
+    def get_slack(self, op):
+        """Return the slack of an operation.
+
+        Args:
+          op: a `tf.Operation`.
+
+        Return:
+          An integer. `0` if `op` is not in the topological order.
+        """
+        if self._lazy and not self._slacks:
+            self._complete()
+            self._build_slack_dict()
+        return self._slacks.get(op, 0)
+
     def get_ops(self, order):
         """Return a set of ops with the same order.
 
@@ -169,16 +365,22 @@ class TOPOS(object):
         Return:
           A set of `tf.Operation`
         """
+        while order not in self._topo_sort and self._next_order():
+            pass
         return self._topo_sort[order]
 
     @property
     def size(self):
         """The number of orders in the topological order.
         """
+        if self._lazy:
+            self._complete()
         return len(self._topo_sort)
 
     @property
     def bw_starting_order(self):
         """The starting order of the backward phase.
         """
+        while self._bw_starting_order < 0 and self._next_order():
+            pass
         return self._bw_starting_order
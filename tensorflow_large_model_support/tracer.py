@@ -0,0 +1,131 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tracer
+"""
+import collections
+import json
+import time
+
+import six
+
+# Event kinds recorded by LMS
+SWAP_OUT = 'swap_out'
+SWAP_IN = 'swap_in'
+CTRL_DEP = 'ctrl_dep'
+SKIP = 'skip'
+
+
+class Tracer(object):
+    """Tracer class records structured LMS events into a bounded ring buffer.
+
+    Event fields are stored as given and only formatted when the events are
+    read or dumped. A field may also be a callable, which is evaluated at
+    that time. When the tracer is disabled, `record` returns immediately so
+    the cost of tracing is a single attribute check.
+    """
+    def __init__(self, enabled=False, capacity=10000):
+        """Create a Tracer object.
+
+        Args:
+          enabled: record events or not. Default `False`.
+          capacity: the maximum number of events kept in the buffer. Older
+            events are dropped once the buffer is full. Default `10000`.
+        """
+        self._enabled = enabled
+        self._events = collections.deque(maxlen=capacity)
+        self._dropped = 0
+
+    def record(self, kind, **fields):
+        """Record an event.
+
+        Args:
+          kind: the kind of the event, e.g. `SWAP_OUT`.
+          fields: the fields of the event. Values can be `tf.Operation`,
+            `tf.Tensor`, collections of them, plain values or callables
+            returning one of these.
+        """
+        if not self._enabled:
+            return
+        if len(self._events) == self._events.maxlen:
+            self._dropped += 1
+        self._events.append((time.time(), kind, fields))
+
+    def events(self):
+        """Return a list of recorded events, formatted as dictionaries.
+        """
+        ret = []
+        for timestamp, kind, fields in self._events:
+            event = {'ts': timestamp, 'kind': kind}
+            for key, value in fields.items():
+                event[key] = self._format(value)
+            ret.append(event)
+        return ret
+
+    def dump(self, dest):
+        """Dump recorded events as JSON lines.
+
+        Args:
+          dest: a file path or a file-like object.
+        """
+        if isinstance(dest, six.string_types):
+            with open(dest, 'w') as f:
+                self._dump(f)
+        else:
+            self._dump(dest)
+
+    def _dump(self, f):
+        """Write recorded events to the file-like object `f`.
+        """
+        for event in self.events():
+            f.write(json.dumps(event, sort_keys=True))
+            f.write('\n')
+
+    def clear(self):
+        """Remove all recorded events.
+        """
+        self._events.clear()
+        self._dropped = 0
+
+    def _format(self, value):
+        """Convert a field value into a JSON serializable value.
+        """
+        if callable(value):
+            value = value()
+        if value is None or isinstance(value, (bool, int, float) +
+                                       six.string_types):
+            return value
+        if isinstance(value, (set, frozenset)):
+            return sorted((self._format(v) for v in value), key=str)
+        if isinstance(value, (list, tuple)):
+            return [self._format(v) for v in value]
+        if hasattr(value, 'name'):
+            return value.name
+        return str(value)
+
+    @property
+    def enabled(self):
+        """Whether the tracer records events or not.
+        """
+        return self._enabled
+
+    @property
+    def dropped(self):
+        """The number of events dropped because the buffer was full.
+        """
+        return self._dropped
+
+    def __len__(self):
+        return len(self._events)
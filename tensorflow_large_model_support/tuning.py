@@ -0,0 +1,381 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Parameter sweep
+
+Plan a graph with many combinations of LMS parameters in a process pool and
+score each plan with static estimates of the peak device memory and of the
+number of bytes transferred between the device and the host. The Pareto
+frontier of the two estimates shows the settings worth trying on the GPU.
+"""
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import random
+import sys
+
+import tensorflow as tf
+
+from tensorflow_large_model_support import cli
+from tensorflow_large_model_support import memory
+from tensorflow_large_model_support import topos
+from tensorflow_large_model_support.parallel import plan_meta_graph
+
+# serialized MetaGraphDef and optimizer scopes of the graph planned by the
+# workers of the pool
+_worker_graph = None
+
+
+def grid(param_grid):
+    """Return every combination of parameter values.
+
+    Args:
+      param_grid: a dictionary of LMS parameter names to lists of values.
+
+    Return:
+      A list of dictionaries.
+    """
+    names = sorted(param_grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*[param_grid[name]
+                                              for name in names])]
+
+
+def random_search(param_grid, n_iter, seed=None):
+    """Return `n_iter` distinct combinations of parameter values drawn at
+    random, or every combination if there are fewer.
+
+    Args:
+      param_grid: a dictionary of LMS parameter names to lists of values.
+      n_iter: the number of combinations.
+      seed: the seed of the random generator. Default `None`.
+
+    Return:
+      A list of dictionaries.
+    """
+    candidates = grid(param_grid)
+    if n_iter >= len(candidates):
+        return candidates
+    return random.Random(seed).sample(candidates, n_iter)
+
+
+def get_swap_bytes(swap_plan):
+    """Return the number of bytes transferred between the device and the
+    host by a swap plan, counting the swap-out and every swap-in of each
+    tensor.
+    """
+    return sum(swap['nbytes'] * (1 + len(swap['swapins']))
+               for swap in swap_plan.swaps)
+
+
+def _init_worker(meta_graph, optimizer_scopes):
+    global _worker_graph
+    _worker_graph = (meta_graph, optimizer_scopes)
+
+
+def _build_topo_sort(lms_obj):
+    """Build the topological order of the graph of `lms_obj` from the same
+    seed and gradient ops as `LMS.run`, without editing the graph.
+    """
+    lms_obj._build_gradient_ops()
+    topo_sort = topos.TOPOS(lms_obj._get_seed_ops(), lms_obj._grad_ops)
+    topo_sort.build()
+    return topo_sort
+
+
+def _evaluate(params):
+    """Plan a copy of the worker graph with `params` and score the plan.
+    """
+    meta_graph, optimizer_scopes = _worker_graph
+    meta_graph_def = tf.MetaGraphDef()
+    meta_graph_def.ParseFromString(meta_graph)
+    result = {'params': params}
+    try:
+        lms_obj = plan_meta_graph(meta_graph_def, optimizer_scopes, params)
+        topo_sort = lms_obj.topo_sort
+        if topo_sort is None:
+            # LMS is disabled, so the graph was imported but not edited
+            topo_sort = _build_topo_sort(lms_obj)
+    except ValueError as e:
+        result['error'] = str(e)
+        return result
+    result['n_swapped'] = len(lms_obj.plan)
+    result['swap_bytes'] = get_swap_bytes(lms_obj.plan)
+    result['host_peak_bytes'] = (lms_obj.host_memory or {}).get(
+        'peak_bytes', 0)
+    device_memory = memory.estimate_device_memory(
+        topo_sort, lms_obj.plan, params.get('batch_size', 1))
+    result['peak_bytes_without_lms'] = device_memory['peak_bytes_without_lms']
+    result['peak_bytes'] = device_memory['peak_bytes']
+    return result
+
+
+def pareto_frontier(results):
+    """Return the results that are not dominated in both the estimated peak
+    device memory and the swap volume, sorted by peak memory.
+
+    Args:
+      results: a list of results of `sweep`.
+
+    Return:
+      A list of results.
+    """
+    valid = sorted((r for r in results if 'error' not in r),
+                   key=lambda r: (r['peak_bytes'], r['swap_bytes']))
+    frontier = []
+    for result in valid:
+        if not frontier or result['swap_bytes'] < frontier[-1]['swap_bytes']:
+            frontier.append(result)
+    return frontier
+
+
+def recommend(frontier, budget_bytes=None):
+    """Return the result of the frontier to use: the one with the smallest
+    swap volume whose estimated peak fits in `budget_bytes`, or the one with
+    the smallest peak if no budget is given or none fits.
+    """
+    if not frontier:
+        return None
+    if budget_bytes is not None:
+        fitting = [r for r in frontier if r['peak_bytes'] <= budget_bytes]
+        if fitting:
+            return min(fitting, key=lambda r: r['swap_bytes'])
+    return frontier[0]
+
+
+def sweep(graph, optimizer_scopes, param_grid, n_iter=None, processes=None,
+          base_params=None, budget_bytes=None, seed=None):
+    """Plan a graph with combinations of LMS parameters in parallel.
+
+    Each combination is planned on a copy of the graph in a process of a
+    pool, so `graph` is not modified.
+
+    Args:
+      graph: a `tf.Graph`.
+      optimizer_scopes: a set of scopes for the optimizers/solvers.
+      param_grid: a dictionary of LMS parameter names to lists of values,
+        e.g. `{'n_tensors': [-1, 50, 100], 'lb': [1, 3, 5]}`.
+      n_iter: the number of combinations drawn at random. Default `None`
+        (every combination).
+      processes: the number of processes. `0` plans in this process.
+        Default `None` (the number of CPUs).
+      base_params: LMS parameters used by every combination. Default `None`.
+      budget_bytes: the device memory available, used to recommend a
+        setting. Default `None`.
+      seed: the seed of the random search. Default `None`.
+
+    Return:
+      A dictionary with the result of every combination (`results`), the
+      Pareto frontier (`frontier`) and the recommended result
+      (`recommended`). A result has the parameters (`params`), the
+      estimated peak device memory with and without swapping
+      (`peak_bytes` and `peak_bytes_without_lms`), the number of bytes
+      swapped (`swap_bytes`), the estimated peak host memory
+      (`host_peak_bytes`) and the number of swapped tensors (`n_swapped`),
+      or an `error` if LMS failed with these parameters.
+    """
+    if n_iter is None:
+        candidates = grid(param_grid)
+    else:
+        candidates = random_search(param_grid, n_iter, seed)
+    candidates = [dict(base_params or {}, **params) for params in candidates]
+
+    meta_graph = tf.train.export_meta_graph(
+        graph=graph).SerializeToString()
+    initargs = (meta_graph, optimizer_scopes)
+    if processes == 0:
+        _init_worker(*initargs)
+        results = [_evaluate(params) for params in candidates]
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, initargs)
+        try:
+            results = pool.map(_evaluate, candidates)
+        finally:
+            pool.close()
+            pool.join()
+
+    frontier = pareto_frontier(results)
+    return {'results': results,
+            'frontier': frontier,
+            'recommended': recommend(frontier, budget_bytes)}
+
+
+def _evaluate_value(build_fn, value, memory_bytes, optimizer_scopes,
+                    param_grid, lms_params, batch_size_search, use_lms,
+                    processes):
+    """Build the model for `value` and return the recommended result of a
+    sweep, with `fits` set if it is expected to fit in `memory_bytes`.
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        build_fn(value)
+    base_params = dict(lms_params or {})
+    if batch_size_search:
+        base_params['batch_size'] = value
+    if not use_lms:
+        base_params['n_tensors'] = 0
+        param_grid = {}
+    ret = sweep(graph, optimizer_scopes, param_grid or {},
+                processes=processes, base_params=base_params,
+                budget_bytes=memory_bytes)
+    result = ret['recommended']
+    if result is None:
+        errors = [r['error'] for r in ret['results'] if 'error' in r]
+        raise ValueError('LMS failed for {}: {}'.format(value, errors[0]))
+    return dict(result, value=value,
+                fits=result['peak_bytes'] <= memory_bytes)
+
+
+def find_max_config(build_fn, memory_bytes, optimizer_scopes, low=1,
+                    high=None, param_grid=None, lms_params=None,
+                    batch_size_search=True, use_lms=True, processes=0):
+    """Find the largest batch size or input resolution expected to fit in
+    the device memory.
+
+    The model is built on a new graph for each value tried, planned with
+    LMS and scored with the static estimate of `memory.estimate_device_memory`.
+    Values are doubled from `low` until one does not fit, or `high` is
+    reached, and the largest fitting value is then found by binary search.
+    The estimate ignores temporary memory of operations, so leave some room
+    in `memory_bytes`.
+
+    Args:
+      build_fn: a function taking the value, e.g. the batch size or the
+        image size, and building the model in the default graph.
+      memory_bytes: the device memory available in bytes.
+      optimizer_scopes: a set of scopes for the optimizers/solvers.
+      low: the smallest value. Default `1`.
+      high: the largest value. Default `None` (no limit).
+      param_grid: a dictionary of LMS parameter names to lists of values
+        tried for each value, see `sweep`. Default `None` (only
+        `lms_params`).
+      lms_params: LMS parameters used for every value. Default `None`.
+      batch_size_search: If True, the value is a batch size and is passed
+        to LMS as `batch_size` for the dimensions that are not known
+        statically. Set it to False to search the resolution. Default `True`.
+      use_lms: If False, find the largest value fitting without swapping.
+        Default `True`.
+      processes: the number of processes of the sweep for each value. `0`
+        plans in this process. Default `0`.
+
+    Return:
+      The result of `sweep` recommended for the largest fitting value, with
+      the value (`value`), or `None` if `low` does not fit. The LMS settings
+      to use are in `params`.
+    """
+    def evaluate(value):
+        return _evaluate_value(build_fn, value, memory_bytes,
+                               optimizer_scopes, param_grid, lms_params,
+                               batch_size_search, use_lms, processes)
+
+    best = evaluate(low)
+    if not best['fits']:
+        return None
+
+    # grow until a value does not fit
+    lo = low
+    hi = None
+    while hi is None:
+        value = lo * 2
+        if high is not None and value >= high:
+            value = high
+        if value == lo:
+            return best
+        result = evaluate(value)
+        if result['fits']:
+            lo, best = value, result
+        else:
+            hi = value
+
+    # the largest fitting value is in [lo, hi)
+    while hi - lo > 1:
+        value = (lo + hi) // 2
+        result = evaluate(value)
+        if result['fits']:
+            lo, best = value, result
+        else:
+            hi = value
+    return best
+
+
+def _format_result(result):
+    return '{:>12.1f} MB {:>12.1f} MB {:>8}  {}'.format(
+        result['peak_bytes'] / float(1 << 20),
+        result['swap_bytes'] / float(1 << 20),
+        result['n_swapped'], json.dumps(result['params'], sort_keys=True))
+
+
+def main(argv=None):
+    """Entry point of the `lms-sweep` command.
+    """
+    parser = argparse.ArgumentParser(
+        prog='lms-sweep',
+        description='Plan a saved graph with combinations of LMS parameters '
+                    'and print the Pareto frontier of the estimated peak '
+                    'device memory and the swap volume.')
+    parser.add_argument('graph', help='a MetaGraphDef or a GraphDef file')
+    parser.add_argument('--optimizer-scopes', nargs='*', default=[],
+                        help='scopes of the optimizers/solvers')
+    parser.add_argument('--grid', type=json.loads, required=True,
+                        metavar='JSON', help='LMS parameter names to lists of '
+                        'values, e.g. \'{"n_tensors": [-1, 50], '
+                        '"lb": [1, 3]}\'')
+    parser.add_argument('--params', type=json.loads, default={},
+                        metavar='JSON', help='LMS parameters used by every '
+                        'combination')
+    parser.add_argument('--n-iter', type=int, help='the number of '
+                        'combinations drawn at random')
+    parser.add_argument('--seed', type=int, help='the seed of the random '
+                        'search')
+    parser.add_argument('--processes', type=int,
+                        help='the number of processes')
+    parser.add_argument('--budget-mb', type=float, help='the device memory '
+                        'available, used to recommend a setting')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    graph, _ = cli.load_graph(args.graph)
+    budget_bytes = None
+    if args.budget_mb is not None:
+        budget_bytes = int(args.budget_mb * (1 << 20))
+    ret = sweep(graph, set(args.optimizer_scopes), args.grid, args.n_iter,
+                args.processes, args.params, budget_bytes, args.seed)
+    if args.json:
+        print(json.dumps(ret, sort_keys=True))
+        return 0
+
+    print('Pareto frontier ({} of {} settings):'.format(
+        len(ret['frontier']), len(ret['results'])))
+    print('{:>15} {:>15} {:>8}  {}'.format('peak memory', 'swap volume',
+                                           'tensors', 'parameters'))
+    for result in ret['frontier']:
+        print(_format_result(result))
+    for result in ret['results']:
+        if 'error' in result:
+            print('Failed with {}: {}'.format(
+                json.dumps(result['params'], sort_keys=True),
+                result['error']))
+    if ret['recommended'] is not None:
+        print('Recommended: {}'.format(
+            json.dumps(ret['recommended']['params'], sort_keys=True)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
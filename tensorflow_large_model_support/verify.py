@@ -0,0 +1,207 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+
+"""Edit verification
+
+Check the edits made by LMS as they are applied, instead of walking the
+whole edited graph once LMS is done. Each swap-out, swap-in and control
+dependency is checked locally, using the topological order of the original
+graph to bound the walks.
+"""
+
+
+def _get_next_ops(op):
+    """Return the ops consuming the outputs of `op` or depending on it
+    through control dependencies.
+    """
+    ret = [consuming_op for t in op.outputs for consuming_op in t.consumers()]
+    return ret + list(op._control_outputs)
+
+
+def _get_bound(topo_sort, op):
+    """Return the largest order of `op` or, if it has no order, of the ops
+    it depends on.
+    """
+    bound = -1
+    stack = [op]
+    visited = {op}
+    while stack:
+        cur_op = stack.pop()
+        order = topo_sort.get_order(cur_op)
+        if order >= 0:
+            bound = max(bound, order)
+            continue
+        for in_op in ([t.op for t in cur_op.inputs] +
+                      list(cur_op.control_inputs)):
+            if in_op not in visited:
+                visited.add(in_op)
+                stack.append(in_op)
+    return bound
+
+
+def reaches(topo_sort, op, target_op):
+    """Check whether `target_op` depends on `op`, through data or control
+    dependencies.
+
+    Orders increase along the edges of the original graph, so the walk
+    from `op` stops at ops ordered after `target_op`. The walk only goes
+    through the ops between `op` and `target_op` in the topological order,
+    and through the ops without an order, such as the ops added by LMS.
+
+    Args:
+      topo_sort: a `TOPOS` of the graph before it is edited.
+      op: a `tf.Operation`.
+      target_op: a `tf.Operation`.
+
+    Return:
+      A boolean.
+    """
+    bound = _get_bound(topo_sort, target_op)
+    stack = [op]
+    visited = {op}
+    while stack:
+        cur_op = stack.pop()
+        for next_op in _get_next_ops(cur_op):
+            if next_op is target_op:
+                return True
+            if next_op in visited:
+                continue
+            if 0 <= bound < topo_sort.get_order(next_op):
+                continue
+            visited.add(next_op)
+            stack.append(next_op)
+    return False
+
+
+class EditVerifier(object):
+    """EditVerifier class checks that the edits of LMS keep the graph
+    logically equivalent to the original one.
+
+    The checks are:
+      - a swapped tensor still reaches each of its consumers, through a
+        swap-out and a swap-in,
+      - control dependencies do not add cycles to the graph,
+      - a swap-in is triggered after the tensor is produced and before its
+        first consumer runs.
+
+    Failures are collected in `errors` rather than raised, so that all of
+    them can be reported.
+    """
+    def __init__(self, topo_sort):
+        """Create an EditVerifier object.
+
+        Args:
+          topo_sort: a `TOPOS` of the graph before it is edited.
+        """
+        self._topo_sort = topo_sort
+        self._errors = []
+        self._added_ops = set()
+
+    def _fail(self, message, *args):
+        self._errors.append(message.format(*args))
+
+    def check_swapout(self, ts0, swapout_op):
+        """Check a swap-out op added for the tensor `ts0`.
+
+        Args:
+          ts0: a `tf.Tensor`.
+          swapout_op: a `tf.Operation`.
+        """
+        self._added_ops.add(swapout_op)
+        if list(swapout_op.inputs) != [ts0]:
+            self._fail('Swap-out {} does not read tensor {}.',
+                       swapout_op.name, ts0.name)
+
+    def check_swapin(self, ts0, swapin_op, dest_ops):
+        """Check a swap-in op added for the tensor `ts0` and the ops
+        consuming it instead of `ts0`.
+
+        Args:
+          ts0: a `tf.Tensor`.
+          swapin_op: a `tf.Operation`.
+          dest_ops: a list of `tf.Operation`.
+        """
+        self._added_ops.add(swapin_op)
+        # follow the chain of swap ops back to the swapped tensor
+        t = swapin_op.outputs[0]
+        visited = set()
+        while t.op in self._added_ops and t.op not in visited:
+            visited.add(t.op)
+            if len(t.op.inputs) != 1:
+                break
+            t = t.op.inputs[0]
+        if t is not ts0:
+            self._fail('Swap-in {} does not read tensor {} but {}.',
+                       swapin_op.name, ts0.name, t.name)
+        for dest_op in dest_ops:
+            if swapin_op.outputs[0] not in list(dest_op.inputs):
+                self._fail('Operation {} does not consume swap-in {} of '
+                           'tensor {}.', dest_op.name, swapin_op.name,
+                           ts0.name)
+            elif ts0 in list(dest_op.inputs):
+                self._fail('Operation {} still consumes tensor {} besides '
+                           'swap-in {}.', dest_op.name, ts0.name,
+                           swapin_op.name)
+
+    def check_control_dependency(self, op, ctrld_op):
+        """Check a control dependency added from `ctrld_op` to `op`.
+
+        The dependency adds a cycle if `op` already reaches `ctrld_op`.
+
+        Args:
+          op: a `tf.Operation`.
+          ctrld_op: a `tf.Operation`.
+        """
+        if reaches(self._topo_sort, op, ctrld_op):
+            self._fail('Control dependency from {} to {} adds a cycle.',
+                       ctrld_op.name, op.name)
+
+    def check_swapin_trigger(self, src_op, swapin_op, ctrld_op, dest_ops):
+        """Check that the control dependency op `ctrld_op` of a swap-in runs
+        after `src_op`, which produces the swapped tensor, and before the
+        first op of `dest_ops` consuming the swap-in.
+
+        Args:
+          src_op: a `tf.Operation`.
+          swapin_op: a `tf.Operation`.
+          ctrld_op: a `tf.Operation`.
+          dest_ops: a list of `tf.Operation`.
+        """
+        src_order = self._topo_sort.get_order(src_op)
+        ctrld_order = self._topo_sort.get_order(ctrld_op)
+        dest_orders = [self._topo_sort.get_order(dest_op)
+                       for dest_op in dest_ops]
+        dest_orders = [order for order in dest_orders if order >= 0]
+        if ctrld_order < 0 or not dest_orders:
+            return
+        if not src_order < ctrld_order < min(dest_orders):
+            self._fail('Swap-in {} is triggered by {} (order {}), which is '
+                       'not between the producer {} (order {}) and the '
+                       'first consumer (order {}).', swapin_op.name,
+                       ctrld_op.name, ctrld_order, src_op.name, src_order,
+                       min(dest_orders))
+
+    @property
+    def errors(self):
+        """A list of failure messages, empty if every edit is valid.
+        """
+        return list(self._errors)
+
+    @property
+    def added_ops(self):
+        """The set of ops added by the checked edits.
+        """
+        return set(self._added_ops)
@@ -0,0 +1,152 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for adaptive re-planning."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+from tensorflow.core.framework import step_stats_pb2
+import tensorflow_large_model_support as lms
+from tensorflow_large_model_support import adaptive
+from tensorflow_large_model_support import plan
+import unittest
+import mock
+
+
+def _step_stats(times):
+    """Build a StepStats protobuf from a dict of node name to (start, end).
+    """
+    step_stats = step_stats_pb2.StepStats()
+    dev_stats = step_stats.dev_stats.add()
+    for name, (start, end) in times.items():
+        node_stats = dev_stats.node_stats.add()
+        node_stats.node_name = name
+        node_stats.all_start_micros = start
+        node_stats.all_end_rel_micros = end - start
+    return step_stats
+
+
+class SwapProfilerTest(unittest.TestCase):
+
+    def _build_profiler(self):
+        swap_plan = plan.SwapPlan()
+        swap_plan.add_swapout('relu:0', 'relu', 'lms/swapout', 2)
+        swap_plan.add_swapin('relu:0', 'lms/swapin', ['grad1'], [8])
+        swap_plan.add_control_dependency('lms/swapin', 'grad0', 6)
+        swap_plan.add_swapout('conv:0', 'conv', 'lms/swapout_1', 3)
+        swap_plan.add_swapin('conv:0', 'lms/swapin_1', ['grad2'], [7])
+
+        def get_op(name):
+            other = mock.Mock()
+            other.op.name = 'other_' + name
+            swapin = mock.Mock()
+            swapin.op.name = {'grad1': 'lms/swapin',
+                              'grad2': 'lms/swapin_1'}[name]
+            return mock.Mock(inputs=[other, swapin], control_inputs=[])
+
+        graph = mock.Mock()
+        graph.get_operation_by_name.side_effect = get_op
+        return adaptive.SwapProfiler(swap_plan, graph, lb=1, ub=5)
+
+    def test_add_step_stats(self):
+        profiler = self._build_profiler()
+        # grad1 waits 30us on its swap-in, received through a Recv node.
+        # grad2 does not wait.
+        profiler.add_step_stats(_step_stats({
+            'lms/swapin': (0, 10),
+            'lms/swapin/_12:_Recv': (10, 50),
+            'other_grad1': (0, 20),
+            'grad1': (50, 60),
+            'lms/swapin_1': (0, 10),
+            'other_grad2': (0, 40),
+            'grad2': (40, 50)}))
+        # steps without swap-in stats are not counted
+        profiler.add_step_stats(_step_stats({'unrelated': (0, 10)}))
+        self.assertEqual(profiler.n_steps, 1)
+        self.assertEqual(profiler.get_waits(),
+                         {('lms/swapin', 'grad1'): 30.0,
+                          ('lms/swapin_1', 'grad2'): 0.0})
+
+    def test_recommend(self):
+        profiler = self._build_profiler()
+        self.assertEqual(profiler.recommend({'x:0': 3}), {'x:0': 3})
+        profiler.add_step_stats(_step_stats({
+            'lms/swapin': (0, 50),
+            'other_grad1': (0, 20),
+            'grad1': (50, 60),
+            'lms/swapin_1': (0, 50),
+            'other_grad2': (0, 20),
+            'grad2': (50, 60)}))
+        # relu:0 was prefetched 2 orders ahead by its control dependency,
+        # conv:0 had no control dependency and used lb.
+        self.assertEqual(profiler.recommend(),
+                         {'relu:0': 4, 'conv:0': 2})
+        # distances are capped by ub
+        self.assertEqual(profiler.recommend({'relu:0': 4}),
+                         {'relu:0': 5, 'conv:0': 2})
+        # conv:0 is 4 orders before its consumer, so a doubled distance of
+        # 6 is capped at 3 instead of being reset by LMS
+        self.assertEqual(profiler.recommend({'conv:0': 3}),
+                         {'relu:0': 4, 'conv:0': 3})
+
+
+class LMSSessionRunHookTest(unittest.TestCase):
+
+    @mock.patch('tensorflow_large_model_support.adaptive.SwapProfiler')
+    @mock.patch('tensorflow_large_model_support.lms.LMS.run')
+    def test_adaptive(self, run, profiler):
+        lms.lms.clear_plan_cache()
+        hook = lms.LMSSessionRunHook({'s1'}, adaptive=True,
+                                     adaptive_every_n_steps=2,
+                                     prefetch_distances={'a:0': 3})
+        with mock.patch('tensorflow_large_model_support.plan.SwapPlan'
+                        '.__len__', return_value=1):
+            hook.begin()
+        self.assertEqual(hook.lms_obj._prefetch_distances, {'a:0': 3})
+        self.assertTrue(profiler.called)
+
+        self.assertIsNone(hook.before_run(mock.Mock()))
+        args = hook.before_run(mock.Mock())
+        self.assertEqual(args.options.trace_level,
+                         tf.RunOptions.FULL_TRACE)
+
+        run_values = mock.Mock()
+        hook.after_run(mock.Mock(), run_values)
+        profiler.return_value.add_step_stats.assert_called_once_with(
+            run_values.run_metadata.step_stats)
+
+        profiler.return_value.n_steps = 1
+        profiler.return_value.recommend.return_value = {'a:0': 6}
+        hook.end(mock.Mock())
+        profiler.return_value.recommend.assert_called_once_with({'a:0': 3})
+        self.assertEqual(hook.prefetch_distances, {'a:0': 6})
+
+        # The recommendation is used the next time the graph is edited
+        hook.begin()
+        self.assertEqual(hook.lms_obj._prefetch_distances, {'a:0': 6})
+
+    def test_get_lb(self):
+        lms_test = lms.LMS({'s1'}, lb=3, prefetch_distances={'a:0': 7})
+        ts0 = mock.Mock()
+        ts0.name = 'a:0'
+        lms_test._plan.add_swapin(ts0, 'swapin_op', ['dest_op'], [10])
+        self.assertEqual(lms_test._get_lb('swapin_op'), 7)
+        self.assertEqual(lms_test._get_lb('other_swapin_op'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the command-line analyzer."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+
+import six
+import tensorflow as tf
+from tensorflow_large_model_support import cli
+from tensorflow_large_model_support import plan
+import unittest
+import model_util
+import mock
+
+
+class CLITest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._graph = model_util.build_model()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _main(self, argv):
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout:
+            self.assertEqual(cli.main(argv), 0)
+        return stdout.getvalue()
+
+    def test_meta_graph(self):
+        path = os.path.join(self._dir, 'model.meta')
+        tf.train.export_meta_graph(filename=path, graph=self._graph)
+        output = os.path.join(self._dir, 'lms.meta')
+        plan_path = os.path.join(self._dir, 'plan.json')
+        text = self._main([path, '--optimizer-scopes', 'optimizer',
+                           '--lb', '2', '--swapout-policy',
+                           'after_last_consumer', '--output', output,
+                           '--plan', plan_path])
+        self.assertIn('tensors swapped', text)
+        self.assertIn('swap_insertion', text)
+        self.assertIn('device peak with LMS', text)
+
+        with open(plan_path) as f:
+            swap_plan = plan.SwapPlan.from_json(f.read())
+        self.assertTrue(len(swap_plan))
+        graph, is_meta_graph = cli.load_graph(output)
+        self.assertTrue(is_meta_graph)
+        self.assertEqual(
+            {op.name for op in graph.get_operations()
+             if op.name.startswith('lms/')},
+            {name for swap in swap_plan.swaps
+             for name in [swap['swapout_op']] +
+             [swapin['swapin_op'] for swapin in swap['swapins']]})
+        # variables and collections are kept
+        self.assertEqual(len(graph.get_collection('variables')), 3)
+
+    def test_graph_def(self):
+        path = os.path.join(self._dir, 'model.pbtxt')
+        tf.train.write_graph(self._graph.as_graph_def(), self._dir,
+                             'model.pbtxt', as_text=True)
+        summary = json.loads(self._main([path, '--optimizer-scopes',
+                                         'optimizer', '--json',
+                                         '--batch-size', '4']))
+        self.assertTrue(summary['plan']['swaps'])
+        self.assertEqual([phase for phase, _ in summary['timings_ms']],
+                         ['load', 'seed_ops', 'reachable_ops',
+                          'topological_sort', 'swap_insertion',
+                          'validation', 'host_memory_estimation'])
+        self.assertGreater(summary['device_memory']['peak_bytes'], 0)
+        graph, is_meta_graph = cli.load_graph(path)
+        self.assertFalse(is_meta_graph)
+
+    def test_lms_arguments(self):
+        args = cli._build_parser().parse_args(
+            ['model.meta', '--excl-types', 'Relu', 'MatMul',
+             '--debug', 'true', '--prefetch-distances', '{"a:0": 2}',
+             '--host-mem-limit-mb', '100'])
+        self.assertEqual(args.excl_types, ['Relu', 'MatMul'])
+        self.assertTrue(args.debug)
+        self.assertEqual(args.prefetch_distances, {'a:0': 2})
+        self.assertEqual(args.host_mem_limit_mb, 100)
+        self.assertEqual(args.lb, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for distributed planning."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import tensorflow_large_model_support as lms
+from tensorflow_large_model_support import distributed
+from tensorflow_large_model_support import plan
+import unittest
+import model_util
+import mock
+
+
+def _edit_graph(rank, path, out_path):
+    """Edit the model as `rank` and save the plan and the edited graph."""
+    graph = model_util.build_model()
+    lms_obj = lms.LMS({'optimizer'}, graph=graph)
+    with mock.patch.object(lms.LMS, 'run', wraps=lms_obj.run) as run:
+        distributed.run_lms(lms_obj,
+                            distributed.FileTransport(path, timeout=60,
+                                                      poll_interval=0.1),
+                            rank=rank)
+        analyzed = run.called
+    with open(out_path, 'w') as f:
+        json.dump({'analyzed': analyzed,
+                   'plan': lms_obj.plan.to_dict(),
+                   'inputs': [[t.name for t in op.inputs] +
+                              [c.name for c in op.control_inputs]
+                              for op in graph.get_operations()]}, f)
+
+
+class DistributedTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    @mock.patch.dict(os.environ, {}, clear=True)
+    def test_get_rank(self):
+        self.assertEqual(distributed.get_rank(), 0)
+        os.environ['OMPI_COMM_WORLD_RANK'] = '2'
+        self.assertEqual(distributed.get_rank(), 2)
+        os.environ['HOROVOD_RANK'] = '3'
+        self.assertEqual(distributed.get_rank(), 3)
+
+    @mock.patch.dict(os.environ, {}, clear=True)
+    def test_get_job_id(self):
+        self.assertEqual(distributed.get_job_id(), '')
+        os.environ['LSB_JOBID'] = '42'
+        self.assertEqual(distributed.get_job_id(), '42')
+
+    def test_file_transport(self):
+        path = os.path.join(self._dir, 'plan.json')
+        swap_plan = plan.SwapPlan()
+        swap_plan.add_swapout('a:0', 'a', 'lms/swapout', 1)
+        transport = distributed.FileTransport(path, timeout=0,
+                                              poll_interval=0)
+        self.assertRaises(ValueError, transport.broadcast, 'key')
+        self.assertIs(transport.broadcast('key', swap_plan), swap_plan)
+        self.assertEqual(transport.broadcast('key').to_dict(),
+                         swap_plan.to_dict())
+        # a plan made for another graph
+        self.assertRaises(ValueError, transport.broadcast, 'other')
+        # a plan left by another job
+        transport = distributed.FileTransport(path, timeout=0,
+                                              poll_interval=0, job_id='2')
+        self.assertRaises(ValueError, transport.broadcast, 'key')
+        transport.clear()
+        self.assertFalse(os.path.exists(path))
+
+    def test_callable_transport(self):
+        swap_plan = plan.SwapPlan()
+        swap_plan.add_swapout('a:0', 'a', 'lms/swapout', 1)
+        sent = []
+
+        def broadcast_fn(value):
+            if value is not None:
+                sent.append(value)
+            return sent[0]
+        transport = distributed.CallableTransport(broadcast_fn)
+        self.assertIs(transport.broadcast('key', swap_plan), swap_plan)
+        self.assertEqual(transport.broadcast('key').to_dict(),
+                         swap_plan.to_dict())
+        self.assertRaises(ValueError, transport.broadcast, 'other')
+        self.assertIsInstance(distributed.get_transport(broadcast_fn),
+                              distributed.CallableTransport)
+        self.assertIsInstance(distributed.get_transport('plan.json'),
+                              distributed.FileTransport)
+
+    def test_run_lms_stale_plan(self):
+        path = os.path.join(self._dir, 'plan.json')
+        # a plan left by a job run with other parameters on the same graph
+        lms_obj = lms.LMS({'optimizer'}, graph=model_util.build_model(), lb=2)
+        distributed.run_lms(lms_obj, path, rank=0, lms_args={'lb': 2})
+        self.assertTrue(lms_obj.plan.swaps)
+
+        transport = distributed.FileTransport(path, timeout=0,
+                                              poll_interval=0)
+        lms_obj = lms.LMS({'optimizer'}, graph=model_util.build_model(), lb=3)
+        with mock.patch.object(lms.LMS, 'apply_plan') as apply_plan:
+            self.assertRaises(ValueError, distributed.run_lms, lms_obj,
+                              transport, rank=1, lms_args={'lb': 3})
+            self.assertFalse(apply_plan.called)
+
+        # rank 0 removes the stale plan before analyzing the graph
+        lms_obj = lms.LMS({'optimizer'}, graph=model_util.build_model(), lb=3)
+
+        def run(graph=None):
+            self.assertFalse(os.path.exists(path))
+        with mock.patch.object(lms_obj, 'run', side_effect=run):
+            distributed.run_lms(lms_obj, transport, rank=0,
+                                lms_args={'lb': 3})
+        lms_obj = lms.LMS({'optimizer'}, graph=model_util.build_model(), lb=3)
+        with mock.patch.object(lms.LMS, 'apply_plan') as apply_plan:
+            distributed.run_lms(lms_obj, transport, rank=1,
+                                lms_args={'lb': 3})
+            self.assertTrue(apply_plan.called)
+
+    def test_run_lms_processes(self):
+        path = os.path.join(self._dir, 'plan.json')
+        out_paths = [os.path.join(self._dir, 'rank%d.json' % rank)
+                     for rank in range(3)]
+        # the other ranks start first and wait for the plan of rank 0
+        procs = [multiprocessing.Process(target=_edit_graph,
+                                         args=(rank, path, out_paths[rank]))
+                 for rank in (1, 2, 0)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join(120)
+            self.assertEqual(proc.exitcode, 0)
+
+        results = []
+        for out_path in out_paths:
+            with open(out_path) as f:
+                results.append(json.load(f))
+        self.assertEqual([r['analyzed'] for r in results],
+                         [True, False, False])
+        self.assertTrue(results[0]['plan']['swaps'])
+        for result in results[1:]:
+            self.assertEqual(result['plan'], results[0]['plan'])
+            self.assertEqual(result['inputs'], results[0]['inputs'])
+
+
+if __name__ == '__main__':
+    unittest.main()
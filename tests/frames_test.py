@@ -0,0 +1,82 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for control flow frames."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+from tensorflow_large_model_support import frames
+import unittest
+
+
+class FrameInfoTest(unittest.TestCase):
+
+    def test_cond(self):
+        with tf.Graph().as_default() as graph:
+            x = tf.placeholder(tf.float32, [2], name='x')
+            pred = tf.placeholder(tf.bool, [], name='pred')
+            a = tf.nn.relu(x, name='a')
+            out = tf.cond(pred, lambda: tf.nn.relu(a, name='t'),
+                          lambda: tf.nn.relu(a, name='f'))
+            b = tf.nn.relu(out, name='b')
+        info = frames.FrameInfo()
+        t_op = graph.get_operation_by_name('cond/t')
+        f_op = graph.get_operation_by_name('cond/f')
+        self.assertEqual(info.get_context(a.op), ())
+        self.assertEqual(len(info.get_context(t_op)), 1)
+        self.assertEqual(info.get_context(t_op)[0][1], 1)
+        self.assertEqual(info.get_context(f_op)[0][1], 0)
+        self.assertEqual(info.get_context(out.op), ())
+        self.assertEqual(info.get_context(b.op), ())
+
+        self.assertTrue(info.is_valid_ctrld_op(a.op, t_op))
+        self.assertTrue(info.is_valid_ctrld_op(t_op, t_op))
+        self.assertFalse(info.is_valid_ctrld_op(t_op, b.op))
+        self.assertFalse(info.is_valid_ctrld_op(f_op, t_op))
+        # control flow ops are never valid
+        self.assertFalse(info.is_valid_ctrld_op(out.op, b.op))
+
+    def test_while_loop(self):
+        with tf.Graph().as_default() as graph:
+            x = tf.placeholder(tf.float32, [2], name='x')
+            _, out = tf.while_loop(lambda i, s: i < 3,
+                                   lambda i, s: (i + 1, tf.nn.relu(
+                                       s, name='body')),
+                                   [tf.constant(0), x])
+            b = tf.nn.relu(out, name='b')
+        info = frames.FrameInfo()
+        body_op = graph.get_operation_by_name('while/body')
+        self.assertEqual(info.get_frame(x.op), ())
+        self.assertEqual(info.get_frame(body_op), ('while/while_context',))
+        # the body of a loop is not a cond branch
+        self.assertEqual(info.get_context(body_op), ())
+        self.assertEqual(info.get_frame(out.op), ())
+        self.assertEqual(info.get_frame(b.op), ())
+        self.assertFalse(info.is_valid_ctrld_op(x.op, body_op))
+        self.assertFalse(info.is_valid_ctrld_op(body_op, b.op))
+        self.assertTrue(info.is_valid_ctrld_op(x.op, b.op))
+
+        merge_op = [op for op in graph.get_operations()
+                    if op.type == 'Merge'][0]
+        next_op = [t.op for t in merge_op.inputs
+                   if t.op.type == 'NextIteration'][0]
+        self.assertTrue(frames.is_back_edge(next_op, merge_op))
+        self.assertFalse(frames.is_back_edge(merge_op, next_op))
+
+
+if __name__ == '__main__':
+    unittest.main()
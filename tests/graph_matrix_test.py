@@ -0,0 +1,120 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the LMS graph_matrix module."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+import tensorflow.contrib.graph_editor as ge
+from tensorflow_large_model_support import graph_matrix
+import toposort
+import unittest
+import model_util
+
+
+class GraphMatrixTest(unittest.TestCase):
+
+    def test_walks(self):
+        graph = model_util.build_model(relu_name='relu%d')
+        matrix = graph_matrix.GraphMatrix(graph)
+        self.assertEqual(matrix.size, len(graph.get_operations()))
+        x = graph.get_operation_by_name('x')
+        relu1 = graph.get_operation_by_name('relu1')
+        grad_ops = set(ge.filter_ops_from_regex(graph.get_operations(),
+                                                '^optimizer'))
+
+        self.assertEqual(matrix.get_forward_walk_ops([x]),
+                         set(ge.get_forward_walk_ops([x])))
+        self.assertEqual(matrix.get_forward_walk_ops([x], inclusive=False),
+                         set(ge.get_forward_walk_ops([x], inclusive=False)))
+        within_ops = set(graph.get_operations()) - grad_ops
+        self.assertEqual(
+            matrix.get_forward_walk_ops([x], within_ops=within_ops),
+            set(ge.get_forward_walk_ops([x], within_ops=within_ops)))
+        self.assertEqual(matrix.get_backward_walk_ops([relu1]),
+                         set(ge.get_backward_walk_ops([relu1])))
+        self.assertEqual(
+            matrix.get_walks_intersection_ops([x], grad_ops),
+            set(ge.get_walks_intersection_ops([x], list(grad_ops))))
+
+    def test_get_forward_coverage(self):
+        graph = model_util.build_model(relu_name='relu%d')
+        matrix = graph_matrix.GraphMatrix(graph)
+        relus = [graph.get_operation_by_name('relu%d' % i) for i in range(3)]
+        coverage = matrix.get_forward_coverage(relus, relus)
+        self.assertEqual([coverage[op] for op in relus], [2, 1, 0])
+
+    def test_get_forward_coverage_seeds(self):
+        with tf.Graph().as_default() as graph:
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            a = tf.nn.relu(x, name='a')
+            b = tf.nn.relu(a, name='b')
+            c = tf.nn.relu(x, name='c')
+            d = tf.add(b, c, name='d')
+        matrix = graph_matrix.GraphMatrix(graph)
+        ops = [x.op, a.op, b.op, c.op, d.op]
+        coverage = matrix.get_forward_coverage([x.op, a.op, c.op, d.op], ops)
+        self.assertEqual(coverage, {x.op: 4, a.op: 2, c.op: 1, d.op: 0})
+        # d is reached from a only through b
+        coverage = matrix.get_forward_coverage(
+            [x.op, a.op, c.op, b.op], ops, within_ops=[x.op, a.op, c.op, d.op])
+        self.assertEqual(coverage, {x.op: 3, a.op: 0, c.op: 1, b.op: 0})
+
+        # the same counts as one walk per seed
+        graph = model_util.build_model(relu_name='relu%d')
+        matrix = graph_matrix.GraphMatrix(graph)
+        ops = graph.get_operations()
+        within_ops = [op for op in ops
+                      if not op.name.startswith('optimizer')]
+        coverage = matrix.get_forward_coverage(ops, within_ops, within_ops)
+        # seeds walked in batches
+        self.assertEqual(matrix.get_forward_coverage(
+            ops, within_ops, within_ops, batch_size=3), coverage)
+        self.assertRaises(ValueError, matrix.get_forward_coverage, ops, ops,
+                          batch_size=0)
+        for op in ops:
+            expected = (len(set(ge.get_forward_walk_ops(
+                op, within_ops=within_ops, inclusive=False)) &
+                set(within_ops)) if op in within_ops else 0)
+            self.assertEqual(coverage[op], expected)
+
+    def test_toposort(self):
+        with tf.Graph().as_default() as graph:
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            a = tf.nn.relu(x, name='a')
+            with tf.control_dependencies([a]):
+                b = tf.identity(x, name='b')
+            c = tf.add(a, b, name='c')
+        matrix = graph_matrix.GraphMatrix(graph)
+        self.assertEqual(matrix.toposort([x.op], set()),
+                         [{x.op}, {a.op}, {b.op}, {c.op}])
+
+    def test_toposort_cycle(self):
+        with tf.Graph().as_default() as graph:
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            a = tf.nn.relu(x, name='a')
+            b = tf.nn.relu(a, name='b')
+        # make `a` wait for `b`
+        a.op._add_control_input(b.op)
+        matrix = graph_matrix.GraphMatrix(graph)
+        self.assertRaises(toposort.CircularDependencyError,
+                          matrix.toposort, [x.op], set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the end-to-end harness."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import mock
+import tensorflow as tf
+from tensorflow_large_model_support import harness
+import unittest
+
+
+def _build_mlp(batch_size, rng):
+    x = tf.placeholder(tf.float32, [None, 4])
+    h = x
+    for i in range(4):
+        w = tf.Variable(tf.random_normal([4, 4]), name='w%d' % i)
+        h = tf.nn.relu(tf.matmul(h, w))
+    loss = tf.reduce_sum(h)
+    gradients, train_op = harness._minimize(
+        tf.train.GradientDescentOptimizer(0.1), loss, 'optimizer')
+    return {'loss': loss, 'gradients': gradients, 'train_op': train_op,
+            'feed_dict': {x: rng.uniform(size=(batch_size, 4))}}
+
+
+class HarnessTest(unittest.TestCase):
+
+    def test_get_session_config(self):
+        with tf.Session(graph=tf.Graph(),
+                        config=harness.get_session_config()) as sess:
+            devices = [d.name for d in sess.list_devices()
+                       if d.device_type == 'CPU']
+        self.assertEqual(len(devices), 2)
+
+    def test_run_model(self):
+        ret = harness.run_model(_build_mlp, {'optimizer'}, steps=3)
+        self.assertEqual(len(ret['losses']), 3)
+        self.assertEqual(len(ret['gradients'][0]), 4)
+        self.assertEqual(len(ret['step_times']), 2)
+        self.assertEqual(ret['n_swapped'], 0)
+
+        ret = harness.run_model(_build_mlp, {'optimizer'}, steps=2,
+                                lms_args={})
+        self.assertGreater(ret['n_swapped'], 0)
+        self.assertGreater(ret['n_added_ops'], 0)
+
+    def test_compare(self):
+        ret = harness.compare(_build_mlp, {'optimizer'}, steps=2)
+        self.assertTrue(ret['match'])
+        self.assertEqual(ret['max_loss_diff'], 0.0)
+        self.assertEqual(ret['max_grad_diff'], 0.0)
+        self.assertGreater(ret['n_swapped'], 0)
+        self.assertGreater(ret['step_time_without_lms'], 0.0)
+
+        self.assertRaises(ValueError, harness.compare, _build_mlp,
+                          {'optimizer'}, 1)
+
+    def test_compare_mnist_deep(self):
+        ret = harness.compare_model('mnist_deep', steps=2)
+        self.assertTrue(ret['match'])
+        self.assertGreater(ret['n_swapped'], 0)
+
+        self.assertRaises(ValueError, harness.compare_model, 'unknown')
+
+    def test_main(self):
+        result = {'match': False, 'max_loss_diff': 1.0, 'max_grad_diff': 1.0,
+                  'step_time': 0.2, 'step_time_without_lms': 0.1,
+                  'overhead': 1.0, 'n_swapped': 2, 'n_added_ops': 4}
+        with mock.patch.object(harness, 'compare_model',
+                               return_value=result) as compare_model:
+            ret = harness.main(['--models', 'mnist_deep', '--params',
+                                '{"lb": 2}', '--json'])
+        self.assertEqual(ret, 1)
+        compare_model.assert_called_once_with('mnist_deep', 3, 2, 0,
+                                              {'lb': 2}, 1e-5, 1e-7)
+
+
+if __name__ == '__main__':
+    unittest.main()
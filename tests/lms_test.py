@@ -20,8 +20,16 @@ from __future__ import division
 from __future__ import print_function
 
 from six import assertCountEqual
+import numpy as np
+import tensorflow as tf
 import tensorflow_large_model_support as lms
+from tensorflow_large_model_support import frames
+from tensorflow_large_model_support import harness
+from tensorflow_large_model_support import plan
+from tensorflow_large_model_support import policy
+from tensorflow_large_model_support import topos
 import unittest
+import model_util
 import mock
 
 
@@ -31,7 +39,7 @@ class LMSTest(unittest.TestCase):
     @mock.patch('tensorflow.contrib.graph_editor.sgv')
     @mock.patch('tensorflow.identity')
     def test_add_swapout(self, identity, sgv, connect_ops):
-        graph = mock.Mock()
+        graph = mock.MagicMock()
         lms_modifier = lms.LMS(graph=graph,
                                optimizer_scopes={'s1'})
         src_op = mock.Mock()
@@ -53,7 +61,7 @@ class LMSTest(unittest.TestCase):
     @mock.patch('tensorflow.contrib.graph_editor.sgv')
     @mock.patch('tensorflow.identity')
     def test_add_swapin(self, identity, sgv, connect_ops):
-        graph = mock.Mock()
+        graph = mock.MagicMock()
         lms_modifier = lms.LMS({'s1'}, graph=graph)
         lms_modifier._topo_sort = mock.Mock()
         dest_op = mock.Mock()
@@ -74,23 +82,12 @@ class LMSTest(unittest.TestCase):
         self.assertEqual(ret, swapin.op)
         self.assertEqual(lms_modifier._excl_ops, {swapin.op})
 
-    def test_get_branch_ops(self):
-        lms_test = lms.LMS({'s1'})
-        lms_test._topo_sort = mock.Mock()
-        lms_test._topo_sort.size = 6
-        threshold = 3
-        within_ops = {'f1', 'f2', 'f3', 'f4', 'f5', 'f6'}
-        common_orders = {'f1': 1, 'f2': 2, 'f3': 3, 'f4': 4, 'f5': 5, 'f6': 6}
-        lms_test._topo_sort.get_order = lambda x: common_orders.get(x, -1)
-        ret = lms_test._get_branch_ops(within_ops, threshold)
-        self.assertEqual(ret, {'f5', 'f6'})
-
     @mock.patch('tensorflow.contrib.graph_editor.sgv')
     @mock.patch('tensorflow_large_model_support.lms.LMS._connect_ops')
     @mock.patch('tensorflow_large_model_support.lms.LMS._add_control_dependency')
     @mock.patch('tensorflow.identity')
     def test_fuse_swapin_ops(self, identity, ctrl_dep, connect, sgv):
-        lms_test = lms.LMS({'s1'}, graph=mock.Mock(), lb=5, ub=500)
+        lms_test = lms.LMS({'s1'}, graph=mock.MagicMock(), lb=5, ub=500)
         lms_test._topo_sort = mock.Mock()
         # Mock get_order to return the "order" value from the mock op
         lms_test._topo_sort.get_order = lambda x: x.order
@@ -125,6 +122,52 @@ class LMSTest(unittest.TestCase):
         self.assertEqual(lms_test._excl_ops, {swap_in.op})
         ctrl_dep.assert_called_once_with(src_op, earliest_op, swap_in.op)
 
+        # Fuse consumers within 3 levels: {op4, op5}, {op3} and {op1}
+        ctrl_dep.reset_mock()
+        lms_test._fuse_window = 3
+        lms_test._excl_ops = set()
+        ret = lms_test._fuse_swapin_ops(src_op, swapout_op, set(bw_fr_ops),
+                                        ts0)
+        self.assertEqual(ret, {bw_fr_ops[0], bw_fr_ops[1], bw_fr_ops[2],
+                               bw_fr_ops[5]})
+        ctrl_dep.assert_called_once_with(src_op, earliest_op, swap_in.op)
+
+        # the traced orders are computed when the events are read, each for
+        # its own consuming op
+        lms_test = lms.LMS({'s1'}, graph=mock.MagicMock(), trace=True)
+        lms_test._topo_sort = mock.Mock()
+        lms_test._topo_sort.get_order = lambda x: x.order
+        lms_test._topo_sort.size = 200
+        lms_test._fuse_swapin_ops(src_op, swapout_op, set(bw_fr_ops), ts0)
+        lms_test._topo_sort.get_order = mock.Mock(
+            side_effect=lambda x: x.order)
+        events = list(lms_test.tracer._events)
+        self.assertFalse(lms_test._topo_sort.get_order.called)
+        orders = {fields['dest_op']: fields['order']()
+                  for _, kind, fields in events}
+        self.assertEqual(orders, {op: op.order for op in bw_fr_ops
+                                  if op.order >= 0})
+
+    def test_get_fuse_groups(self):
+        lms_test = lms.LMS({'s1'}, graph=mock.MagicMock(), fuse_window=2)
+        lms_test._topo_sort = mock.Mock()
+        lms_test._topo_sort.get_order = lambda x: x.order
+        ops = [mock.Mock(order=order) for order in [9, 1, 3, 4, 6, 10, 11]]
+        for i, op in enumerate(ops):
+            op.name = 'op%d' % i
+        self.assertEqual(lms_test._get_fuse_groups(set(ops)),
+                         [[ops[1], ops[2]], [ops[3], ops[4]],
+                          [ops[0], ops[5], ops[6]]])
+        lms_test._fuse_window = 0
+        self.assertEqual(len(lms_test._get_fuse_groups(set(ops))), 7)
+        lms_test._fuse_window = None
+        self.assertEqual(lms_test._get_fuse_groups(set(ops)),
+                         [[ops[1], ops[2], ops[3], ops[4], ops[0], ops[5],
+                           ops[6]]])
+        self.assertEqual(lms_test._get_fuse_groups(set()), [])
+
+        self.assertRaises(ValueError, lms.LMS, {'s1'}, fuse_window=-1)
+
     @mock.patch('tensorflow_large_model_support.lms.LMS._find_new_src_op')
     @mock.patch('tensorflow_large_model_support.lms.LMS._fuse_swapin_ops')
     @mock.patch('tensorflow_large_model_support.lms.LMS._add_control_dependency')
@@ -431,7 +474,7 @@ class LMSTest(unittest.TestCase):
         self.assertTrue(grad.called)
         self.assertTrue(seed.called)
         self.assertTrue(fwd_walk.call_count, len(seed_ops))
-        reachable = set(fwd_walk.return_value) - set(grad_ops)
+        reachable = set(fwd_walk.return_value)
         filter.assert_has_calls([mock.call(reachable, mock.ANY, mock.ANY),
                                  mock.call(reachable, mock.ANY, mock.ANY)])
         self.assertTrue(build.called)
@@ -632,6 +675,39 @@ class LMSTest(unittest.TestCase):
         add_ctrl_input.assert_called_once_with(swapin_op,
                                                mock.sentinel.ctl_op)
 
+        # Test when the prefetch distance of the tensor is out of range
+        do_chain.reset_mock()
+        add_ctrl_input.reset_mock()
+        lms_test = lms.LMS({'s1'}, ctrld_strategy="chain_rule", lb=1, ub=20,
+                           prefetch_distances={'t:0': 16})
+        lms_test._topo_sort = mock.Mock()
+        lms_test._topo_sort.get_order.side_effect = [26, 15]
+        ts0 = mock.Mock()
+        ts0.name = 't:0'
+        lms_test._plan = mock.Mock()
+        lms_test._plan.get_swapped_tensor.return_value = ts0
+        lms_test._add_control_dependency(fw_op, bw_op, swapin_op)
+        # clamped to the largest distance in range instead of reset to 1
+        do_chain.assert_called_once_with(fw_op, bw_op, 10, 20)
+
+        # a prefetch distance of the tensor equal to lb is clamped too
+        do_chain.reset_mock()
+        lms_test = lms.LMS({'s1'}, ctrld_strategy="chain_rule", lb=16,
+                           ub=20, prefetch_distances={'t:0': 16})
+        lms_test._topo_sort = mock.Mock()
+        lms_test._topo_sort.get_order.side_effect = [26, 15]
+        lms_test._plan = mock.Mock()
+        lms_test._plan.get_swapped_tensor.return_value = ts0
+        lms_test._add_control_dependency(fw_op, bw_op, swapin_op)
+        do_chain.assert_called_once_with(fw_op, bw_op, 10, 20)
+
+        # the default lb is reset to 1
+        do_chain.reset_mock()
+        ts0.name = 'u:0'
+        lms_test._topo_sort.get_order.side_effect = [26, 15]
+        lms_test._add_control_dependency(fw_op, bw_op, swapin_op)
+        do_chain.assert_called_once_with(fw_op, bw_op, 1, 20)
+
         # Test with direct_order
         do_chain.reset_mock()
         add_ctrl_input.reset_mock()
@@ -732,8 +808,13 @@ class LMSTest(unittest.TestCase):
         ret = lms_test._do_chain_rule(fwd_op, bw_op, 1, 10)
         self.assertEqual(ret, (grad_op, 7))
 
+    @mock.patch('tensorflow_large_model_support.frames.FrameInfo'
+                '.get_context', return_value=())
+    @mock.patch('tensorflow_large_model_support.frames.FrameInfo'
+                '.get_frame', return_value=())
     @mock.patch('tensorflow.contrib.graph_editor.get_forward_walk_ops')
-    def test_do_direct_order(self, get_fwd_walk):
+    def test_do_direct_order(self, get_fwd_walk, get_frame,
+                             get_context):
         lms_test = lms.LMS({'s1'})
         lms_test._topo_sort = mock.Mock()
         # Mock get_order to return the "order" value from the mock op
@@ -752,5 +833,530 @@ class LMSTest(unittest.TestCase):
         ret = lms_test._do_direct_order(fw_op, src_op, 3, 100)
         self.assertEqual(ret, (expected_ret, 44))
 
+    def test_is_safe_ctrld_op(self):
+        with tf.Graph().as_default():
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            a = tf.nn.relu(x, name='a')
+            b = tf.nn.relu(a, name='b')
+            c = tf.nn.relu(b, name='c')
+            d = tf.add(a, c, name='d')
+        lms_test = lms.LMS({'s1'})
+        lms_test._topo_sort = lms.topos.TOPOS([x.op], set())
+        lms_test._topo_sort.build()
+        lms_test._verifier = lms.verify.EditVerifier(lms_test._topo_sort)
+        self.assertTrue(lms_test._is_safe_ctrld_op(b.op, [d.op]))
+        # c runs after b
+        self.assertFalse(lms_test._is_safe_ctrld_op(c.op, [b.op]))
+
+        self.assertTrue(lms_test._is_valid_swapin_ctrld_op(b.op, a.op, d.op))
+        with mock.patch('tensorflow_large_model_support.verify.reaches',
+                        return_value=True):
+            self.assertFalse(lms_test._is_valid_swapin_ctrld_op(b.op, a.op,
+                                                                d.op))
+        self.assertEqual(lms_test.ctrld_rejections,
+                         {'candidates': 1, 'dropped': 0})
+
+    def test_select_ctrld_op(self):
+        lms_test = lms.LMS({'s1'})
+        lms_test._topo_sort = mock.Mock()
+        lms_test._topo_sort.get_order.side_effect = lambda x: x.order
+        lms_test._topo_sort.get_slack.side_effect = lambda x: x.slack
+        ops = []
+        for name, order, slack in [('d', 7, 0), ('c', 6, 2), ('b', 7, 2),
+                                   ('a', 6, 2)]:
+            op = mock.Mock(order=order, slack=slack)
+            op.name = name
+            ops.append(op)
+        # the largest slack, then the smallest order, then the name
+        self.assertIs(lms_test._select_ctrld_op(set(ops)), ops[3])
+        self.assertIs(lms_test._select_ctrld_op(set(ops[:3])), ops[1])
+        self.assertIs(lms_test._select_ctrld_op({ops[0]}), ops[0])
+
+    @mock.patch('tensorflow_large_model_support.frames.FrameInfo'
+                '.is_valid_ctrld_op', return_value=True)
+    @mock.patch('tensorflow_large_model_support.lms.LMS._do_direct_order')
+    @mock.patch('tensorflow.contrib.graph_editor.add_control_inputs')
+    def test_throttle_swapin(self, add_ctrl_input, direct_order, valid):
+        # Test chaining swap-ins beyond the limit
+        lms_test = lms.LMS({'s1'}, max_inflight_swapins=2)
+        ret = [lms_test._throttle_swapin('fw', 'bw', 'si%d' % i, 'ctrld', 10)
+               for i in range(5)]
+        self.assertEqual(ret, [('ctrld', 10)] * 5)
+        add_ctrl_input.assert_has_calls([mock.call('si2', 'si0'),
+                                         mock.call('si2', 'si1'),
+                                         mock.call('si3', 'si0'),
+                                         mock.call('si3', 'si1'),
+                                         mock.call('si4', 'si2'),
+                                         mock.call('si4', 'si3')])
+        self.assertEqual(add_ctrl_input.call_count, 6)
+        self.assertFalse(direct_order.called)
+
+        # Test limiting bytes
+        add_ctrl_input.reset_mock()
+        lms_test = lms.LMS({'s1'}, max_inflight_swapin_bytes=100)
+        sizes = {'si0': 60, 'si1': 60, 'si2': 30}
+        lms_test._plan.get_swapped_tensor = lambda x: x
+        with mock.patch('tensorflow_large_model_support.memory'
+                        '.get_tensor_size', side_effect=sizes.get):
+            for op in ['si0', 'si1', 'si2']:
+                lms_test._throttle_swapin('fw', 'bw', op, 'ctrld', 10)
+        add_ctrl_input.assert_has_calls([mock.call('si1', 'si0'),
+                                         mock.call('si2', 'si0')])
+        self.assertEqual(add_ctrl_input.call_count, 2)
+
+        # Test staggering swap-ins to earlier orders
+        add_ctrl_input.reset_mock()
+        lms_test = lms.LMS({'s1'}, max_inflight_swapins=1,
+                           swapin_throttle='stagger', ub=50)
+        lms_test._topo_sort = mock.Mock()
+        lms_test._topo_sort.get_order.return_value = 20
+        direct_order.side_effect = [('ctrld9', 9), ('ctrld8', 8)]
+        ret = [lms_test._throttle_swapin('fw', 'bw', 'si%d' % i, 'ctrld', 10)
+               for i in range(3)]
+        self.assertEqual(ret, [('ctrld', 10), ('ctrld9', 9), ('ctrld8', 8)])
+        direct_order.assert_has_calls([mock.call('fw', 'bw', 10, 50),
+                                       mock.call('fw', 'bw', 10, 50)])
+        self.assertFalse(add_ctrl_input.called)
+
+        # Test falling back to chaining when no earlier order is found
+        direct_order.side_effect = [(None, -1)]
+        ret = lms_test._throttle_swapin('fw', 'bw', 'si3', 'ctrld', 10)
+        self.assertEqual(ret, ('ctrld', 10))
+        add_ctrl_input.assert_called_once_with('si3', 'si0')
+
+    @mock.patch('tensorflow_large_model_support.frames.FrameInfo'
+                '.get_context', return_value=())
+    @mock.patch('tensorflow_large_model_support.frames.FrameInfo'
+                '.get_frame', return_value=())
+    @mock.patch('tensorflow.contrib.graph_editor.add_control_inputs')
+    @mock.patch('tensorflow_large_model_support.lms.util.get_consuming_ops')
+    def test_schedule_swapout(self, cons_ops, add_ctrl_input, get_frame,
+                              get_context):
+        ops = {}
+        for name in ['c1', 'c2', 'c3', 'n5', 'n6', 'grad', 'swapout']:
+            ops[name] = mock.Mock()
+            ops[name].name = name
+        orders = {'c1': 3, 'c2': 4, 'c3': 4, 'n5': 5, 'n6': 6, 'grad': 9}
+        levels = {4: {ops['c2'], ops['c3']}, 5: {ops['n5']},
+                  6: {ops['n6']}}
+        cons_ops.return_value = [ops['c1'], ops['c3'], ops['c2'],
+                                 ops['grad'], ops['swapout']]
+
+        # Test starting the swap-out after the last forward consumer
+        lms_test = lms.LMS({'s1'}, swapout_policy='after_last_consumer')
+        lms_test._grad_ops = {ops['grad']}
+        lms_test._topo_sort = mock.Mock()
+        lms_test._topo_sort.get_order.side_effect = lambda op: orders.get(
+            op.name, -1)
+        lms_test._topo_sort.get_ops.side_effect = lambda x: levels.get(
+            x, set())
+        lms_test._topo_sort.bw_starting_order = 6
+        lms_test._schedule_swapout('src', ops['swapout'], 'ts')
+        add_ctrl_input.assert_called_once_with(ops['swapout'], ops['c3'])
+
+        # Test spreading swap-outs over the window
+        add_ctrl_input.reset_mock()
+        lms_test._swapout_policy = lms.lms.SWAPOUT_Policy.SPREAD
+        for _ in range(3):
+            lms_test._schedule_swapout('src', ops['swapout'], 'ts')
+        # order 6 is in the backward phase
+        add_ctrl_input.assert_has_calls([
+            mock.call(ops['swapout'], ops['c3']),
+            mock.call(ops['swapout'], ops['n5']),
+            mock.call(ops['swapout'], ops['c3'])])
+        self.assertEqual(lms_test._swapout_load, {4: 2, 5: 1})
+
+        # Test no forward consumers
+        add_ctrl_input.reset_mock()
+        cons_ops.return_value = [ops['grad'], ops['swapout']]
+        lms_test._schedule_swapout('src', ops['swapout'], 'ts')
+        self.assertFalse(add_ctrl_input.called)
+
+    def test_reserve_host_memory(self):
+        mb = 1 << 20
+        lms_test = lms.LMS({'s1'}, host_mem_check='trim',
+                           host_mem_limit_mb=10, host_mem_headroom=1)
+        lms_test._host_load = [0] * 10
+        t1 = {'order': 1, 'nbytes': 6 * mb, 'swapout_ctrld_order': -1,
+              'swapins': [{'orders': [5]}, {'orders': [7, 8]}]}
+        self.assertTrue(lms_test._reserve_host_memory(t1))
+        # overlaps with t1
+        t2 = {'order': 2, 'nbytes': 6 * mb, 'swapins': [{'orders': [5]}]}
+        self.assertFalse(lms_test._reserve_host_memory(t2))
+        t2['nbytes'] = 4 * mb
+        self.assertTrue(lms_test._reserve_host_memory(t2))
+        # starts after t1 was swapped in
+        t3 = {'order': 8, 'nbytes': 6 * mb, 'swapins': [{'orders': [9]}]}
+        self.assertTrue(lms_test._reserve_host_memory(t3))
+        # not swapped in
+        self.assertTrue(lms_test._reserve_host_memory(
+            {'order': 0, 'nbytes': 20 * mb, 'swapins': []}))
+        self.assertEqual(lms_test._host_load,
+                         [0, 6 * mb, 10 * mb, 10 * mb, 10 * mb, 10 * mb,
+                          6 * mb, 6 * mb, 6 * mb, 6 * mb])
+
+        # the swap-out of t1 is scheduled later
+        lms_test._release_host_memory(t1)
+        t1['swapout_ctrld_order'] = 3
+        self.assertTrue(lms_test._reserve_host_memory(t1))
+        self.assertEqual(lms_test._host_load,
+                         [0, 0, 4 * mb, 10 * mb, 10 * mb, 10 * mb,
+                          6 * mb, 6 * mb, 6 * mb, 6 * mb])
+
+    @mock.patch('tensorflow.logging.warning')
+    @mock.patch('tensorflow_large_model_support.memory.estimate_host_memory')
+    def test_check_host_memory(self, estimate, warning):
+        estimate.return_value = {'peak_bytes': 0,
+                                 'device_peak_bytes': {},
+                                 'recommended_limit_mb': 20}
+        lms_test = lms.LMS({'s1'}, host_mem_check='warn',
+                           host_mem_limit_mb=10)
+        lms_test._check_host_memory()
+        self.assertTrue(warning.called)
+        self.assertEqual(lms_test.host_memory['recommended_limit_mb'], 20)
+
+        lms_test = lms.LMS({'s1'}, host_mem_check='error',
+                           host_mem_limit_mb=10)
+        self.assertRaises(ValueError, lms_test._check_host_memory)
+
+        warning.reset_mock()
+        lms_test = lms.LMS({'s1'}, host_mem_check='warn',
+                           host_mem_limit_mb=20)
+        lms_test._check_host_memory()
+        self.assertFalse(warning.called)
+
+    def test_host_mem_check_error(self):
+        graph = model_util.build_model()
+        ops_before = set(graph.get_operations())
+        lms_test = lms.LMS({'optimizer'}, graph=graph,
+                           host_mem_check='error', host_mem_limit_mb=0)
+        self.assertRaises(ValueError, lms_test.run)
+        # the graph is not edited
+        self.assertEqual(set(graph.get_operations()), ops_before)
+
+        # the graph is edited when the plan fits
+        lms_test = lms.LMS({'optimizer'}, graph=graph,
+                           host_mem_check='error')
+        added_ops = lms_test.run()
+        lms_full = lms.LMS({'optimizer'}, graph=model_util.build_model())
+        lms_full.run()
+        self.assertEqual(len(lms_test.plan), len(lms_full.plan))
+        self.assertEqual(set(graph.get_operations()) - ops_before, added_ops)
+
+        # a cached plan is checked before it is applied
+        graph = model_util.build_model()
+        ops_before = set(graph.get_operations())
+        lms_test = lms.LMS({'optimizer'}, graph=graph,
+                           host_mem_check='error', host_mem_limit_mb=0)
+        self.assertRaises(ValueError, lms_test.apply_plan, lms_full.plan)
+        self.assertEqual(set(graph.get_operations()), ops_before)
+
+    def test_host_mem_check_trim(self):
+        lms_full = lms.LMS({'optimizer'}, graph=model_util.build_model(),
+                           swapout_policy='after_last_consumer')
+        lms_full.run()
+        peak = lms_full.host_memory['peak_bytes']
+        lms_test = lms.LMS({'optimizer'}, graph=model_util.build_model(),
+                           swapout_policy='after_last_consumer',
+                           host_mem_check='trim', host_mem_headroom=1,
+                           host_mem_limit_mb=float(peak - 1) / (1 << 20))
+        lms_test.run()
+        self.assertTrue(0 < len(lms_test.plan) < len(lms_full.plan))
+        # the reservations match the reported estimate
+        self.assertEqual(max(lms_test._host_load),
+                         lms_test.host_memory['peak_bytes'])
+        self.assertLess(lms_test.host_memory['peak_bytes'], peak)
+
+    def test_apply_plan(self):
+        graph = model_util.build_model()
+        lms_test = lms.LMS({'optimizer'}, graph=graph)
+        lms_test.run()
+        self.assertTrue(len(lms_test.plan))
+
+        new_graph = model_util.build_model()
+        lms_apply = lms.LMS({'optimizer'})
+        added_ops = lms_apply.apply_plan(
+            plan.SwapPlan.from_json(lms_test.plan.to_json()), new_graph)
+        self.assertEqual(lms_apply.plan.to_dict(), lms_test.plan.to_dict())
+        self.assertEqual({op.name for op in added_ops},
+                         {op.name for op in graph.get_operations()
+                          if op.name.startswith('lms/')})
+        self.assertEqual(
+            [[t.name for t in op.inputs] +
+             [c.name for c in op.control_inputs]
+             for op in new_graph.get_operations()],
+            [[t.name for t in op.inputs] +
+             [c.name for c in op.control_inputs]
+             for op in graph.get_operations()])
+
+        # the plan does not match the graph
+        lms_apply = lms.LMS({'optimizer'})
+        with tf.Graph().as_default() as other_graph:
+            tf.placeholder(tf.float32, [2, 4], name='x')
+        self.assertRaises(ValueError, lms_apply.apply_plan, lms_test.plan,
+                          other_graph)
+
+    def test_already_edited(self):
+        graph = model_util.build_model()
+        lms.LMS({'optimizer'}, graph=graph).run()
+        n_ops = len(graph.get_operations())
+        # nothing is added to a graph edited before
+        self.assertEqual(lms.LMS({'optimizer'}, graph=graph).run(), set())
+        self.assertEqual(lms.LMS({'optimizer'}, graph=graph,
+                                 host_mem_check='error').run(), set())
+        lms_apply = lms.LMS({'optimizer'})
+        self.assertEqual(lms_apply.apply_plan(plan.SwapPlan(), graph), set())
+        self.assertEqual(len(graph.get_operations()), n_ops)
+
+    @mock.patch('tensorflow_large_model_support.lms.LMS.apply_plan')
+    @mock.patch('tensorflow_large_model_support.lms.LMS.run')
+    def test_run_cached(self, run, apply_plan):
+        lms.lms.clear_plan_cache()
+        graph = model_util.build_model()
+        lms.lms._run_cached(lms.LMS({'optimizer'}), graph, {'optimizer'},
+                            {'lb': 2})
+        self.assertEqual(run.call_count, 1)
+        self.assertFalse(apply_plan.called)
+
+        # the same model is built again
+        lms.lms._run_cached(lms.LMS({'optimizer'}), model_util.build_model(),
+                            {'optimizer'}, {'lb': 2})
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(apply_plan.call_count, 1)
+
+        # different parameters
+        lms.lms._run_cached(lms.LMS({'optimizer'}), model_util.build_model(),
+                            {'optimizer'}, {'lb': 3})
+        self.assertEqual(run.call_count, 2)
+        lms.lms.clear_plan_cache()
+
+    def test_priority_traversal(self):
+        def build_model():
+            graph = tf.Graph()
+            with graph.as_default():
+                h = tf.placeholder(tf.float32, [2, 4], name='x')
+                for i, n in enumerate([4, 64, 4, 4]):
+                    w = tf.Variable(tf.ones([h.shape[1].value, n]),
+                                    name='w%d' % i)
+                    h = tf.nn.relu(tf.matmul(h, w), name='relu%d' % i)
+                with tf.name_scope('optimizer'):
+                    tf.train.GradientDescentOptimizer(0.1).minimize(
+                        tf.reduce_sum(h))
+            return graph
+
+        lms_test = lms.LMS({'optimizer'}, graph=build_model(), n_tensors=1)
+        lms_test.run()
+        self.assertEqual([s['tensor'] for s in lms_test.plan.swaps],
+                         ['relu0:0'])
+
+        # the largest tensor with the longest lifetime is swapped first
+        lms_test = lms.LMS({'optimizer'}, graph=build_model(), n_tensors=1,
+                           traversal='priority')
+        lms_test.run()
+        self.assertEqual([s['tensor'] for s in lms_test.plan.swaps],
+                         ['relu1:0'])
+
+        lms_test = lms.LMS({'optimizer'}, graph=build_model(), n_tensors=2,
+                           traversal='priority',
+                           benefit_fn=lambda ts, nbytes, lifetime:
+                           lifetime if ts.op.type == 'Relu' else 0)
+        lms_test.run()
+        self.assertEqual([s['tensor'] for s in lms_test.plan.swaps],
+                         ['relu0:0', 'relu1:0'])
+
+    def test_incl_op_names(self):
+        lms_test = lms.LMS({'optimizer'}, graph=model_util.build_model(),
+                           incl_op_names={'Relu_1'})
+        lms_test.run()
+        self.assertEqual([s['tensor'] for s in lms_test.plan.swaps],
+                         ['Relu_1:0'])
+
+        lms_test = lms.LMS({'optimizer'}, graph=model_util.build_model(),
+                           incl_op_names={'missing'})
+        self.assertRaises(ValueError, lms_test.run)
+
+    def test_sparse_analysis(self):
+        lms_test = lms.LMS({'optimizer'}, graph=model_util.build_model())
+        lms_test.run()
+        lms_sparse = lms.LMS({'optimizer'}, graph=model_util.build_model(),
+                             sparse_analysis=True)
+        added_ops = lms_sparse.run()
+        self.assertEqual(lms_sparse.topo_sort.size, lms_test.topo_sort.size)
+        self.assertEqual(len(lms_sparse.plan), len(lms_test.plan))
+        self.assertTrue(added_ops)
+
+    def test_run_lazy(self):
+        lms_full = lms.LMS({'optimizer'}, graph=model_util.build_model())
+        lms_full.run()
+        # the swap-in trigger is ranked by slack as without n_tensors
+        lms_test = lms.LMS({'optimizer'}, graph=model_util.build_model(),
+                           n_tensors=1)
+        lms_test.run()
+        swap = lms_test.plan.swaps[0]
+        full_swap = [s for s in lms_full.plan.swaps
+                     if s['tensor'] == swap['tensor']][0]
+        self.assertEqual(
+            sorted((s['dest_ops'], s['ctrld_op']) for s in swap['swapins']),
+            sorted((s['dest_ops'], s['ctrld_op'])
+                   for s in full_swap['swapins']))
+
+        class OrderPolicy(policy.SwapPolicy):
+            def select_ctrld_op(self, ctrld_ops, trigger):
+                return min(ctrld_ops, key=lambda op: (
+                    trigger['topo_sort'].get_order(op), op.name))
+
+        # without slacks, the order is only assigned as far as needed
+        lms_test = lms.LMS({'optimizer'}, graph=model_util.build_model(),
+                           n_tensors=1, swap_policy=OrderPolicy())
+        with mock.patch.object(topos.TOPOS, '_complete') as complete:
+            lms_test.run()
+            self.assertEqual(len(lms_test.plan.swaps), 1)
+            self.assertFalse(complete.called)
+        # the sizes of the levels are filled in when the plan is exported
+        plan_dict = lms_test.plan.to_dict()
+        self.assertEqual(plan_dict['size'], lms_full.topo_sort.size)
+        self.assertEqual(plan_dict['bw_starting_order'],
+                         lms_full.topo_sort.bw_starting_order)
+        self.assertEqual(len(plan_dict['level_sizes']), plan_dict['size'])
+
+    def test_control_flow(self):
+        def body(i, h, w1):
+            a = tf.nn.relu(tf.matmul(h, w1), name='a')
+            b = tf.nn.relu(a * 0.5, name='b')
+            c = tf.nn.relu(b * 0.5, name='c')
+            # a skip connection inside the loop body
+            return i + 1, tf.nn.relu(c * 0.5, name='d') + a
+
+        def build_fn(batch_size, rng):
+            x = tf.placeholder(tf.float32, [batch_size, 8], name='x')
+            w0 = tf.Variable(tf.random_normal([8, 8], stddev=0.3), name='w0')
+            w1 = tf.Variable(tf.random_normal([8, 8], stddev=0.3), name='w1')
+            h = tf.nn.relu(tf.matmul(x, w0), name='relu0')
+            _, h = tf.while_loop(lambda i, h: i < 3,
+                                 lambda i, h: body(i, h, w1),
+                                 [tf.constant(0), h])
+            h = tf.cond(tf.reduce_sum(h) > 0, lambda: tf.nn.relu(h * 2.0),
+                        lambda: tf.nn.relu(-h))
+            h = tf.nn.relu(tf.matmul(h, w0), name='relu1')
+            loss = tf.reduce_sum(h * h)
+            with tf.name_scope('optimizer'):
+                optimizer = tf.train.GradientDescentOptimizer(0.01)
+                grads_and_vars = optimizer.compute_gradients(loss)
+                train_op = optimizer.apply_gradients(grads_and_vars)
+            images = rng.uniform(size=(batch_size, 8)).astype('float32')
+            return {'loss': loss,
+                    'gradients': [g for g, _ in grads_and_vars],
+                    'train_op': train_op, 'feed_dict': {x: images}}
+
+        for frame_aware in (False, True):
+            lms_args = {'lb': 1, 'swap_branches': True,
+                        'branch_threshold': 2, 'frame_aware': frame_aware}
+            result = harness.compare(build_fn, {'optimizer'}, steps=2,
+                                     lms_args=lms_args)
+            self.assertTrue(result['match'])
+            self.assertTrue(result['n_swapped'])
+
+            # the skip connection in the while loop is swapped in its frame
+            graph = tf.Graph()
+            with graph.as_default():
+                build_fn(2, np.random.RandomState(0))
+            lms_test = lms.LMS({'optimizer'}, graph=graph, **lms_args)
+            lms_test.run()
+            swaps = [swap for swap in lms_test.plan.swaps
+                     if swap['tensor'] == 'while/a:0']
+            self.assertEqual(len(swaps), 1)
+            frame_info = frames.FrameInfo()
+            frame = frame_info.get_frame(
+                graph.get_operation_by_name('while/a'))
+            self.assertTrue(frame)
+            swapin = swaps[0]['swapins'][0]
+            self.assertEqual(swapin['dest_ops'], ['while/add_1'])
+            for name in [swapin['swapin_op'], swapin['ctrld_op']]:
+                self.assertEqual(frame_info.get_frame(
+                    graph.get_operation_by_name(name)), frame)
+
+    def test_keras_layer_granularity(self):
+        with tf.Graph().as_default():
+            model = tf.keras.Sequential([
+                tf.keras.layers.Dense(16, input_shape=(8,), name='dense0'),
+                tf.keras.layers.BatchNormalization(name='bn'),
+                tf.keras.layers.Activation('relu', name='relu'),
+                tf.keras.layers.Dense(16, activation='relu', name='dense1'),
+                tf.keras.layers.Dense(4, name='dense2')])
+            model.compile(optimizer='sgd', loss='mse')
+            model._make_train_function()
+            names = lms.lms.get_layer_output_op_names(model)
+            self.assertIn('relu/Relu', names)
+            self.assertIn('dense1/Relu', names)
+            self.assertNotIn('dense1/BiasAdd', names)
+
+            callback = lms.LMSKerasCallback(layer_granularity=True,
+                                            plan_cache=False)
+            with mock.patch('tensorflow_large_model_support.lms.LMS',
+                            wraps=lms.LMS) as lms_cls:
+                callback.set_model(model)
+            kwargs = lms_cls.call_args[1]
+            self.assertEqual(kwargs['incl_op_names'], names)
+            self.assertEqual(kwargs['starting_op_names'], ['dense0_input'])
+            swapped = [op for op in tf.get_default_graph().get_operations()
+                       if op.name.startswith('lms/swapout')]
+            self.assertTrue(swapped)
+            self.assertTrue(all(op.inputs[0].op.name in names
+                                for op in swapped))
+
+    def test_run_inference(self):
+        self.assertRaises(ValueError, lms.LMS, None)
+        graph = tf.Graph()
+        with graph.as_default():
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            h = skip = tf.nn.relu(x, name='skip')
+            for i in range(4):
+                h = tf.nn.relu(h, name='h%d' % i)
+            out = tf.concat([h, skip], 1, name='out')
+        lms_test = lms.LMS(None, graph=graph, inference=True,
+                           branch_threshold=2)
+        lms_test.run()
+        swaps = lms_test.plan.swaps
+        self.assertEqual(len(swaps), 1)
+        self.assertEqual(swaps[0]['tensor'], 'skip:0')
+        self.assertEqual(swaps[0]['swapins'][0]['dest_ops'], ['out'])
+        self.assertEqual(swaps[0]['swapins'][0]['ctrld_op'], 'h2')
+        self.assertEqual(out.op.inputs[1].op.name, 'lms/swapin')
+
+        # the skip connection is not long enough
+        graph = tf.Graph()
+        with graph.as_default():
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            skip = tf.nn.relu(x, name='skip')
+            tf.concat([tf.nn.relu(skip), skip], 1, name='out')
+        lms_test = lms.LMS(None, graph=graph, inference=True,
+                           branch_threshold=2)
+        lms_test.run()
+        self.assertEqual(len(lms_test.plan), 0)
+
+    def test_spread_swapout_inference(self):
+        graph = tf.Graph()
+        with graph.as_default():
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            a = tf.nn.relu(x, name='a')
+            b = tf.nn.relu(x, name='b')
+            z_a = tf.add(tf.nn.relu(a, name='r_a'), a, name='z_a')
+            c_b = tf.add(tf.nn.relu(b, name='r_b'), b, name='c_b')
+            out = tf.add(z_a, c_b, name='out')
+        # a is swapped out first, so b is spread to the next order, where
+        # c_b reads the swap-in of b and would add a cycle
+        lms_test = lms.LMS(None, graph=graph, inference=True,
+                           branch_threshold=0, swapout_policy='spread',
+                           traversal='priority')
+        lms_test.run()
+        swaps = lms_test.plan.swaps
+        self.assertEqual([(s['tensor'], s['swapout_ctrld_op'])
+                          for s in swaps],
+                         [('a:0', 'r_a'), ('b:0', 'z_a')])
+        self.assertEqual(swaps[1]['swapins'][0]['dest_ops'], ['c_b'])
+        with tf.Session(graph=graph) as sess:
+            ret = sess.run(out, feed_dict={x: np.ones((2, 4))})
+        self.assertEqual(ret.tolist(), [[4.0] * 4] * 2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,110 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for memory estimation."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tensorflow as tf
+from tensorflow_large_model_support import memory
+from tensorflow_large_model_support import plan
+import unittest
+import mock
+
+
+class MemoryTest(unittest.TestCase):
+
+    def test_get_tensor_size(self):
+        with tf.Graph().as_default():
+            ts = tf.placeholder(tf.float32, [None, 3, 4])
+            self.assertEqual(memory.get_tensor_size(ts), 48)
+            self.assertEqual(memory.get_tensor_size(ts, unknown_dim_size=8),
+                             384)
+            ts = tf.placeholder(tf.float16, None)
+            self.assertEqual(memory.get_tensor_size(ts), 0)
+            ts = tf.placeholder(tf.int64, [])
+            self.assertEqual(memory.get_tensor_size(ts), 8)
+
+    def test_get_host_mem_limit_mb(self):
+        with mock.patch.dict(os.environ,
+                             {'TF_CUDA_HOST_MEM_LIMIT_IN_MB': '1024'}):
+            self.assertEqual(memory.get_host_mem_limit_mb(), 1024)
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(memory.get_host_mem_limit_mb(),
+                             memory.DEFAULT_HOST_MEM_LIMIT_MB)
+
+    def test_get_host_interval(self):
+        swap = {'order': 2, 'swapout_ctrld_order': -1,
+                'swapins': [{'orders': [8]}, {'orders': [7, 9]}]}
+        self.assertEqual(memory.get_host_interval(swap), (2, 8))
+        swap['swapout_ctrld_order'] = 3
+        swap['swapins'] = []
+        self.assertEqual(memory.get_host_interval(swap), (3, 3))
+
+    def test_get_peak_bytes(self):
+        self.assertEqual(memory.get_peak_bytes([]), 0)
+        self.assertEqual(memory.get_peak_bytes([(0, 4, 10), (4, 6, 20),
+                                                (5, 8, 5), (7, 9, 40)]),
+                         45)
+
+    def test_estimate_host_memory(self):
+        swap_plan = plan.SwapPlan()
+        mb = 1 << 20
+        swap_plan.add_swapout('t0', 'op0', 'so0', 1, 4 * mb, '/gpu:0')
+        swap_plan.add_swapin('t0', 'si0', ['g0'], [9])
+        swap_plan.add_swapout('t1', 'op1', 'so1', 2, 2 * mb, '/gpu:0')
+        swap_plan.add_swapin('t1', 'si1', ['g1'], [8])
+        swap_plan.add_swapout('t2', 'op2', 'so2', 1, 2 * mb, '/gpu:1')
+        swap_plan.add_swapin('t2', 'si2', ['g2'], [3])
+        ret = memory.estimate_host_memory(swap_plan, headroom=1.5)
+        self.assertEqual(ret['peak_bytes'], 8 * mb)
+        self.assertEqual(ret['device_peak_bytes'],
+                         {'/gpu:0': 6 * mb, '/gpu:1': 2 * mb})
+        self.assertEqual(ret['recommended_limit_mb'], 12)
+
+    def test_estimate_device_memory(self):
+        with tf.Graph().as_default():
+            x = tf.placeholder(tf.float32, [4])
+            a = tf.tile(x, [4])
+            b = a[:4]
+            c = tf.tile(b, [16])
+            e = c[:4]
+            f = tf.nn.relu(e)
+            swapin = tf.identity(a, name='lms/swapin')
+            d = tf.reduce_sum(swapin)
+        levels = [x.op, a.op, b.op, c.op, e.op, f.op, d.op]
+        topo_sort = mock.Mock(size=len(levels))
+        topo_sort.get_ops.side_effect = lambda order: [levels[order]]
+        topo_sort.get_order.side_effect = (
+            lambda op: levels.index(op) if op in levels else -1)
+
+        swap_plan = plan.SwapPlan()
+        swap_plan.add_swapout(a.name, a.op.name, 'lms/swapout', 1, 64)
+        swap_plan.add_swapin(a.name, swapin.op.name, [d.op.name], [6])
+        ret = memory.estimate_device_memory(topo_sort, swap_plan)
+        # a, b and c are on the device at order 3 without swapping
+        self.assertEqual(ret['peak_bytes_without_lms'], 64 + 16 + 256)
+        self.assertEqual(ret['peak_bytes'], 16 + 256)
+
+        # the swap-in starts at its control dependency op
+        swap_plan.add_control_dependency(swapin.op.name, c.op.name, 3)
+        ret = memory.estimate_device_memory(topo_sort, swap_plan)
+        self.assertEqual(ret['peak_bytes'], 64 + 16 + 256)
+
+
+if __name__ == '__main__':
+    unittest.main()
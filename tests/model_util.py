@@ -0,0 +1,49 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Models shared by the tests."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+
+def build_model(n_layers=3, relu_name=None):
+    """Build a training graph of `n_layers` dense layers.
+
+    The graph has a placeholder `x` of shape [2, 4], variables `w0`, `w1`,
+    ... and an `optimizer` scope with the gradient descent update.
+
+    Args:
+      n_layers: the number of layers. Default `3`.
+      relu_name: a format string for the name of the relu of each layer,
+        e.g. 'relu%d'. Default `None` (the TensorFlow names).
+
+    Return:
+      A `tf.Graph`.
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        x = tf.placeholder(tf.float32, [2, 4], name='x')
+        h = x
+        for i in range(n_layers):
+            w = tf.Variable(tf.ones([4, 4]), name='w%d' % i)
+            name = None if relu_name is None else relu_name % i
+            h = tf.nn.relu(tf.matmul(h, w), name=name)
+        with tf.name_scope('optimizer'):
+            tf.train.GradientDescentOptimizer(0.1).minimize(
+                tf.reduce_sum(h))
+    return graph
@@ -0,0 +1,80 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for parallel planning."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import inspect
+
+import tensorflow as tf
+from tensorflow_large_model_support import lms
+from tensorflow_large_model_support import parallel
+import unittest
+import model_util
+
+
+def _swap_op_names(graph):
+    return {op.name for op in graph.get_operations()
+            if op.name.startswith('lms/')}
+
+
+class ParallelTest(unittest.TestCase):
+
+    def _check(self, graphs, lms_objs, n_tensors):
+        self.assertEqual(len(lms_objs), len(graphs))
+        for graph, lms_obj, n in zip(graphs, lms_objs, n_tensors):
+            self.assertEqual(len(lms_obj.plan), n)
+            self.assertEqual(
+                _swap_op_names(graph),
+                {name for swap in lms_obj.plan.swaps
+                 for name in [swap['swapout_op']] +
+                 [swapin['swapin_op'] for swapin in swap['swapins']]})
+            for op in graph.get_operations():
+                if op.name.startswith('lms/'):
+                    self.assertEqual(op.device, '/device:CPU:0')
+
+    def test_plan_graphs_threads(self):
+        graphs = [model_util.build_model(n) for n in range(2, 10)]
+        default_ops = len(tf.get_default_graph().get_operations())
+        n_tensors = [1 + i % 3 for i in range(len(graphs))]
+        lms_objs = parallel.plan_graphs(
+            graphs, {'optimizer'},
+            [{'n_tensors': n, 'lb': 2} for n in n_tensors], workers=4)
+        self._check(graphs, lms_objs, n_tensors)
+        # nothing is added to the default graph of this thread
+        self.assertEqual(len(tf.get_default_graph().get_operations()),
+                         default_ops)
+        self.assertRaises(ValueError, parallel.plan_graphs, graphs,
+                          {'optimizer'}, [{}])
+
+    def test_plan_graphs_processes(self):
+        graphs = [model_util.build_model(n) for n in range(2, 5)]
+        lms_objs = parallel.plan_graphs(graphs, {'optimizer'},
+                                        {'n_tensors': 2},
+                                        use_processes=True, workers=2)
+        self._check(graphs, lms_objs, [2, 2, 2])
+
+    def test_default_arguments_unchanged(self):
+        lms.LMS({'optimizer'}, excl_types={'Relu'})
+        spec = inspect.getfullargspec(lms.LMS.__init__)
+        defaults = dict(zip(spec.args[-len(spec.defaults):], spec.defaults))
+        self.assertEqual(defaults['excl_types'], set())
+        self.assertEqual(defaults['excl_scopes'], set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for SwapPlan."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+from tensorflow_large_model_support import plan
+import unittest
+import mock
+
+
+def _named(name):
+    ret = mock.Mock()
+    ret.name = name
+    return ret
+
+
+class SwapPlanTest(unittest.TestCase):
+
+    def _build_plan(self):
+        swap_plan = plan.SwapPlan()
+        swap_plan.size = 10
+        swap_plan.bw_starting_order = 5
+        swap_plan.level_sizes = [1] * 10
+        ts0 = _named('relu:0')
+        swapin1 = _named('lms/swapin')
+        swapin2 = _named('lms/swapin_1')
+        swap_plan.add_swapout(ts0, _named('relu'), _named('lms/swapout'), 2,
+                               4096, '/gpu:0')
+        swap_plan.add_swapout_dependency(ts0, _named('relu_consumer'), 3)
+        swap_plan.add_swapin(ts0, swapin1, [_named('grad1')], [8])
+        swap_plan.add_swapin(ts0, swapin2,
+                             [_named('grad2'), _named('grad3')], [7, 9])
+        swap_plan.add_control_dependency(swapin1, _named('grad0'), 6)
+        swap_plan.add_swapin_dependency(swapin2, swapin1)
+        # unknown swap-in ops are ignored
+        swap_plan.add_control_dependency(_named('other'), _named('grad0'), 6)
+        return swap_plan
+
+    def test_to_dict(self):
+        swap_plan = self._build_plan()
+        self.assertEqual(len(swap_plan), 1)
+        ret = swap_plan.to_dict()
+        self.assertEqual(ret['size'], 10)
+        self.assertEqual(ret['bw_starting_order'], 5)
+        self.assertEqual(ret['swaps'],
+                         [{'tensor': 'relu:0',
+                           'src_op': 'relu',
+                           'swapout_op': 'lms/swapout',
+                           'order': 2,
+                           'nbytes': 4096,
+                           'device': '/gpu:0',
+                           'swapout_ctrld_op': 'relu_consumer',
+                           'swapout_ctrld_order': 3,
+                           'swapins': [{'swapin_op': 'lms/swapin',
+                                        'dest_ops': ['grad1'],
+                                        'orders': [8],
+                                        'ctrld_op': 'grad0',
+                                        'ctrld_order': 6,
+                                        'after': []},
+                                       {'swapin_op': 'lms/swapin_1',
+                                        'dest_ops': ['grad2', 'grad3'],
+                                        'orders': [7, 9],
+                                        'ctrld_op': None,
+                                        'ctrld_order': -1,
+                                        'after': ['lms/swapin']}]}])
+
+    def test_json_round_trip(self):
+        swap_plan = self._build_plan()
+        ret = plan.SwapPlan.from_json(swap_plan.to_json())
+        self.assertEqual(ret.to_dict(), swap_plan.to_dict())
+
+
+    def _build_graph(self, units):
+        graph = tf.Graph()
+        with graph.as_default():
+            x = tf.placeholder(tf.float32, [None, 4], name='x')
+            w = tf.Variable(tf.ones([4, units]), name='w')
+            tf.nn.relu(tf.matmul(x, w))
+        return graph
+
+    def test_make_cache_key(self):
+        key = plan.make_cache_key(self._build_graph(3), {'opt'},
+                                  {'lb': 1, 'excl_types': {'A', 'B', 'C'}})
+        # identical graph and parameters
+        self.assertEqual(plan.make_cache_key(
+            self._build_graph(3), {'opt'},
+            {'excl_types': {'C', 'B', 'A'}, 'lb': 1}), key)
+        # different shapes
+        self.assertNotEqual(plan.make_cache_key(
+            self._build_graph(5), {'opt'},
+            {'lb': 1, 'excl_types': {'A', 'B', 'C'}}), key)
+        # different parameters
+        self.assertNotEqual(plan.make_cache_key(
+            self._build_graph(3), {'opt'},
+            {'lb': 2, 'excl_types': {'A', 'B', 'C'}}), key)
+
+    def test_plan_cache(self):
+        cache = plan.PlanCache()
+        self.assertIsNone(cache.get('key'))
+        swap_plan = self._build_plan()
+        cache.put('key', swap_plan)
+        self.assertEqual(len(cache), 1)
+        ret = cache.get('key')
+        self.assertIsNot(ret, swap_plan)
+        self.assertEqual(ret.to_dict(), swap_plan.to_dict())
+        cache.clear()
+        self.assertIsNone(cache.get('key'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the swap policies."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import mock
+from tensorflow_large_model_support import lms
+from tensorflow_large_model_support import policy
+import unittest
+import model_util
+
+
+class _EarliestPolicy(policy.SwapPolicy):
+    """Swap in for the first backward consumer only, triggered by the
+    candidate with the smallest order."""
+
+    def select_dest_ops(self, candidate):
+        bw_orders = {op: order for op, order in candidate['consumers'].items()
+                     if op in candidate['bw_consumers']}
+        if not bw_orders:
+            return set()
+        return {min(bw_orders, key=lambda op: (bw_orders[op], op.name))}
+
+    def select_ctrld_op(self, ctrld_ops, trigger):
+        return min(ctrld_ops, key=lambda op: (
+            trigger['topo_sort'].get_order(op), op.name))
+
+
+class PolicyTest(unittest.TestCase):
+
+    def test_get_branch_ops(self):
+        orders = {'f1': 1, 'f2': 2, 'f3': 3, 'f4': 4, 'f5': 5, 'f6': 6}
+        self.assertEqual(policy.get_branch_ops(orders, 3), {'f5', 'f6'})
+        self.assertEqual(policy.get_branch_ops(orders), set(orders) - {'f1'})
+        self.assertEqual(policy.get_branch_ops({}), set())
+
+    def test_select_dest_ops(self):
+        candidate = {'consumers': {'f1': 1, 'f2': 5, 'b1': 9},
+                     'bw_consumers': {'b1'}, 'inference': False}
+        self.assertEqual(policy.SwapPolicy().select_dest_ops(candidate),
+                         {'b1'})
+        swap_policy = policy.SwapPolicy(swap_branches=True,
+                                        branch_threshold=2)
+        self.assertEqual(swap_policy.select_dest_ops(candidate),
+                         {'b1', 'f2'})
+        candidate['inference'] = True
+        self.assertEqual(policy.SwapPolicy(branch_threshold=5)
+                         .select_dest_ops(candidate), {'b1'})
+
+    def test_get_prefetch_distance(self):
+        ts0 = mock.Mock()
+        ts0.name = 'a:0'
+        swap_policy = policy.SwapPolicy(lb=3,
+                                        prefetch_distances={'a:0': 7})
+        self.assertEqual(swap_policy.get_prefetch_distance(
+            {'tensor': ts0}), 7)
+        self.assertEqual(swap_policy.get_prefetch_distance(
+            {'tensor': None}), 3)
+
+    def test_custom_policy(self):
+        graph = model_util.build_model(n_layers=4)
+        lms_test = lms.LMS({'optimizer'}, graph=graph,
+                           swap_policy=_EarliestPolicy())
+        lms_test.run()
+        default_lms = lms.LMS({'optimizer'},
+                              graph=model_util.build_model(n_layers=4))
+        default_lms.run()
+        self.assertGreater(len(lms_test.plan), 0)
+        for swap in lms_test.plan.swaps:
+            self.assertEqual(len(swap['swapins']), 1)
+        self.assertLess(
+            sum(len(swap['swapins']) for swap in lms_test.plan.swaps),
+            sum(len(swap['swapins']) for swap in default_lms.plan.swaps))
+
+    def test_invalid_ctrld_op(self):
+        swap_policy = policy.SwapPolicy()
+        swap_policy.select_ctrld_op = mock.Mock(return_value=mock.Mock())
+        lms_test = lms.LMS({'optimizer'}, swap_policy=swap_policy)
+        lms_test._topo_sort = mock.Mock()
+        self.assertRaises(ValueError, lms_test._select_ctrld_op,
+                          {mock.Mock(), mock.Mock()})
+        self.assertIsNone(lms_test._select_ctrld_op(set()))
+
+        swap_policy.select_ctrld_op.return_value = None
+        self.assertIsNone(lms_test._select_ctrld_op({mock.Mock()}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for tf.function support."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.eager import context
+from tensorflow_large_model_support import tf_function
+import unittest
+
+
+class LMSFunctionTest(unittest.TestCase):
+
+    def _build_step(self):
+        ws = [tf.compat.v1.Variable(tf.ones([4, 4]) * (i + 1) * 0.1,
+                                    use_resource=True)
+              for i in range(3)]
+
+        @tf.function(input_signature=[tf.TensorSpec([2, 4], tf.float32)])
+        def step(x):
+            with tf.GradientTape() as tape:
+                h = x
+                for w in ws:
+                    h = tf.nn.relu(tf.matmul(h, w))
+                loss = tf.reduce_sum(h)
+            with tf.name_scope('gradient_tape'):
+                grads = tape.gradient(loss, ws)
+            for w, g in zip(ws, grads):
+                w.assign_sub(0.01 * g)
+            return {'loss': loss}
+        return ws, step
+
+    def _train(self, rewrite):
+        with tf.Graph().as_default():
+            ws, step = self._build_step()
+            if rewrite:
+                step = tf_function.rewrite(step)
+                self.assertTrue(len(step.lms_obj.plan))
+                self.assertTrue(any(op.name.startswith('lms/swapin')
+                                    for op in step.graph.get_operations()))
+            loss = step(tf.ones([2, 4]))['loss']
+            with tf.compat.v1.Session() as sess:
+                sess.run(tf.compat.v1.global_variables_initializer())
+                losses = [sess.run(loss) for _ in range(2)]
+                return losses, sess.run(ws)
+
+    def test_rewrite(self):
+        losses, ws = self._train(False)
+        lms_losses, lms_ws = self._train(True)
+        np.testing.assert_allclose(lms_losses, losses)
+        for w, lms_w in zip(ws, lms_ws):
+            np.testing.assert_allclose(lms_w, w)
+        # variables are updated by each step
+        self.assertNotEqual(losses[0], losses[1])
+
+    def _train_eager(self, rewrite):
+        ws, step = self._build_step()
+        if rewrite:
+            step = tf_function.rewrite(step)
+            self.assertTrue(len(step.lms_obj.plan))
+            # the swap ops are kept by the pruning of the edited graph
+            self.assertTrue(any(
+                op.name.startswith('lms/swapin')
+                for op in step._function.graph.get_operations()))
+        losses = [step(tf.ones([2, 4]))['loss'].numpy() for _ in range(2)]
+        return losses, [w.numpy() for w in ws]
+
+    def test_rewrite_eager(self):
+        # TF 2 executes eagerly by default, TF 1 inside eager_mode
+        with context.eager_mode():
+            self.assertTrue(tf.executing_eagerly())
+            losses, ws = self._train_eager(False)
+            lms_losses, lms_ws = self._train_eager(True)
+        np.testing.assert_allclose(lms_losses, losses)
+        for w, lms_w in zip(ws, lms_ws):
+            np.testing.assert_allclose(lms_w, w)
+        # the captured variables are updated by each step
+        self.assertNotEqual(losses[0], losses[1])
+
+    def test_input_signature_required(self):
+        self.assertRaises(ValueError, tf_function.rewrite, lambda x: x)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the Chrome trace export."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import six
+import tensorflow_large_model_support as lms
+from tensorflow_large_model_support import plan
+from tensorflow_large_model_support import timeline
+import unittest
+
+
+class TimelineTest(unittest.TestCase):
+
+    def _build_plan(self):
+        swap_plan = plan.SwapPlan()
+        swap_plan.size = 10
+        swap_plan.bw_starting_order = 5
+        swap_plan.level_sizes = [2] * 10
+        swap_plan.add_swapout('relu:0', 'relu', 'lms/swapout', 2)
+        swap_plan.add_swapin('relu:0', 'lms/swapin', ['grad1'], [8])
+        swap_plan.add_swapin('relu:0', 'lms/swapin_1', ['grad2'], [9])
+        swap_plan.add_control_dependency('lms/swapin', 'grad0', 6)
+        return swap_plan
+
+    def test_build_chrome_trace(self):
+        trace = timeline.build_chrome_trace(self._build_plan(),
+                                            level_duration=10)
+        events = trace['traceEvents']
+        levels = [e for e in events if e['pid'] == 0 and e['ph'] == 'X']
+        self.assertEqual(len(levels), 10)
+        self.assertEqual(levels[3]['ts'], 30)
+        self.assertEqual(levels[3]['args'], {'ops': 2})
+
+        swaps = [e for e in events if e['pid'] == 1 and e['ph'] != 'M']
+        by_name = {}
+        for e in swaps:
+            by_name.setdefault(e['name'], []).append(e)
+        self.assertEqual(by_name['swap-out'][0]['ts'], 20)
+        self.assertEqual(by_name['swap-out'][0]['dur'], 10)
+        swapins = sorted(by_name['swap-in'], key=lambda e: e['ts'])
+        # triggered by the control dependency op
+        self.assertEqual((swapins[0]['ts'], swapins[0]['dur']), (60, 20))
+        self.assertEqual(swapins[0]['args']['prefetch_distance'], 2)
+        # no control dependency op
+        self.assertEqual((swapins[1]['ts'], swapins[1]['dur']), (80, 10))
+        self.assertEqual(len(by_name['trigger']), 1)
+        self.assertEqual(by_name['trigger'][0]['ts'], 60)
+        # host residency until the last swap-in starts
+        self.assertEqual((by_name['host'][0]['ts'], by_name['host'][0]['dur']),
+                         (30, 50))
+        self.assertEqual(trace['otherData']['swapped_tensors'], 1)
+
+    def test_export_chrome_trace(self):
+        lms_test = lms.LMS({'s1'})
+        lms_test._plan = self._build_plan()
+        f = six.StringIO()
+        timeline.export_chrome_trace(lms_test, f)
+        trace = json.loads(f.getvalue())
+        self.assertEqual(trace,
+                         timeline.build_chrome_trace(self._build_plan()))
+
+
+if __name__ == '__main__':
+    unittest.main()
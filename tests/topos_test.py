@@ -19,7 +19,9 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import tensorflow as tf
 import tensorflow_large_model_support as lms
+from tensorflow_large_model_support import graph_matrix
 from tensorflow_large_model_support import topos
 import unittest
 import mock
@@ -28,23 +30,34 @@ import mock
 class TOPOSTest(unittest.TestCase):
 
     @mock.patch('toposort.toposort')
-    @mock.patch('tensorflow_large_model_support.topos.TOPOS._build_order_dict')
     @mock.patch('tensorflow_large_model_support.topos.TOPOS._reindex')
     @mock.patch('tensorflow_large_model_support.topos.TOPOS._clean_update_ops')
     @mock.patch('tensorflow_large_model_support.topos.TOPOS._clean_bw_ops')
     @mock.patch('tensorflow_large_model_support.topos.TOPOS._build_dependency_dict')
-    def test_build(self, build_dep, clean_bw, clean_update, reindex, build_order, tps):
-        grad_ops = {6, 7}
-        topsosort_return = [{1, 2, 3}, {4, 5}, {6, 7, 8, 9}, {10, 11, 12, 13}]
-        tps.return_value = iter(topsosort_return)
+    def test_build(self, build_dep, clean_bw, clean_update, reindex, tps):
+        consumers = {'a': ['c'], 'b': ['e'], 'c': ['g1'], 'd': ['g2'],
+                     'g1': ['e'], 'g2': ['e'], 'e': []}
+        ops = {name: mock.Mock(name=name, outputs=[mock.Mock()])
+               for name in consumers}
+        for name, op in ops.items():
+            op.outputs[0].consumers.return_value = [
+                ops[consumer] for consumer in consumers[name]]
+        grad_ops = {ops['g1'], ops['g2']}
+        tps.return_value = iter([{ops['a'], ops['b']}, {ops['c'], ops['d']},
+                                 grad_ops, {ops['e']}])
         topo_test = topos.TOPOS({}, grad_ops)
         topo_test.build()
         # tps.assert_called_once_with(build_dep.return_value)
         self.assertTrue(clean_bw.called)
         self.assertTrue(clean_update.called)
         self.assertTrue(reindex.called)
-        self.assertTrue(build_order.called)
         self.assertEqual(topo_test._bw_starting_order, 2)
+        self.assertEqual(topo_test.get_order(ops['d']), 1)
+        # b is only needed by e, so it can be delayed by 2 orders
+        self.assertEqual({name: topo_test.get_slack(op)
+                          for name, op in ops.items()},
+                         {'a': 0, 'b': 2, 'c': 0, 'd': 0, 'g1': 0, 'g2': 0,
+                          'e': 0})
 
     @mock.patch('tensorflow.contrib.graph_editor.util.get_consuming_ops')
     @mock.patch('tensorflow.contrib.graph_editor.util.get_generating_ops')
@@ -183,5 +196,121 @@ class TOPOSTest(unittest.TestCase):
         topo_test._bw_starting_order = 100
         self.assertEqual(topo_test.bw_starting_order, 100)
 
+    def test_build_forward_only(self):
+        with tf.Graph().as_default():
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            a = tf.nn.relu(x, name='a')
+            b = tf.nn.relu(a, name='b')
+            c = tf.add(a, b, name='c')
+            topo_test = topos.TOPOS([x.op], set())
+            topo_test.build()
+        self.assertEqual([topo_test.get_order(op)
+                          for op in [x.op, a.op, b.op, c.op]], [0, 1, 2, 3])
+        self.assertEqual(topo_test.size, 4)
+        self.assertEqual(topo_test.bw_starting_order, -1)
+
+    def test_get_slack(self):
+        with tf.Graph().as_default():
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            a = tf.nn.relu(x, name='a')
+            b = tf.nn.relu(a, name='b')
+            c = tf.nn.relu(x, name='c')
+            d = tf.add(b, c, name='d')
+            topo_test = topos.TOPOS([x.op], set())
+            topo_test.build()
+        # c can run at order 1 or 2 without delaying d
+        self.assertEqual([topo_test.get_slack(op)
+                          for op in [x.op, a.op, b.op, c.op, d.op]],
+                         [0, 0, 0, 1, 0])
+        self.assertEqual(topo_test.get_slack('asdf'), 0)
+
+    def test_build_while_loop(self):
+        with tf.Graph().as_default():
+            x = tf.placeholder(tf.float32, [2], name='x')
+            _, out = tf.while_loop(lambda i, s: i < 3,
+                                   lambda i, s: (i + 1, tf.nn.relu(s)),
+                                   [tf.constant(0), x])
+            b = tf.nn.relu(out, name='b')
+            topo_test = topos.TOPOS([x.op], set())
+            # back edges of the loop are ignored
+            topo_test.build()
+        self.assertGreater(topo_test.get_order(out.op),
+                           topo_test.get_order(x.op))
+        self.assertEqual(topo_test.get_order(b.op),
+                         topo_test.get_order(out.op) + 1)
+
+    def test_build_graph_matrix(self):
+        graph = tf.Graph()
+        with graph.as_default():
+            x = tf.placeholder(tf.float32, [2], name='x')
+            _, out = tf.while_loop(lambda i, s: i < 3,
+                                   lambda i, s: (i + 1, tf.nn.relu(s)),
+                                   [tf.constant(0), x])
+            h = tf.nn.relu(out, name='h')
+            w = tf.Variable(tf.ones([2]), name='w')
+            h = tf.add(h, w, name='add')
+            with tf.name_scope('optimizer'):
+                tf.train.GradientDescentOptimizer(0.1).minimize(
+                    tf.reduce_sum(h))
+        grad_ops = {op for op in graph.get_operations()
+                    if op.name.startswith('optimizer')}
+        seed_ops = [x.op, w.op]
+
+        expected = topos.TOPOS(seed_ops, grad_ops)
+        expected.build()
+        topo_test = topos.TOPOS(seed_ops, grad_ops,
+                                graph_matrix.GraphMatrix(graph))
+        topo_test.build()
+        self.assertEqual(topo_test.size, expected.size)
+        self.assertEqual(topo_test.bw_starting_order,
+                         expected.bw_starting_order)
+        for i in range(expected.size):
+            self.assertEqual(topo_test.get_ops(i), expected.get_ops(i))
+
+    def test_build_lazy(self):
+        graph = tf.Graph()
+        with graph.as_default():
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            h = x
+            for i in range(4):
+                w = tf.Variable(tf.ones([4, 4]), name='w%d' % i)
+                h = tf.nn.relu(tf.matmul(h, w), name='relu%d' % i)
+            with tf.name_scope('optimizer'):
+                tf.train.GradientDescentOptimizer(0.1).minimize(
+                    tf.reduce_sum(h))
+        grad_ops = {op for op in graph.get_operations()
+                    if op.name.startswith('optimizer')}
+        seed_ops = [x.op]
+
+        expected = topos.TOPOS(seed_ops, grad_ops)
+        expected.build()
+        topo_test = topos.TOPOS(seed_ops, grad_ops, lazy=True)
+        topo_test.build()
+        relu0 = graph.get_operation_by_name('relu0')
+        self.assertEqual(topo_test.get_order(relu0),
+                         expected.get_order(relu0))
+        # only the orders up to relu0 are assigned
+        self.assertEqual(len(topo_test._topo_sort),
+                         expected.get_order(relu0) + 1)
+        # ops that are not reachable from the seed ops have no order
+        self.assertEqual(topo_test.get_order(
+            graph.get_operation_by_name('w0/Assign')), -1)
+        self.assertEqual(len(topo_test._topo_sort),
+                         expected.get_order(relu0) + 1)
+        # slacks need the whole order
+        self.assertEqual(topo_test.get_slack(relu0),
+                         expected.get_slack(relu0))
+        self.assertEqual(len(topo_test._topo_sort), expected.size)
+
+        self.assertEqual(topo_test.bw_starting_order,
+                         expected.bw_starting_order)
+        self.assertEqual(topo_test.size, expected.size)
+        for i in range(expected.size):
+            self.assertEqual(topo_test.get_ops(i), expected.get_ops(i))
+        for op in graph.get_operations():
+            self.assertEqual(topo_test.get_order(op), expected.get_order(op))
+            self.assertEqual(topo_test.get_slack(op), expected.get_slack(op))
+
+
 if __name__ == '__main__':
     unittest.main()
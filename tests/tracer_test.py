@@ -0,0 +1,108 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for Tracer."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import six
+import tensorflow_large_model_support as lms
+from tensorflow_large_model_support import tracer
+import unittest
+import mock
+
+
+class TracerTest(unittest.TestCase):
+
+    def test_record_disabled(self):
+        tr = tracer.Tracer()
+        field = mock.Mock()
+        tr.record(tracer.SWAP_OUT, tensor=field)
+        self.assertEqual(len(tr), 0)
+        self.assertFalse(field.called)
+
+    def test_record_lazy(self):
+        tr = tracer.Tracer(enabled=True)
+        field = mock.Mock(return_value='ts:0')
+        tr.record(tracer.SWAP_OUT, tensor=field)
+        # fields are not evaluated until events are read
+        self.assertFalse(field.called)
+        events = tr.events()
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['kind'], tracer.SWAP_OUT)
+        self.assertEqual(events[0]['tensor'], 'ts:0')
+
+    def test_format(self):
+        tr = tracer.Tracer(enabled=True)
+        op1 = mock.NonCallableMock()
+        op1.name = 'op1'
+        op2 = mock.NonCallableMock()
+        op2.name = 'op2'
+        tr.record(tracer.SKIP, op=op1, ops={op2, op1}, order=3,
+                  reason='excluded', pair=(op1, None))
+        event = tr.events()[0]
+        self.assertEqual(event['op'], 'op1')
+        self.assertEqual(event['ops'], ['op1', 'op2'])
+        self.assertEqual(event['order'], 3)
+        self.assertEqual(event['reason'], 'excluded')
+        self.assertEqual(event['pair'], ['op1', None])
+
+    def test_ring_buffer(self):
+        tr = tracer.Tracer(enabled=True, capacity=3)
+        for i in range(5):
+            tr.record(tracer.SWAP_IN, order=i)
+        self.assertEqual(len(tr), 3)
+        self.assertEqual(tr.dropped, 2)
+        self.assertEqual([e['order'] for e in tr.events()], [2, 3, 4])
+        tr.clear()
+        self.assertEqual(len(tr), 0)
+        self.assertEqual(tr.dropped, 0)
+
+    def test_dump(self):
+        tr = tracer.Tracer(enabled=True)
+        tr.record(tracer.SWAP_OUT, order=1)
+        tr.record(tracer.CTRL_DEP, order=2)
+        f = six.StringIO()
+        tr.dump(f)
+        lines = f.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])['kind'], tracer.SWAP_OUT)
+        self.assertEqual(json.loads(lines[1])['order'], 2)
+
+    @mock.patch('tensorflow.logging.info')
+    def test_lms_log_info_lazy(self, log_info):
+        lms_test = lms.LMS({'s1'}, trace=True, trace_capacity=5)
+        self.assertTrue(lms_test.tracer.enabled)
+        arg = mock.Mock(return_value='value')
+        lms_test._log_info("debug {}", 1, arg)
+        self.assertFalse(arg.called)
+        self.assertFalse(log_info.called)
+
+        lms_test = lms.LMS({'s1'}, debug=True, debug_level=1)
+        self.assertFalse(lms_test.tracer.enabled)
+        lms_test._log_info("debug {}", 1, arg)
+        arg.assert_called_once_with()
+        log_info.assert_called_once_with("[LMS][1] debug value")
+
+        # messages without args are not formatted
+        log_info.reset_mock()
+        lms_test._log_info("{braces}")
+        log_info.assert_called_once_with("[LMS][0] {braces}")
+
+
+if __name__ == '__main__':
+    unittest.main()
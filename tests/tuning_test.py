@@ -0,0 +1,141 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the parameter sweep."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+from tensorflow_large_model_support import tuning
+import unittest
+import model_util
+import mock
+
+
+class TuningTest(unittest.TestCase):
+
+    def test_grid(self):
+        self.assertEqual(tuning.grid({'lb': [1, 2], 'n_tensors': [-1]}),
+                         [{'lb': 1, 'n_tensors': -1},
+                          {'lb': 2, 'n_tensors': -1}])
+        candidates = tuning.random_search({'lb': [1, 2, 3], 'ub': [5, 6]},
+                                          4, seed=0)
+        self.assertEqual(len(candidates), 4)
+        self.assertEqual(len({tuple(sorted(c.items()))
+                              for c in candidates}), 4)
+        self.assertEqual(len(tuning.random_search({'lb': [1, 2]}, 5)), 2)
+
+    def test_pareto_frontier(self):
+        results = [{'params': {'n': 0}, 'peak_bytes': 100, 'swap_bytes': 0},
+                   {'params': {'n': 1}, 'peak_bytes': 80, 'swap_bytes': 30},
+                   {'params': {'n': 2}, 'peak_bytes': 90, 'swap_bytes': 40},
+                   {'params': {'n': 3}, 'peak_bytes': 60, 'swap_bytes': 50},
+                   {'params': {'n': 4}, 'error': 'failed'}]
+        frontier = tuning.pareto_frontier(results)
+        self.assertEqual([r['params']['n'] for r in frontier], [3, 1, 0])
+        self.assertEqual(tuning.recommend(frontier)['params']['n'], 3)
+        self.assertEqual(tuning.recommend(frontier, 85)['params']['n'], 1)
+        self.assertEqual(tuning.recommend(frontier, 10)['params']['n'], 3)
+        self.assertIsNone(tuning.recommend([]))
+
+    def test_sweep(self):
+        graph = model_util.build_model(n_layers=4)
+        n_ops = len(graph.get_operations())
+        param_grid = {'n_tensors': [0, 1, -1], 'lb': [1, 3]}
+        ret = tuning.sweep(graph, {'optimizer'}, param_grid, processes=2,
+                           base_params={'batch_size': 2})
+        # the graph is planned on copies
+        self.assertEqual(len(graph.get_operations()), n_ops)
+        self.assertEqual(len(ret['results']), 6)
+        for result in ret['results']:
+            self.assertEqual(result['params']['batch_size'], 2)
+            self.assertNotIn('error', result)
+        disabled = [r for r in ret['results']
+                    if r['params']['n_tensors'] == 0]
+        self.assertTrue(all(r['swap_bytes'] == 0 for r in disabled))
+        self.assertTrue(ret['frontier'])
+        self.assertIn(ret['recommended'], ret['frontier'])
+
+        # without LMS, the peak is the one of the unedited graph
+        swapped = [r for r in ret['results']
+                   if r['params']['n_tensors'] == -1]
+        for result in disabled:
+            self.assertEqual(result['peak_bytes'],
+                             result['peak_bytes_without_lms'])
+            self.assertEqual(result['peak_bytes_without_lms'],
+                             swapped[0]['peak_bytes_without_lms'])
+
+        # planning in this process, once per combination
+        with mock.patch('tensorflow_large_model_support.tuning'
+                        '.plan_meta_graph',
+                        wraps=tuning.plan_meta_graph) as plan_meta_graph:
+            inline = tuning.sweep(graph, {'optimizer'}, param_grid,
+                                  processes=0, base_params={'batch_size': 2})
+            self.assertEqual(plan_meta_graph.call_count, 6)
+        self.assertEqual([(r['params'], r['n_swapped'])
+                          for r in inline['results']],
+                         [(r['params'], r['n_swapped'])
+                          for r in ret['results']])
+
+        # invalid parameters are reported
+        ret = tuning.sweep(graph, {'optimizer'},
+                           {'starting_scope': ['missing']}, processes=0)
+        self.assertIn('error', ret['results'][0])
+        self.assertIsNone(ret['recommended'])
+
+    def _build_batch(self, batch_size):
+        x = tf.placeholder(tf.float32, [batch_size, 64], name='x')
+        h = x
+        for i in range(4):
+            w = tf.Variable(tf.ones([64, 64]), name='w%d' % i)
+            h = tf.nn.relu(tf.matmul(h, w))
+        with tf.name_scope('optimizer'):
+            tf.train.GradientDescentOptimizer(0.1).minimize(
+                tf.reduce_sum(h))
+
+    def _peak_without_lms(self, batch_size):
+        graph = tf.Graph()
+        with graph.as_default():
+            self._build_batch(batch_size)
+        result = tuning.sweep(graph, {'optimizer'}, {}, processes=0,
+                              base_params={'n_tensors': 0})['results'][0]
+        self.assertEqual(result['swap_bytes'], 0)
+        return result['peak_bytes']
+
+    def test_find_max_config(self):
+        budget = self._peak_without_lms(37)
+        self.assertLess(budget, self._peak_without_lms(38))
+        ret = tuning.find_max_config(self._build_batch, budget,
+                                     {'optimizer'}, use_lms=False)
+        self.assertEqual(ret['value'], 37)
+        self.assertTrue(ret['fits'])
+        ret = tuning.find_max_config(self._build_batch, budget,
+                                     {'optimizer'}, high=20, use_lms=False)
+        self.assertEqual(ret['value'], 20)
+        self.assertIsNone(tuning.find_max_config(
+            self._build_batch, budget, {'optimizer'}, low=64,
+            use_lms=False))
+
+        ret = tuning.find_max_config(self._build_batch, budget,
+                                     {'optimizer'}, high=200,
+                                     param_grid={'lb': [1, 2]})
+        self.assertLessEqual(ret['peak_bytes'], budget)
+        self.assertIn(ret['params']['lb'], [1, 2])
+        self.assertEqual(ret['params']['batch_size'], ret['value'])
+
+
+if __name__ == '__main__':
+    unittest.main()
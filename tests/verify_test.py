@@ -0,0 +1,101 @@
+# (C) Copyright IBM Corp. 2018. All Rights Reserved.
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the LMS verify module."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+import tensorflow.contrib.graph_editor as ge
+from tensorflow_large_model_support import topos
+from tensorflow_large_model_support import verify
+import unittest
+
+
+class EditVerifierTest(unittest.TestCase):
+
+    def _build_graph(self):
+        graph = tf.Graph()
+        with graph.as_default():
+            x = tf.placeholder(tf.float32, [2, 4], name='x')
+            a = tf.nn.relu(x, name='a')
+            b = tf.nn.relu(a, name='b')
+            c = tf.nn.relu(b, name='c')
+            d = tf.add(a, c, name='d')
+        topo_sort = topos.TOPOS([x.op], set())
+        topo_sort.build()
+        return graph, topo_sort, [x.op, a.op, b.op, c.op, d.op]
+
+    def _swap(self, graph, ts0, dest_op):
+        with graph.as_default():
+            swapout = tf.identity(ts0, name='lms/swapout')
+            swapin = tf.identity(swapout, name='lms/swapin')
+        ge.reroute_ts(swapin, ts0, can_modify=[dest_op])
+        return swapout.op, swapin.op
+
+    def test_check_swap(self):
+        graph, topo_sort, (x, a, b, c, d) = self._build_graph()
+        verifier = verify.EditVerifier(topo_sort)
+        swapout, swapin = self._swap(graph, a.outputs[0], d)
+        verifier.check_swapout(a.outputs[0], swapout)
+        verifier.check_swapin(a.outputs[0], swapin, [d])
+        self.assertEqual(verifier.errors, [])
+        self.assertEqual(verifier.added_ops, {swapout, swapin})
+
+        # c still consumes b
+        verifier.check_swapin(b.outputs[0], swapin, [c])
+        self.assertEqual(len(verifier.errors), 2)
+        self.assertIn('does not read tensor b:0', verifier.errors[0])
+        self.assertIn('Operation c does not consume', verifier.errors[1])
+
+    def test_check_control_dependency(self):
+        graph, topo_sort, (x, a, b, c, d) = self._build_graph()
+        verifier = verify.EditVerifier(topo_sort)
+        swapout, swapin = self._swap(graph, a.outputs[0], d)
+        ge.add_control_inputs(swapin, b)
+        verifier.check_control_dependency(swapin, b)
+        self.assertEqual(verifier.errors, [])
+
+        # d depends on the swap-in
+        ge.add_control_inputs(swapin, d)
+        verifier.check_control_dependency(swapin, d)
+        self.assertEqual(len(verifier.errors), 1)
+        self.assertIn('adds a cycle', verifier.errors[0])
+
+    def test_reaches(self):
+        graph, topo_sort, (x, a, b, c, d) = self._build_graph()
+        self.assertTrue(verify.reaches(topo_sort, a, d))
+        self.assertFalse(verify.reaches(topo_sort, c, b))
+        # through a control dependency
+        ge.add_control_inputs(b, d)
+        self.assertTrue(verify.reaches(topo_sort, d, b))
+
+    def test_check_swapin_trigger(self):
+        graph, topo_sort, (x, a, b, c, d) = self._build_graph()
+        verifier = verify.EditVerifier(topo_sort)
+        swapout, swapin = self._swap(graph, a.outputs[0], d)
+        verifier.check_swapin_trigger(a, swapin, b, [d])
+        verifier.check_swapin_trigger(a, swapin, c, [d])
+        self.assertEqual(verifier.errors, [])
+        verifier.check_swapin_trigger(a, swapin, x, [d])
+        verifier.check_swapin_trigger(a, swapin, d, [d])
+        self.assertEqual(len(verifier.errors), 2)
+        self.assertIn('triggered by x (order 0)', verifier.errors[0])
+
+
+if __name__ == '__main__':
+    unittest.main()